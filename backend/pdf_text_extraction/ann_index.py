@@ -0,0 +1,200 @@
+import argparse
+import json
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger("rag.ann")
+
+# ===============================
+# CONFIG
+# ===============================
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+DEFAULT_INDEX_PATH = "embeddings_forqa_huggingface/faiss_index"
+REPORT_FILE = "ann_report.json"
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str = "flat", nlist: int = 256,
+                    pq_m: int = 16, pq_bits: int = 8, hnsw_m: int = 32,
+                    ef_construction: int = 80, train_sample: int = 50000,
+                    nprobe: int = 8, ef_search: int = 64, seed: int = 0):
+    """
+    builds an L2 FAISS index (same metric as LangChain's default IndexFlatL2) and adds
+    `vectors` in order, so row i keeps vector id i and index_to_docstore_id stays valid.
+
+      flat      exact search, what FAISS.from_texts produces
+      ivf_flat  inverted lists over nlist k-means cells, exact vectors in each cell
+      ivf_pq    same, vectors compressed to pq_m sub-quantizers x pq_bits bits
+      hnsw      graph index, hnsw_m links per node, no training needed
+
+    IVF quantizers are trained on at most `train_sample` randomly chosen vectors.
+    nprobe / ef_search are stored in the index file and used at query time.
+    small corpora get what they can train: fewer IVF cells, PQ codebooks cut to at most
+    n entries (pq_bits <= log2(n)), a flat index below 2 vectors
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if index_type.startswith("ivf") and n < 2:
+        logger.warning("%d vectors are too few to train %s, building a flat index", n, index_type)
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        # k-means needs a few dozen points per cell to be meaningful
+        nlist = max(1, min(nlist, n // 39 or 1))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dim}")
+            # each sub-quantizer is k-means with 2**pq_bits centroids, which needs that many points
+            if n < 2 ** pq_bits:
+                fitted = int(math.log2(n))
+                logger.warning("%d vectors are too few for %d-bit PQ codes, using %d bits", n, pq_bits, fitted)
+                pq_bits = fitted
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits)
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= train_sample else vectors[rng.choice(n, train_sample, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    apply_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+
+def apply_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """sets query-time knobs on IVF / HNSW indexes, no-op for flat"""
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def supports_remove(index) -> bool:
+    """
+    only a flat index renumbers its rows after remove_ids, like LangChain's FAISS.delete
+    does with index_to_docstore_id. IVF keeps the old ids (later adds would reuse them)
+    and HNSW graphs can't delete at all, so incremental updates of those need a rebuild
+    """
+    return index_type_of(index) == "flat"
+
+
+def index_type_of(index) -> str:
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def index_vectors(index) -> np.ndarray:
+    """all stored vectors (exact for flat/IVF-Flat/HNSW, decoded approximations for PQ)"""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def index_size_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+# ===============================
+# RECALL / LATENCY REPORT
+# ===============================
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return float(hits / max(1, (truth >= 0).sum()))
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, configs: List[Dict], k: int = 10) -> List[Dict]:
+    """
+    builds each config over `vectors` and compares it with exact (flat) search:
+    recall@k, mean per-query latency, build time and serialized size
+    """
+    flat = build_ann_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+
+    rows = []
+    for cfg in [{"index_type": "flat"}] + configs:
+        t0 = time.perf_counter()
+        index = build_ann_index(vectors, **cfg)
+        build_s = time.perf_counter() - t0
+
+        # one query at a time, like the API does
+        t0 = time.perf_counter()
+        found = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+        latency_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        rows.append({
+            **cfg,
+            f"recall@{k}": round(recall_at_k(truth, found), 4),
+            "latency_ms": round(latency_ms, 4),
+            "build_s": round(build_s, 3),
+            "size_mb": round(index_size_bytes(index) / 1e6, 3),
+        })
+    return rows
+
+
+def default_configs(nlist: int, pq_m: int) -> List[Dict]:
+    configs = []
+    for nprobe in (1, 4, 16, 64):
+        configs.append({"index_type": "ivf_flat", "nlist": nlist, "nprobe": nprobe})
+        configs.append({"index_type": "ivf_pq", "nlist": nlist, "pq_m": pq_m, "nprobe": nprobe})
+    for ef in (16, 64, 256):
+        configs.append({"index_type": "hnsw", "hnsw_m": 32, "ef_search": ef})
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k vs latency of ANN index types against the flat index")
+    parser.add_argument("--index-path", default=DEFAULT_INDEX_PATH, help="existing FAISS index folder to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead (e.g. to simulate a big corpus)")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--out", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        # clustered data, closer to real embeddings than uniform noise
+        centers = rng.normal(size=(max(1, args.synthetic // 1000), args.dim)).astype("float32")
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+        vectors += 0.3 * rng.normal(size=vectors.shape).astype("float32")
+    else:
+        vectors = index_vectors(faiss.read_index(f"{args.index_path}/index.faiss"))
+
+    # queries = perturbed corpus vectors (held-out questions would be better if you have them)
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    noise = rng.normal(size=(len(picks), vectors.shape[1])).astype("float32")
+    queries = vectors[picks] + 0.1 * noise * vectors.std()
+
+    rows = evaluate(vectors, queries, default_configs(args.nlist, args.pq_m), k=args.k)
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries")
+    for row in rows:
+        print(row)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"n_vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "results": rows}, f, indent=2)
+    print(f"✅ Report saved at {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """
+    key for the exact tier:
+    - lowercase, collapse whitespace
+    - ignore trailing punctuation ("what is X?" == "what is x")
+    """
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.rstrip("?!. ")
+
+
+class _Entry:
+    __slots__ = ("value", "vector", "created")
+
+    def __init__(self, value, vector, created):
+        self.value = value
+        self.vector = vector
+        self.created = created
+
+
+class AnswerCache:
+    """
+    two-level answer cache:
+      1. exact tier    - normalized query string -> answer (LRU)
+      2. semantic tier - reuse an answer when a new query embedding has cosine
+                         similarity >= similarity_threshold with a cached one
+
+    both tiers share the same entries, so max_entries / ttl_seconds bound the
+    whole cache. the server drops a collection's entries when a new version of its
+    index is swapped in (invalidate, hooked to CollectionRegistry.on_swap).
+
+    `scope` keeps answers apart that must not be shared (e.g. per collection + filter):
+    a lookup only ever hits entries stored with the same scope
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # stacked, L2-normalized vectors of the entries (rebuilt lazily)
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_scopes = None
+
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    # ---------- lookups ----------
+    def get_exact(self, query: str, scope: str = "") -> Optional[Any]:
+        """cheap string lookup, does not count a miss (the semantic tier may still hit)"""
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry.value
+
+    def get_semantic(self, query: str, vector, scope: str = "") -> Optional[Any]:
+        """exact tier first, then nearest cached embedding; counts a miss if neither hits"""
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry.value
+
+            hit_key = self._nearest(vector, scope)
+            if hit_key is not None:
+                self._entries.move_to_end(hit_key)
+                self.stats["semantic_hits"] += 1
+                return self._entries[hit_key].value
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query: str, vector, value: Any, scope: str = ""):
+        key = (scope, normalize_query(query))
+        vec = None
+        if vector is not None:
+            vec = np.asarray(vector, dtype="float32")
+            norm = np.linalg.norm(vec)
+            vec = vec / norm if norm > 0 else None
+        with self._lock:
+            self._entries[key] = _Entry(value, vec, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._matrix = None
+
+    def invalidate(self, scope_prefix: Optional[str] = None):
+        """drops everything, or only the entries whose scope starts with scope_prefix"""
+        with self._lock:
+            if scope_prefix is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0].startswith(scope_prefix)]:
+                    del self._entries[key]
+            self._matrix = None
+            self.stats["invalidations"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "similarity_threshold": self.similarity_threshold,
+            }
+
+    # ---------- internals (call with the lock held) ----------
+    def _live_entry(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds and time.monotonic() - entry.created > self.ttl_seconds:
+            del self._entries[key]
+            self._matrix = None
+            self.stats["expirations"] += 1
+            return None
+        return entry
+
+    def _nearest(self, vector, scope: str = "") -> Optional[Tuple[str, str]]:
+        if vector is None or not self._entries:
+            return None
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e.vector is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[k].vector for k in self._matrix_keys])
+            self._matrix_scopes = np.array([k[0] for k in self._matrix_keys], dtype=object)
+        if not self._matrix_keys:
+            return None
+
+        q = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return None
+        sims = self._matrix @ (q / norm)
+        sims[self._matrix_scopes != scope] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity_threshold:
+            return None
+        key = self._matrix_keys[best]
+        # the entry may have expired since the matrix was built
+        if self._live_entry(key) is None:
+            return None
+        return key
@@ -1,9 +1,36 @@
-from fastapi import FastAPI, Request
+import os
+import logging
+import time
+from collections import defaultdict
+from functools import partial
+from typing import List, Optional
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from transformers import pipeline
+from starlette.concurrency import run_in_threadpool
+
+from ann_index import apply_search_params
+from answer_cache import AnswerCache
+from batching import MicroBatcher
+from bm25_index import BM25Index
+from collection_registry import (DEFAULT_COLLECTION, CollectionRegistry, UnknownCollection,
+                                 collection_paths, list_collections)
+from context_builder import build_context
+from file_lock import require_file_lock
+from generation_policy import ExtractiveReader, apply_stop_sequences, generation_kwargs
+from ingest_pipeline import IMAGE_EXTENSIONS, embed_documents, ingest_document
+from ingest_queue import IngestQueue, QueueFull
+from metrics import (BATCH_BUCKETS, CONTENT_TYPE, REGISTRY, TOKEN_BUCKETS,
+                     StageTimer, format_server_timing)
+from model_registry import (LazyEmbeddings, get_embeddings, get_generator, lazy_generator,
+                            preload_for_fork, warmup)
+from reranking import Reranker
+from retrieval import batch_hybrid_search, batch_similarity_search, load_vectorstore
+from sharded_index import ShardedSearcher, ShardSetIndex
+from streaming import SSE_HEADERS, sse_event, stream_generate
+
+logger = logging.getLogger("rag")
 
 # --- FastAPI setup ---
 app = FastAPI()
@@ -18,8 +45,35 @@ app.add_middleware(
 )
 
 # --- Input schema ---
+class QueryFilter(BaseModel):
+    # chunks of these documents ("report.pdf" / "report.json" / "report"), overlapping these pages
+    sources: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
 class QueryRequest(BaseModel):
     query: str
+    collection: str = DEFAULT_COLLECTION
+    filter: Optional[QueryFilter] = None
+    # false: neither answered from nor stored in the answer cache (benchmark.py measures
+    # retrieval + generation this way)
+    use_cache: bool = True
+
+def filter_key(request: QueryRequest) -> str:
+    flt = request.filter
+    return "" if flt is None else f"{sorted(flt.sources or [])}:{flt.page_from}:{flt.page_to}"
+
+def cache_scope(request: QueryRequest, version: int) -> str:
+    """
+    answers are only shared between queries on the same collection with the same filter,
+    answered from the same index version: a batch that searched version N and finishes
+    generating after the swap to N+1 stores its answer where lookups on N+1 never look
+    """
+    return f"{request.collection}|v{version}|{filter_key(request)}"
+
+def current_scope(request: QueryRequest) -> str:
+    """the scope lookups use: the version of the collection's index being served now"""
+    return cache_scope(request, collections.manager(request.collection).current.version)
 
 # --- Small talk handling ---
 def is_small_talk(query: str) -> bool:
@@ -42,23 +96,357 @@ def chatbot_response(query: str):
     return None  # Not small talk
 
 # --- RAG setup ---
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-MiniLM-L3-v2")
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+# "torch" (fp32), "int8" (dynamic quantization) or "onnx" (ONNX Runtime), see inference_backends.py;
+# check a backend against fp32 first: python inference_backends.py --backend int8
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "torch")
+GENERATOR_BACKEND = os.getenv("RAG_GENERATOR_BACKEND", "torch")
+# models come from the shared registry and are loaded on first use. queries go straight to
+# the model: the embedding store (embedding_store.py) is for the offline builders, user
+# queries are mostly one-offs and the answer cache already catches repeats
+embeddings = LazyEmbeddings(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+
+def embed_queries(queries):
+    """one batched forward pass; these sentence-transformers models embed queries and documents alike"""
+    return embeddings.embed_documents(queries)
+
+# RAG_INDEX_MMAP=1 (default): the index file is memory-mapped read-only and chunk texts are
+# read from the SQLite docstore, so N workers share one copy through the page cache
+# and startup doesn't read the whole index
+INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "1") == "1"
+# BM25 over the same chunks (written by embeddings_huggingface.py); when present,
+# retrieval fuses lexical and vector rankings so exact terms (regulation numbers,
+# chemical names) are found without raising k
+USE_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+
+# RAG_SHARD_SEARCH=threads|processes: when the index was built with --shards N
+# (sharded_index.py), vector search fans out to the N shards in parallel (threads in this
+# process, or one local process per shard) and merges their top-k; "off" = full index
+SHARD_SEARCH = os.getenv("RAG_SHARD_SEARCH", "off")
+SHARD_THREADS = int(os.getenv("RAG_SHARD_THREADS", "1"))  # OpenMP threads per shard worker process
+
+def load_index(index_path):
+    # query-time knobs for IVF / HNSW indexes (ignored for the default flat index);
+    # unset = use the values saved in the index by embeddings_huggingface.py
+    search_params = {
+        "nprobe": int(os.environ["RAG_NPROBE"]) if "RAG_NPROBE" in os.environ else None,
+        "ef_search": int(os.environ["RAG_EF_SEARCH"]) if "RAG_EF_SEARCH" in os.environ else None,
+    }
+    bm25_path = os.path.join(index_path, "bm25.json")
+    bm25 = BM25Index.load(bm25_path) if USE_HYBRID and os.path.exists(bm25_path) else None
+    shards = None
+    if SHARD_SEARCH != "off":
+        # the vectors live in the shards: only the id map and docstore are loaded here
+        vectorstore = load_vectorstore(index_path, embeddings, mmap=INDEX_MMAP, read_index=False)
+        shards = ShardedSearcher.load(index_path, vectorstore, mode=SHARD_SEARCH, mmap=INDEX_MMAP,
+                                      threads_per_shard=SHARD_THREADS, **search_params)
+        if shards is not None:
+            vectorstore.index = ShardSetIndex(shards.manifest)
+            return vectorstore, bm25, shards
+    vectorstore = load_vectorstore(index_path, embeddings, mmap=INDEX_MMAP)
+    apply_search_params(vectorstore.index, **search_params)
+    return vectorstore, bm25, None
+
+# a rebuilt index (embeddings_huggingface.py) is picked up without a restart: the folder is
+# polled every RAG_INDEX_WATCH_S seconds (0 = only POST /admin/index/reload), the new
+# version is loaded in the background and swapped in, queries on the old one finish first.
+# every collection (collection_registry.py) has its own index, loaded on its first query;
+# the default one is loaded at startup
+collections = CollectionRegistry(load_index, check_interval=float(os.getenv("RAG_INDEX_WATCH_S", "10")))
+index_manager = collections.manager(DEFAULT_COLLECTION)
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
 
-vectorstore = FAISS.load_local(
-    "embeddings_forqa_huggingface/faiss_index",
-    embeddings,
-    allow_dangerous_deserialization=True
+GENERATOR_MODEL = "google/flan-t5-nano"
+GENERATOR_DEVICE = -1  # CPU, change to 0 if GPU available
+llm = lazy_generator(GENERATOR_MODEL, backend=GENERATOR_BACKEND, device=GENERATOR_DEVICE)
+
+# RAG_RERANK=1: retrieve RERANK_CANDIDATES chunks, rescore them with a cross-encoder and
+# keep the best RAG_RERANK_TOP_N scoring at least RAG_RERANK_MIN_SCORE (ms-marco logits)
+USE_RERANK = os.getenv("RAG_RERANK", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "8"))
+# skip reranking when the oldest request of a batch has already waited this long since it
+# was submitted (or reranking would take it past that)
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "1000"))
+reranker = Reranker(
+    os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+    top_n=int(os.getenv("RAG_RERANK_TOP_N", "3")),
+    min_score=float(os.environ["RAG_RERANK_MIN_SCORE"]) if "RAG_RERANK_MIN_SCORE" in os.environ else None,
+) if USE_RERANK else None
+
+# generation policy (generation_policy.py): greedy decoding, max_new_tokens picked per
+# question type and capped at RAG_MAX_NEW_TOKENS, stop strings for decoder-only models
+MAX_NEW_TOKENS = int(os.getenv("RAG_MAX_NEW_TOKENS", "300"))
+# RAG_EXTRACTIVE=1: factoid / definition questions are first tried with an extractive QA
+# reader; if it is at least RAG_EXTRACTIVE_MIN_SCORE sure of a span, that span is the answer
+USE_EXTRACTIVE = os.getenv("RAG_EXTRACTIVE", "0") == "1"
+extractive = ExtractiveReader(
+    os.getenv("RAG_EXTRACTIVE_MODEL", "deepset/roberta-base-squad2"),
+    min_score=float(os.getenv("RAG_EXTRACTIVE_MIN_SCORE", "0.5")),
+) if USE_EXTRACTIVE else None
+
+def load_models():
+    get_embeddings(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+    get_generator(GENERATOR_MODEL, backend=GENERATOR_BACKEND, device=GENERATOR_DEVICE)
+    if reranker is not None:
+        reranker.load()
+    if extractive is not None:
+        extractive.load()
+
+# RAG_PRELOAD=1: load the models at import time, before a pre-forking server
+# (gunicorn --preload -k uvicorn.workers.UvicornWorker app:app) forks its workers,
+# so all workers share one copy of the weights
+if os.getenv("RAG_PRELOAD", "0") == "1":
+    preload_for_fork(load_models)
+# RAG_WARMUP=1: load (if needed) and run every model once at startup instead of on the first query
+WARMUP = os.getenv("RAG_WARMUP", "0") == "1"
+
+# --- Batched RAG ---
+# concurrent queries are collected for up to BATCH_MAX_WAIT_MS and answered together:
+# one embedding call, one FAISS search, one batched generate on a worker thread
+BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("RAG_BATCH_MAX_WAIT_MS", "20"))
+BATCH_WORKERS = int(os.getenv("RAG_BATCH_WORKERS", "1"))
+TOP_K = 3
+HYBRID_CANDIDATES = 20  # per retriever, before fusion
+# flan-t5 reads at most 512 tokens; the context gets what the prompt template and
+# question leave over, capped at RAG_CONTEXT_TOKENS
+GENERATOR_MAX_INPUT_TOKENS = 512
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "400"))
+
+# --- Metrics ---
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent per pipeline stage (per batch for batched stages)", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_seconds", "End-to-end request latency (time to first byte for streams)", ["path", "status"])
+PROMPT_TOKENS = REGISTRY.histogram(
+    "rag_prompt_tokens", "Generator input tokens per prompt", buckets=TOKEN_BUCKETS)
+GENERATED_TOKENS = REGISTRY.histogram(
+    "rag_generated_tokens", "Generated tokens per answer", buckets=TOKEN_BUCKETS)
+BATCH_SIZE = REGISTRY.histogram(
+    "rag_batch_size", "Queries per micro-batch", buckets=BATCH_BUCKETS)
+ERRORS = REGISTRY.counter("rag_errors_total", "Requests that failed", ["path"])
+# opt-in Server-Timing header with the stage breakdown on every /query response
+TIMING_HEADERS = os.getenv("RAG_TIMING_HEADERS", "0") == "1"
+
+def count_tokens(text: str, add_special_tokens: bool = False) -> int:
+    return len(llm.tokenizer(text, add_special_tokens=add_special_tokens)["input_ids"])
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+    # the route template ("/collections/{name}"), not the raw path: one series per endpoint
+    # however many ids or junk URLs clients send
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    REQUEST_SECONDS.observe(elapsed, path=path, status=response.status_code)
+    if TIMING_HEADERS:
+        response.headers["X-Response-Time-Ms"] = f"{elapsed * 1000:.1f}"
+    return response
+
+# --- Answer cache ---
+# exact (normalized string) + semantic (cosine on the query embedding) tiers, scoped by
+# collection, index version and filter (cache_scope); a collection's entries are dropped
+# when a new index version is swapped in, answers of the old one finishing later are never hit
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("RAG_CACHE_TTL_S", "3600")),
+    similarity_threshold=float(os.getenv("RAG_CACHE_SIMILARITY", "0.95")),
 )
+collections.on_swap.append(lambda name, version: answer_cache.invalidate(scope_prefix=f"{name}|"))
+
+def build_prompt(user_query: str, context: str) -> str:
+    return f"""
+        Answer the following question using only the context below.
+        If the answer is not in the context, say you don't know.
+
+        Context: {context}
+
+        Question: {user_query}
+
+        Answer:
+        """
+
+def make_context(user_query: str, docs) -> str:
+    """
+    the retrieved chunks packed so the whole prompt, special tokens (flan-t5's EOS)
+    included, fits in GENERATOR_MAX_INPUT_TOKENS
+    """
+    texts = [doc.page_content for doc in docs]
+    budget = min(CONTEXT_MAX_TOKENS,
+                 GENERATOR_MAX_INPUT_TOKENS - count_tokens(build_prompt(user_query, ""), add_special_tokens=True))
+    context = build_context(user_query, texts, llm.tokenizer, budget)
+    # the context can still tokenize differently where it meets the template: check the real prompt
+    overflow = count_tokens(build_prompt(user_query, context), add_special_tokens=True) - GENERATOR_MAX_INPUT_TOKENS
+    if overflow > 0:
+        context = build_context(user_query, texts, llm.tokenizer, budget - overflow)
+    return context
+
+def generate_kwargs(questions):
+    # flan-t5 ends answers with EOS on its own, stop strings only matter for decoder-only models
+    tokenizer = None if llm.model.config.is_encoder_decoder else llm.tokenizer
+    return generation_kwargs(questions, tokenizer, cap=MAX_NEW_TOKENS)
+
+def try_extractive(questions, contexts):
+    """extractive answers (or None) per question; None for all when the reader is off"""
+    answers = [None] * len(questions)
+    if extractive is None:
+        return answers
+    picked = [j for j, q in enumerate(questions) if extractive.applies_to(q)]
+    found = extractive.answer_batch([questions[j] for j in picked], [contexts[j] for j in picked])
+    for j, answer in zip(picked, found):
+        answers[j] = answer
+    return answers
+
+def get_citations(docs):
+    return [
+        doc.metadata.get("source", "Unknown") if isinstance(doc.metadata, dict) else str(doc.metadata)
+        for doc in docs
+    ]
+
+def allowed_positions(index, flt: Optional[QueryFilter]):
+    """the index positions a filter leaves to search (None = no filter)"""
+    if flt is None:
+        return None
+    return index.metadata().select(flt.sources, flt.page_from, flt.page_to)
+
+def retrieve(requests, query_vectors, k=TOP_K):
+    """
+    top-k (Document, score) per query: hybrid if a BM25 index is loaded, else vector only.
+    each query only searches its collection, pre-filtered by its metadata filter;
+    queries with the same collection + filter are searched as one batch.
+    returns (hits per query, index version each query searched)
+    """
+    results = [None] * len(requests)
+    versions = [None] * len(requests)
+    groups = defaultdict(list)
+    for i, request in enumerate(requests):
+        groups[(request.collection, filter_key(request))].append(i)
+    for rows in groups.values():
+        first = requests[rows[0]]
+        queries = [requests[i].query for i in rows]
+        vectors = [query_vectors[i] for i in rows]
+        # the index version is held only while searching; the Documents are copies
+        with collections.manager(first.collection).acquire() as index:
+            allowed = allowed_positions(index, first.filter)
+            if index.bm25 is not None:
+                found = batch_hybrid_search(index.vectorstore, index.bm25, queries, vectors,
+                                            k=k, candidates=max(k, HYBRID_CANDIDATES), allowed=allowed,
+                                            searcher=index.shards)
+            else:
+                found = batch_similarity_search(index.vectorstore, vectors, k=k, allowed=allowed,
+                                                searcher=index.shards)
+        for i, hits in zip(rows, found):
+            results[i], versions[i] = hits, index.version
+    return results, versions
+
+def retrieve_and_rerank(requests, query_vectors, timer, started):
+    """
+    over-retrieves and reranks when enabled; falls back to the first TOP_K retrieved
+    chunks when the reranker would blow the latency budget counted from `started`
+    (perf_counter time the oldest of `requests` arrived).
+    returns (hits per query, index version each query searched) like retrieve()
+    """
+    with timer.stage("retrieve"):
+        hits_per_query, versions = retrieve(requests, query_vectors, k=RERANK_CANDIDATES if reranker else TOP_K)
+    if reranker is None:
+        return hits_per_query, versions
+    queries = [request.query for request in requests]
+
+    remaining = RERANK_BUDGET_MS / 1000 - (time.perf_counter() - started)
+    if not reranker.fits(sum(len(hits) for hits in hits_per_query), remaining):
+        reranker.skipped += 1
+        return [hits[:TOP_K] for hits in hits_per_query], versions
+    with timer.stage("rerank"):
+        return reranker.rerank_batch(queries, hits_per_query), versions
+
+def answer_batch(requests, arrived):
+    """
+    runs on the batcher's worker thread; arrived = when each request was submitted
+    returns one (result dict, stage timings) pair per QueryRequest; timings are for the whole batch
+    """
+    queries = [request.query for request in requests]
+    # None = this request skips the answer cache
+    scopes = [current_scope(request) if request.use_cache else None for request in requests]
+    timer = StageTimer(STAGE_SECONDS)
+    BATCH_SIZE.observe(len(queries))
+
+    with timer.stage("embed"):
+        query_vectors = embed_queries(queries)
+    with timer.stage("cache"):
+        answers = [answer_cache.get_semantic(q, v, scope) if scope is not None else None
+                   for q, v, scope in zip(queries, query_vectors, scopes)]
+
+    # only cache misses go through FAISS + generation
+    todo = [i for i, answer in enumerate(answers) if answer is None]
+    if todo:
+        hits_per_query, versions = retrieve_and_rerank([requests[i] for i in todo], [query_vectors[i] for i in todo],
+                                                       timer, min(arrived[i] for i in todo))
+        # answers are stored under the index version they were retrieved from (see cache_scope)
+        for i, version in zip(todo, versions):
+            if scopes[i] is not None:
+                scopes[i] = cache_scope(requests[i], version)
+
+        with timer.stage("prompt"):
+            contexts = [make_context(queries[i], [doc for doc, _ in hits]) for i, hits in zip(todo, hits_per_query)]
+
+        if extractive is not None:
+            with timer.stage("extract"):
+                extracted = try_extractive([queries[i] for i in todo], contexts)
+            for i, answer in zip(todo, extracted):
+                if answer is not None:
+                    answers[i] = {"answer": answer}
+                    if scopes[i] is not None:
+                        answer_cache.put(queries[i], query_vectors[i], answers[i], scopes[i])
+
+        # everything the extractive reader didn't answer is generated
+        gen = [(i, build_prompt(queries[i], ctx)) for i, ctx in zip(todo, contexts) if answers[i] is None]
+        if gen:
+            prompts = [prompt for _, prompt in gen]
+            with timer.stage("generate"):
+                responses = llm(prompts, batch_size=len(prompts), **generate_kwargs([queries[i] for i, _ in gen]))
 
-llm = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-nano",
-    device=-1  # CPU, change to 0 if GPU available
+            for (i, prompt), response in zip(gen, responses):
+                # the pipeline returns a dict per prompt (or a list of dicts on older versions)
+                if isinstance(response, list):
+                    response = response[0]
+                answers[i] = {"answer": apply_stop_sequences(response["generated_text"])}
+                if scopes[i] is not None:
+                    answer_cache.put(queries[i], query_vectors[i], answers[i], scopes[i])
+                PROMPT_TOKENS.observe(count_tokens(prompt))
+                GENERATED_TOKENS.observe(count_tokens(answers[i]["answer"]))
+
+    return [(answer, timer.timings) for answer in answers]
+
+batcher = MicroBatcher(
+    answer_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    num_workers=BATCH_WORKERS,
+    pass_arrival_times=True,
 )
 
+def load_and_warm_models():
+    load_models()
+    warmup()
+
+@app.on_event("startup")
+async def start_batcher():
+    if WARMUP:
+        await run_in_threadpool(load_and_warm_models)
+    await batcher.start()
+    collections.start_watching()
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    collections.stop_watching()
+    ingest_queue.shutdown()
+    await batcher.stop()
+
 # --- API endpoint ---
 @app.post("/query")
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, response: Response):
     try:
         user_query = request.query
 
@@ -67,32 +455,227 @@ async def query(request: QueryRequest):
         if small_talk_answer:
             return {"answer": small_talk_answer}
 
-        # --- Otherwise run RAG ---
-        results = vectorstore.similarity_search(user_query, k=3)
-        context = "\n\n".join([doc.page_content for doc in results])
-        citations = [
-            doc.metadata.get("source", "Unknown") if isinstance(doc.metadata, dict) else str(doc.metadata)
-            for doc in results
-        ]
+        # unknown collections fail here, not inside a shared batch (first use loads the index)
+        try:
+            await run_in_threadpool(collections.manager, request.collection)
+        except (UnknownCollection, ValueError):
+            return {"answer": f"⚠️ Unknown collection: {request.collection}", "sources": []}
 
-        prompt = f"""
-        Answer the following question using only the context below.
-        If the answer is not in the context, say you don't know.
+        # repeated questions skip the batcher entirely
+        cached = answer_cache.get_exact(user_query, current_scope(request)) if request.use_cache else None
+        if cached is not None:
+            return cached
 
-        Context: {context}
+        # --- Otherwise run RAG (batched, off the event loop) ---
+        answer, timings = await batcher.submit(request)
+        if TIMING_HEADERS:
+            response.headers["Server-Timing"] = format_server_timing(timings)
+        return answer
 
-        Question: {user_query}
+    except Exception as e:
+        ERRORS.inc(path="/query")
+        logger.exception("query failed")
+        return {"answer": f"⚠️ Error: {str(e)}", "sources": []}
 
-        Answer:
-        """
+def check_admin(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+def collection_manager(name):
+    try:
+        return collections.manager(name)
+    except (UnknownCollection, ValueError):
+        raise HTTPException(status_code=404, detail=f"unknown collection {name!r}")
 
-        response = llm(prompt, max_new_tokens=300)
-        final_answer = response[0]["generated_text"].strip()
+@app.get("/collections")
+async def collection_list():
+    loaded = collections.loaded()
+    return [{"name": name, "loaded": name in loaded} for name in list_collections()]
 
-        return {"answer": final_answer}
+@app.get("/admin/index")
+async def index_status(collection: str = DEFAULT_COLLECTION, x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    return (await run_in_threadpool(collection_manager, collection)).status()
 
+@app.post("/admin/index/reload")
+async def reload_index(force: bool = False, collection: str = DEFAULT_COLLECTION,
+                       x_admin_token: str = Header(None)):
+    # loads in a worker thread; queries keep being answered from the current version meanwhile
+    check_admin(x_admin_token)
+    manager = await run_in_threadpool(collection_manager, collection)
+    try:
+        return await run_in_threadpool(manager.reload, force)
     except Exception as e:
-        return {"answer": f"⚠️ Error: {str(e)}", "sources": []}
+        logger.exception("index reload failed")
+        raise HTTPException(status_code=500, detail=f"reload failed, still serving the old index: {e}")
+
+# --- Document uploads ---
+# uploaded files go to pdfs/ or images/ and through ingest_pipeline.py in separate,
+# niced processes with their own thread limits (so ingestion can't take the serving
+# path's cores); once embedded, the new index is swapped in like a reload
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "1"))
+INGEST_THREADS = int(os.getenv("RAG_INGEST_THREADS", "1"))  # per ingest process
+INGEST_QUEUE_SIZE = int(os.getenv("RAG_INGEST_QUEUE", "16"))
+INGEST_CHUNKER = os.getenv("RAG_INGEST_CHUNKER", "semantic")  # or "words"
+MAX_UPLOAD_BYTES = int(os.getenv("RAG_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_FOLDERS = {".pdf": "pdfs", **{ext: "images" for ext in IMAGE_EXTENSIONS}}  # collection_paths keys
+
+# several API workers (uvicorn/gunicorn read WEB_CONCURRENCY) each run their own ingest
+# queue: only the file lock keeps their index updates apart
+require_file_lock(int(os.getenv("WEB_CONCURRENCY", "1")), "API workers (WEB_CONCURRENCY)")
+
+ingest_queue = IngestQueue(
+    partial(ingest_document, chunk_method=INGEST_CHUNKER, ocr_threads=INGEST_THREADS),
+    embed_documents,
+    on_indexed=lambda job: collections.manager(job.collection).reload(),
+    max_workers=INGEST_WORKERS,
+    threads=INGEST_THREADS,
+    max_pending=INGEST_QUEUE_SIZE,
+)
+
+def save_upload(upload: UploadFile, path: str):
+    """copies the upload to path through a temp file, so the pipeline never reads half of it"""
+    size = 0
+    with open(path + ".part", "wb") as f:
+        for block in iter(lambda: upload.file.read(1 << 20), b""):
+            size += len(block)
+            if size > MAX_UPLOAD_BYTES:
+                break
+            f.write(block)
+    if size > MAX_UPLOAD_BYTES:
+        os.remove(path + ".part")
+        raise HTTPException(status_code=413, detail=f"file is larger than {MAX_UPLOAD_BYTES >> 20} MB")
+    os.replace(path + ".part", path)
+
+@app.post("/documents", status_code=202)
+async def upload_document(file: UploadFile = File(...), collection: str = Form(DEFAULT_COLLECTION),
+                          x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    filename = os.path.basename(file.filename or "")
+    kind = UPLOAD_FOLDERS.get(os.path.splitext(filename)[1].lower())
+    if kind is None:
+        raise HTTPException(status_code=400, detail=f"only {', '.join(UPLOAD_FOLDERS)} files can be ingested")
+    try:
+        folder = collection_paths(collection)[kind]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if ingest_queue.pending() >= ingest_queue.max_pending:
+        raise HTTPException(status_code=429, detail="ingest queue is full, try again later")
+
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    await run_in_threadpool(save_upload, file, path)
+    try:
+        job = ingest_queue.submit(filename, path, collection)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+@app.get("/documents/jobs")
+async def ingest_jobs(x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    return ingest_queue.jobs()
+
+@app.get("/documents/jobs/{job_id}")
+async def ingest_job(job_id: str, x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job.to_dict()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    # hit/miss counters, used to tune RAG_CACHE_SIMILARITY
+    return answer_cache.snapshot()
+
+def runtime_stats():
+    cache = answer_cache.snapshot()
+    yield "rag_cache_exact_hits_total", "counter", "Exact-match answer cache hits", cache["exact_hits"]
+    yield "rag_cache_semantic_hits_total", "counter", "Semantic answer cache hits", cache["semantic_hits"]
+    yield "rag_cache_misses_total", "counter", "Answer cache misses", cache["misses"]
+    yield "rag_cache_entries", "gauge", "Answers currently cached", cache["entries"]
+    yield "rag_batches_total", "counter", "Micro-batches run", batcher.batches_run
+    yield "rag_batched_queries_total", "counter", "Queries answered through micro-batches", batcher.items_run
+    yield "rag_index_version", "gauge", "Version of the index being served", index_manager.current.version
+    yield "rag_index_reloads_total", "counter", "Index versions swapped in", index_manager.reloads
+    yield "rag_index_failed_reloads_total", "counter", "Index reloads that failed", index_manager.failed_reloads
+    yield "rag_index_shards", "gauge", "Shards each vector search fans out to (0 = full index)", index_manager.status()["shards"]
+    yield "rag_ingest_pending", "gauge", "Uploaded documents queued or being ingested", ingest_queue.pending()
+    yield "rag_ingest_completed_total", "counter", "Uploaded documents added to the index", ingest_queue.completed
+    yield "rag_ingest_failed_total", "counter", "Uploaded documents that failed to ingest", ingest_queue.failed
+    if extractive is not None:
+        yield "rag_extractive_answers_total", "counter", "Questions answered by the extractive reader", extractive.hits
+        yield "rag_extractive_fallbacks_total", "counter", "Extractive tries that fell back to generation", extractive.misses
+    if reranker is not None:
+        yield "rag_rerank_runs_total", "counter", "Batches reranked with the cross-encoder", reranker.runs
+        yield "rag_rerank_skipped_total", "counter", "Batches that skipped reranking (latency budget)", reranker.skipped
+
+REGISTRY.register_collector(runtime_stats)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# --- Streaming endpoint (server-sent events) ---
+def stream_answer(request: QueryRequest):
+    """
+    sources are sent as soon as retrieval is done, then the answer token by token:
+      event: sources  data: {"sources": [...]}
+      event: token    data: {"text": "..."}
+      event: done     data: {}
+    """
+    started = time.perf_counter()  # the rerank budget counts from here, like a batched request's
+    user_query = request.query
+    try:
+        small_talk_answer = chatbot_response(user_query)
+        if small_talk_answer:
+            yield sse_event("token", {"text": small_talk_answer})
+            yield sse_event("done", {})
+            return
+
+        try:
+            collections.manager(request.collection)
+        except (UnknownCollection, ValueError):
+            yield sse_event("error", {"answer": f"⚠️ Unknown collection: {request.collection}"})
+            return
+
+        cached = answer_cache.get_exact(user_query, current_scope(request)) if request.use_cache else None
+        if cached is not None:
+            yield sse_event("token", {"text": cached["answer"]})
+            yield sse_event("done", {})
+            return
+
+        query_vectors = [embeddings.embed_query(user_query)]
+        hits = retrieve_and_rerank([request], query_vectors, StageTimer(STAGE_SECONDS), started)[0][0]
+        results = [doc for doc, _ in hits]
+        yield sse_event("sources", {"sources": get_citations(results)})
+
+        context = make_context(user_query, results)
+        extracted = try_extractive([user_query], [context])[0]
+        if extracted is not None:
+            yield sse_event("token", {"text": extracted})
+            yield sse_event("done", {})
+            return
+
+        for piece in stream_generate(llm, build_prompt(user_query, context), **generate_kwargs([user_query])):
+            yield sse_event("token", {"text": piece})
+        yield sse_event("done", {})
+
+    except Exception as e:
+        ERRORS.inc(path="/query/stream")
+        logger.exception("streaming query failed")
+        yield sse_event("error", {"answer": f"⚠️ Error: {str(e)}"})
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    # a plain generator is iterated in starlette's threadpool, so the event loop stays free
+    return StreamingResponse(
+        stream_answer(request),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 # --- Run server (port 5000) ---
 # Run with: uvicorn app:app --host 0.0.0.0 --port 5000 --reload
@@ -1,8 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from transformers import pipeline
+
+from generation_policy import generation_kwargs
+from model_registry import get_embeddings, get_generator
+from streaming import SSE_HEADERS, sse_event, stream_generate
 
 # Flask setup
 app = Flask(__name__)
@@ -26,18 +28,14 @@ def chatbot_response(query: str):
     return None   # if not small talk, return None so we run RAG
 
 # --- RAG setup ---
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1")
+embeddings = get_embeddings("sentence-transformers/multi-qa-mpnet-base-dot-v1")
 vectorstore = FAISS.load_local(
     "embeddings_forqa_huggingface/faiss_index",
     embeddings,
     allow_dangerous_deserialization=True
 )
 
-llm = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-base",
-    device=-1
-)
+llm = get_generator("google/flan-t5-base", device=-1)
 
 @app.route("/query", methods=["POST"])
 def query():
@@ -66,7 +64,8 @@ Question: {user_query}
 
 Answer:"""
 
-        response = llm(prompt, max_new_tokens=300)
+        # greedy, with a token budget that fits the question (see generation_policy.py)
+        response = llm(prompt, **generation_kwargs([user_query]))
         final_answer = response[0]["generated_text"].strip()
 
         return jsonify({"answer": final_answer, "sources": citations})
@@ -74,5 +73,42 @@ Answer:"""
     except Exception as e:
         return jsonify({"answer": f"⚠️ Error: {str(e)}", "sources": []})
 
+@app.route("/query/stream", methods=["POST"])
+def query_stream():
+    data = request.json or {}
+    user_query = data.get("query", "")
+
+    def generate():
+        try:
+            small_talk_answer = chatbot_response(user_query)
+            if small_talk_answer:
+                yield sse_event("token", {"text": small_talk_answer})
+                yield sse_event("done", {})
+                return
+
+            results = vectorstore.similarity_search(user_query, k=3)
+            citations = [doc.metadata.get("source", "Unknown") if isinstance(doc.metadata, dict) else str(doc.metadata) for doc in results]
+            # sources go out right after retrieval, before any generation
+            yield sse_event("sources", {"sources": citations})
+
+            context = "\n\n".join([doc.page_content for doc in results])
+            prompt = f"""Answer the following question using only the context below.
+If the answer is not in the context, say you don't know.
+
+Context:
+{context}
+
+Question: {user_query}
+
+Answer:"""
+            for piece in stream_generate(llm, prompt, **generation_kwargs([user_query])):
+                yield sse_event("token", {"text": piece})
+            yield sse_event("done", {})
+
+        except Exception as e:
+            yield sse_event("error", {"answer": f"⚠️ Error: {str(e)}"})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+
+class MicroBatcher:
+    """
+    collects concurrent requests over a short window and runs them as one batch
+    on a worker thread, then fans the results back out to the awaiting callers.
+
+    batch_fn(items) must be a plain (blocking) function that returns one result
+    per item, in the same order. with pass_arrival_times it is called as
+    batch_fn(items, arrived): the time.perf_counter() at which each item was submitted,
+    for deadlines that count from a request's arrival, not from when its batch started
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 20.0,
+                 num_workers: int = 1, pass_arrival_times: bool = False):
+        self.batch_fn = batch_fn
+        self.pass_arrival_times = pass_arrival_times
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.num_workers = max(1, num_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers,
+                                            thread_name_prefix="rag-batch")
+        self._queue = None
+        self._slots = None
+        self._task = None
+        self._inflight = set()
+        # simple counters, handy when tuning batch size / wait
+        self.batches_run = 0
+        self.items_run = 0
+
+    async def start(self):
+        """must be called from the running event loop (e.g. app startup)"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        # one slot per worker thread: while all workers are busy, new requests
+        # pile up in the queue and get picked up together as the next batch
+        self._slots = asyncio.Semaphore(self.num_workers)
+        self._task = asyncio.create_task(self._collect_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        # fail anything still waiting so callers don't hang forever
+        while not self._queue.empty():
+            _, fut, _ = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("batcher stopped"))
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, item: Any) -> Any:
+        if self._task is None:
+            raise RuntimeError("MicroBatcher.start() has not been called")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    # take whatever is already queued without waiting
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                self._slots.release()
+                raise
+
+            # drop callers that already gave up (client disconnects, timeouts)
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        loop = asyncio.get_running_loop()
+        items = [item for item, _, _ in batch]
+        args = (items, [arrived for _, _, arrived in batch]) if self.pass_arrival_times else (items,)
+        try:
+            results = await loop.run_in_executor(self._executor, self.batch_fn, *args)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"batch_fn returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut, _), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+            self.batches_run += 1
+            self.items_run += len(items)
+        finally:
+            self._slots.release()
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+# ===============================
+# CONFIG
+# ===============================
+PDF_FOLDER = "pdfs"
+RESULTS_DIR = "benchmarks"
+EMBED_MODEL = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
+DEFAULT_URL = "http://localhost:5000/query"
+DEFAULT_QUERIES = [
+    "What does the Missouri Department of Health say about water sampling?",
+    "How should lead samples be collected?",
+    "Who should I contact about the mass mailing?",
+    "What is the purpose of the sample report?",
+    "What are the testing requirements for public water systems?",
+]
+STAGES = ("ingest", "chunk", "embed", "index", "query")
+
+# metrics where a bigger number is better (everything else: smaller is better)
+HIGHER_IS_BETTER = ("pages_per_s", "chunks_per_s", "words_per_s", "vectors_per_s", "qps")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples_s):
+    if not samples_s:
+        return {}
+    ms = np.asarray(samples_s) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(ms, p)), 2) for p in (50, 95, 99)}
+
+
+# ===============================
+# STAGES
+# ===============================
+def bench_ingest(pdf_folder):
+    """text layer + OCR fallback, same code path as text_extract_with_ocr.py"""
+    from text_extract_with_ocr import OCR_WORKERS, extract_from_pdf
+
+    pdfs = sorted(f for f in os.listdir(pdf_folder) if f.endswith(".pdf"))
+    docs = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=OCR_WORKERS) as pool:
+        for filename in pdfs:
+            docs[filename] = extract_from_pdf(os.path.join(pdf_folder, filename), filename, pool)
+    elapsed = time.perf_counter() - t0
+    n_pages = sum(len(p) for p in docs.values())
+    return docs, {
+        "documents": len(pdfs),
+        "pages": n_pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(n_pages / elapsed, 2) if elapsed else None,
+    }
+
+
+def load_extracted(folder):
+    """page JSONs written by text_extract_with_ocr.py, for machines without poppler/tesseract"""
+    docs = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".json"):
+            with open(os.path.join(folder, filename), "r", encoding="utf-8") as f:
+                docs[filename] = json.load(f)
+    return docs
+
+
+def scale_corpus(docs, scale):
+    """synthetic bigger corpus: every document repeated `scale` times under new names"""
+    if scale <= 1:
+        return docs
+    scaled = {}
+    for copy in range(scale):
+        for name, pages in docs.items():
+            new_name = f"{os.path.splitext(name)[0]}-copy{copy}.pdf"
+            scaled[new_name] = [{**p, "doc_id": new_name} for p in pages]
+    return scaled
+
+
+def bench_chunk(docs):
+    """chunk_pages, so whichever CHUNK_UNIT the pipeline is configured with is what's timed"""
+    from chunks_pdfs import CHUNK_UNIT, TOKENIZER_MODEL, chunk_pages
+    from model_registry import get_tokenizer
+
+    if CHUNK_UNIT == "tokens":
+        get_tokenizer(TOKENIZER_MODEL)  # loaded once, not part of the timing
+    ordered = [sorted(pages, key=lambda p: p.get("page_number", 0)) for pages in docs.values()]
+    n_words = sum(len(p.get("content", "").split()) for pages in ordered for p in pages)
+    chunks = []
+    t0 = time.perf_counter()
+    for pages in ordered:
+        chunks.extend(c["content"] for c in chunk_pages(pages))
+    elapsed = time.perf_counter() - t0
+    return chunks, {
+        "unit": CHUNK_UNIT,
+        "chunks": len(chunks),
+        "words": n_words,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(len(chunks) / elapsed, 2) if elapsed else None,
+        "words_per_s": round(n_words / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_embed(texts, model_name, limit):
+    from model_registry import get_embeddings
+
+    embeddings = get_embeddings(model_name)
+    texts = texts[:limit] if limit else texts
+    embeddings.embed_documents(texts[:2])  # warm-up (lazy init, first-call overhead)
+    t0 = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype="float32")
+    elapsed = time.perf_counter() - t0
+    return vectors, {
+        "model": model_name,
+        "vectors": len(vectors),
+        "dim": int(vectors.shape[1]) if len(vectors) else None,
+        "seconds": round(elapsed, 3),
+        "vectors_per_s": round(len(vectors) / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_index(vectors, index_type):
+    from ann_index import build_ann_index, index_size_bytes
+
+    t0 = time.perf_counter()
+    index = build_ann_index(vectors, index_type)
+    build_s = time.perf_counter() - t0
+
+    queries = vectors[: min(100, len(vectors))]
+    t0 = time.perf_counter()
+    for q in queries:
+        index.search(q[None, :], 3)
+    search_s = time.perf_counter() - t0
+    return {
+        "index_type": index_type,
+        "vectors": int(index.ntotal),
+        "build_s": round(build_s, 4),
+        "size_mb": round(index_size_bytes(index) / 1e6, 3),
+        "search_ms": round(search_s * 1000 / max(1, len(queries)), 4),
+    }
+
+
+def _post(url, query, timeout, use_cache=False):
+    body = json.dumps({"query": query, "use_cache": use_cache}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        resp.read()
+    return time.perf_counter() - t0
+
+
+def cache_hits(url):
+    """answer cache hits so far, from the API's /cache/stats (None if it can't be read)"""
+    try:
+        with urllib.request.urlopen(urllib.parse.urljoin(url, "/cache/stats"), timeout=10) as resp:
+            stats = json.load(resp)
+        return stats["exact_hits"] + stats["semantic_hits"]
+    except Exception:
+        return None
+
+
+def bench_query(url, queries, concurrency_levels, requests_per_level, timeout, use_cache=False):
+    """
+    latency of the running API (start it first: uvicorn app:app --port 5000).
+    the questions repeat, so by default they bypass the answer cache and every request
+    goes through retrieval + generation; with use_cache the cache hit rate during the
+    level is reported next to the latencies
+    """
+    results = []
+    for concurrency in concurrency_levels:
+        jobs = [queries[i % len(queries)] for i in range(requests_per_level)]
+        latencies, errors = [], 0
+        hits_before = cache_hits(url)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for fut in [pool.submit(_post, url, q, timeout, use_cache) for q in jobs]:
+                try:
+                    latencies.append(fut.result())
+                except Exception:
+                    errors += 1
+        wall = time.perf_counter() - t0
+        hits_after = cache_hits(url)
+        hit_rate = None
+        if hits_before is not None and hits_after is not None and latencies:
+            hit_rate = round((hits_after - hits_before) / len(latencies), 3)
+        results.append({
+            "concurrency": concurrency,
+            "requests": len(jobs),
+            "errors": errors,
+            "use_cache": use_cache,
+            "cache_hit_rate": hit_rate,
+            "qps": round(len(latencies) / wall, 2) if wall else None,
+            **percentiles(latencies),
+        })
+        print(f"   concurrency {concurrency}: {results[-1]}")
+    return results
+
+
+# ===============================
+# REGRESSION GATE
+# ===============================
+def flatten(report, prefix=""):
+    """{"chunk": {"chunks_per_s": 3}} -> {"chunk.chunks_per_s": 3}; lists keyed by concurrency"""
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "concurrency" in item:
+                    flat.update(flatten(item, f"{name}.c{item['concurrency']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, max_regression):
+    """returns the metrics that got worse by more than max_regression (fraction)"""
+    base = flatten({**baseline["results"], "peak_rss_mb": baseline.get("peak_rss_mb")})
+    cur = flatten({**current["results"], "peak_rss_mb": current.get("peak_rss_mb")})
+    regressions = []
+    for name, old in base.items():
+        if name not in cur or not old:
+            continue
+        metric = name.rsplit(".", 1)[-1]
+        if metric.endswith(("_s", "_ms", "_mb")) or metric in HIGHER_IS_BETTER:
+            change = (cur[name] - old) / abs(old)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > max_regression:
+                regressions.append((name, old, cur[name], round(worse * 100, 1)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end RAG pipeline benchmark")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma separated subset of {STAGES}")
+    parser.add_argument("--pdf-folder", default=PDF_FOLDER)
+    parser.add_argument("--extracted-folder", help="skip ingestion and chunk these page JSONs (e.g. extracted_ocr_jsons)")
+    parser.add_argument("--scale", type=int, default=1, help="replicate the corpus N times (synthetic scale-up)")
+    parser.add_argument("--embed-model", default=EMBED_MODEL)
+    parser.add_argument("--embed-limit", type=int, default=0, help="embed at most N chunks (0 = all)")
+    parser.add_argument("--index-types", default="flat,hnsw,ivf_flat")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--queries-file", help="one question per line")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=50, help="requests per concurrency level")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="let queries hit the answer cache (default: bypass it, measure retrieval + generation)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", help=f"result JSON (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="fail if a metric is this much worse")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    # later stages need the output of earlier ones
+    need_vectors = "embed" in stages or "index" in stages
+    need_texts = need_vectors or "chunk" in stages
+    need_docs = need_texts or "ingest" in stages
+    results = {}
+
+    if need_docs:
+        if args.extracted_folder:
+            docs = load_extracted(args.extracted_folder)
+        else:
+            print("📄 ingest")
+            docs, results["ingest"] = bench_ingest(args.pdf_folder)
+        docs = scale_corpus(docs, args.scale)
+    if need_texts:
+        print("✂️  chunk")
+        texts, results["chunk"] = bench_chunk(docs)
+    if need_vectors:
+        print("🧮 embed")
+        vectors, results["embed"] = bench_embed(texts, args.embed_model, args.embed_limit)
+    if "index" in stages:
+        print("🗂️  index")
+        results["index"] = {t: bench_index(vectors, t) for t in args.index_types.split(",") if t}
+    if "query" in stages:
+        print(f"🔎 query → {args.url}")
+        queries = DEFAULT_QUERIES
+        if args.queries_file:
+            with open(args.queries_file, "r", encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        levels = [int(c) for c in args.concurrency.split(",") if c]
+        results["query"] = bench_query(args.url, queries, levels, args.requests, args.timeout, args.use_cache)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved at {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.max_regression)
+        for name, old, new, pct in regressions:
+            print(f"❌ {name}: {old} → {new} ({pct}% worse)")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ no regression above {args.max_regression:.0%} vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# keeps things like "40-cfr-141", "1.2" or "pb-210" together as one term
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the
+this to was were what when where which who why will with does do did can
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    small in-memory BM25 (Okapi) inverted index over the same chunks as the FAISS index;
+    documents are referred to by their docstore id so results can be fused with vector hits
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lens = np.zeros(0, dtype="float32")
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        self._positions = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, doc_ids: Sequence[str], texts: Iterable[str], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        raw = defaultdict(list)
+        lens = []
+        for doc_idx, text in enumerate(texts):
+            tf = Counter(tokenize(text))
+            lens.append(sum(tf.values()))
+            for term, count in tf.items():
+                raw[term].append((doc_idx, count))
+        index.doc_ids = list(doc_ids)
+        index.doc_lens = np.asarray(lens, dtype="float32")
+        index.postings = {
+            term: (np.array([d for d, _ in p], dtype=np.int32), np.array([c for _, c in p], dtype="float32"))
+            for term, p in raw.items()
+        }
+        index._compute_idf()
+        return index
+
+    def _compute_idf(self):
+        n = len(self.doc_ids)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in self.postings.items()
+        }
+
+    def positions(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """row numbers of doc_ids in this index (ids it doesn't have are skipped)"""
+        if self._positions is None:
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        return np.fromiter((self._positions[d] for d in doc_ids if d in self._positions), dtype=np.int64)
+
+    def search(self, query: str, k: int = 10, allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """top-k (doc_id, bm25 score), best first; only rows in `allowed` (see positions()) if given"""
+        if not self.doc_ids:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype="float32")
+        avgdl = float(self.doc_lens.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / avgdl)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tf = self.postings[term]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm[docs])
+        if allowed is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.doc_ids[i], float(scores[i])) for i in hits]
+
+    # ---------- persistence ----------
+    def save(self, path: str):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lens": self.doc_lens.tolist(),
+            "postings": {t: [d.tolist(), c.tolist()] for t, (d, c) in self.postings.items()},
+        }
+        # written aside and renamed, so a server reloading the index never reads half a file
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.doc_ids = data["doc_ids"]
+        index.doc_lens = np.asarray(data["doc_lens"], dtype="float32")
+        index.postings = {
+            t: (np.asarray(d, dtype=np.int32), np.asarray(c, dtype="float32"))
+            for t, (d, c) in data["postings"].items()
+        }
+        index._compute_idf()
+        return index
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    merges several best-first lists of ids: score(id) = sum(1 / (k + rank))
+    returns (id, fused score), best first
+    """
+    scores = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+def build_from_vectorstore(vectorstore) -> BM25Index:
+    """BM25 over exactly the chunks that are in a LangChain FAISS store"""
+    doc_ids = list(vectorstore.index_to_docstore_id.values())
+    texts = (vectorstore.docstore.search(i).page_content for i in doc_ids)
+    return BM25Index.build(doc_ids, texts)
@@ -1,14 +1,29 @@
 import os
 import json
 import re
-from typing import List, Dict
+import argparse
+from typing import List, Dict, Iterator, Tuple
+
+import numpy as np
+
+from corpus_store import CorpusStore
+from model_registry import get_tokenizer
 
 # ==== config ====
 INPUT_FOLDER = "extracted_ocr_jsons"   # your per-PDF page JSONs
 OUTPUT_FOLDER = "chunks_500words_pdfs"          # where we’ll write per-PDF chunk JSONs
+CHUNK_UNIT = "tokens"                  # "tokens" (embedding model tokens) or "words" (whitespace words)
 CHUNK_WORDS = 500                      # words per chunk
 OVERLAP_WORDS = 50                     # sliding-window overlap
 MIN_WORDS_TO_KEEP_LAST = 50            # drop tiny tail chunks (< this), or set to 0 to keep all
+# token windows: counted with the tokenizer of the model embeddings_huggingface.py embeds with,
+# and must fit its max_seq_length (512 for multi-qa-mpnet-base-dot-v1, 256 for all-MiniLM-L6-v2)
+# or the encoder silently drops the rest of the chunk. [CLS]/[SEP] are counted in CHUNK_TOKENS
+TOKENIZER_MODEL = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
+CHUNK_TOKENS = 384
+OVERLAP_TOKENS = 48
+MIN_TOKENS_TO_KEEP_LAST = 64
+READ_BLOCK_BYTES = 1 << 16             # streaming mode: page JSON is parsed in blocks of this size
 # ===============
 
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -60,47 +75,280 @@ def build_word_stream(pages: List[Dict]):
         page_map.extend([page_no] * len(tokens))
     return words, page_map
 
+def window_bounds(n: int, size: int, overlap: int, min_last: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    [start, end) of every sliding window over n units, all at once; windows keep sliding
+    until one that reaches the end is shorter than min_last
+    """
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.arange(0, n, max(1, size - overlap))
+    ends = np.minimum(starts + size, n)
+    keep = (ends < n) | (ends - starts >= min_last)
+    return starts[keep], ends[keep]
+
+def page_runs(page_map) -> Tuple[np.ndarray, np.ndarray]:
+    """first unit of every run of the same page, and that page (page_map is in page order)"""
+    pages = np.asarray(page_map)
+    firsts = np.concatenate([[0], np.flatnonzero(pages[1:] != pages[:-1]) + 1])
+    return firsts, pages[firsts]
+
+def window_pages(run_firsts: np.ndarray, run_pages: np.ndarray,
+                 starts: np.ndarray, ends: np.ndarray) -> List[List[int]]:
+    """pages covered by each window, from the page runs its first and last unit fall in"""
+    first = np.searchsorted(run_firsts, starts, side="right") - 1
+    last = np.searchsorted(run_firsts, ends - 1, side="right") - 1
+    return [run_pages[a:b + 1].tolist() for a, b in zip(first, last)]
+
 def make_chunks(words: List[str], page_map: List[int],
                 chunk_words: int, overlap_words: int):
     """
     sliding-window over the word stream
     returns list of dicts: each dict is a chunk with text + page metadata
     """
-    chunks = []
-    n = len(words)
+    starts, ends = window_bounds(len(words), chunk_words, overlap_words, MIN_WORDS_TO_KEEP_LAST)
+    if len(starts) == 0:
+        return []
+    page_sets = window_pages(*page_runs(page_map), starts, ends)
+    return [
+        {
+            "chunk_index": idx,
+            "content": " ".join(words[start:end]),
+            "n_words": int(end - start),
+            "pages": page_set,
+            "page_range": [page_set[0], page_set[-1]] if page_set else None
+        }
+        for idx, (start, end, page_set) in enumerate(zip(starts, ends, page_sets))
+    ]
+
+# ---------- token windows ----------
+def build_text_stream(pages: List[Dict]) -> Tuple[str, np.ndarray, np.ndarray]:
+    """
+    pages joined into one normalized text (single spaces between pages);
+    returns text, the offset where each page starts, and its page number
+    """
+    parts, page_starts, page_numbers = [], [], []
+    offset = 0
+    for i, p in enumerate(pages, start=1):
+        text = normalize_text(p.get("content", ""))
+        if not text:
+            continue
+        parts.append(text)
+        page_starts.append(offset)
+        page_numbers.append(p.get("page_number", i))
+        offset += len(text) + 1
+    return " ".join(parts), np.asarray(page_starts, dtype=np.int64), np.asarray(page_numbers)
+
+def token_offsets(text: str, tokenizer) -> np.ndarray:
+    """(n_tokens, 2) character spans of every token, one tokenizer call for the whole document"""
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                         return_attention_mask=False, verbose=False)
+    return np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+
+def token_windows(text: str, offsets: np.ndarray, size: int, overlap: int,
+                  min_last: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    [start, end) token windows of at most `size` tokens that start and end on word starts
+    and together cover every token: each window starts ~`overlap` tokens before the end of
+    the previous one, never after it. a tail window shorter than min_last is widened back
+    to `size` tokens instead of being dropped; a document shorter than that is one window.
+    only the window loop is Python (one step per chunk), word starts are found with NumPy
+    """
+    n = len(offsets)
     if n == 0:
-        return chunks
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    chars = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+    first_char = np.minimum(offsets[:, 0], len(chars) - 1)
+    before = chars[np.maximum(first_char - 1, 0)]
+    # a token starts a word after a space (or includes the space, e.g. sentencepiece "▁")
+    word_starts = np.flatnonzero((offsets[:, 0] == 0) | (before == ord(" ")) | (chars[first_char] == ord(" ")))
+    if len(word_starts) == 0 or word_starts[0] != 0:
+        word_starts = np.concatenate([[0], word_starts])
+    word_back = lambda i: int(word_starts[np.searchsorted(word_starts, i, side="right") - 1])
+    word_forward = lambda i: int(word_starts[min(np.searchsorted(word_starts, i, side="left"), len(word_starts) - 1)])
 
-    step = max(1, chunk_words - overlap_words)
+    starts, ends = [], []
     start = 0
-    idx = 0
-
-    while start < n:
-        end = min(start + chunk_words, n)
-        chunk_tokens = words[start:end]
-        # optionally drop tiny tail
-        if end == n and len(chunk_tokens) < MIN_WORDS_TO_KEEP_LAST:
+    while True:
+        end = min(start + size, n)
+        if end < n and word_back(end) > start:
+            end = word_back(end)  # else a single word longer than the window is cut
+        starts.append(start)
+        ends.append(end)
+        if end == n:
             break
+        following = word_back(end - overlap) if overlap > 0 else end
+        start = following if start < following <= end else end
 
-        # pages covered by this chunk
-        pages_in_chunk = page_map[start:end]
-        page_set = sorted(set(pages_in_chunk))
-        chunk_text = " ".join(chunk_tokens)
+    if len(starts) > 1 and ends[-1] - starts[-1] < min(min_last, size):
+        # still starts at or before the previous window's end, so nothing is skipped
+        starts[-1] = min(starts[-1], max(word_forward(n - size), n - size))
+    return np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
 
-        chunks.append({
+def make_token_chunks(pages: List[Dict], tokenizer, chunk_tokens: int, overlap_tokens: int):
+    """
+    sliding windows sized in the embedding model's tokens (special tokens included),
+    so nothing is truncated by the encoder; chunks have the same fields as make_chunks
+    with n_tokens instead of n_words
+    """
+    text, page_starts, page_numbers = build_text_stream(pages)
+    offsets = token_offsets(text, tokenizer)
+    size = chunk_tokens - tokenizer.num_special_tokens_to_add()
+    starts, ends = token_windows(text, offsets, size, min(overlap_tokens, size - 1), MIN_TOKENS_TO_KEEP_LAST)
+    if len(starts) == 0:
+        return []
+    # page of every token = last page starting at or before it
+    token_page = np.searchsorted(page_starts, offsets[:, 0], side="right") - 1
+    page_sets = [page_numbers[a:b + 1].tolist() for a, b in zip(token_page[starts], token_page[ends - 1])]
+    char_starts, char_ends = offsets[starts, 0], offsets[ends - 1, 1]
+    return [
+        {
             "chunk_index": idx,
-            "content": chunk_text,
-            "n_words": len(chunk_tokens),
+            "content": text[a:b],
+            "n_tokens": int(end - start),
             "pages": page_set,
             "page_range": [page_set[0], page_set[-1]] if page_set else None
-        })
+        }
+        for idx, (start, end, a, b, page_set) in enumerate(zip(starts, ends, char_starts, char_ends, page_sets))
+    ]
+
+def chunk_pages(pages: List[Dict]):
+    """chunks of one document's pages (in page order) in CHUNK_UNIT"""
+    if CHUNK_UNIT == "tokens":
+        return make_token_chunks(pages, get_tokenizer(TOKENIZER_MODEL), CHUNK_TOKENS, OVERLAP_TOKENS)
+    return make_chunks(*build_word_stream(pages), CHUNK_WORDS, OVERLAP_WORDS)
+
+# ---------- streaming mode (constant memory) ----------
+def iter_pages(json_path: str) -> Iterator[Dict]:
+    """
+    yields the page objects of a page-JSON array one at a time without loading the
+    whole file; pages must already be in page order (text_extract_with_ocr.py writes them so)
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    with open(json_path, "r", encoding="utf-8") as f:
+        while True:
+            # skip whitespace, the opening "[" and separating commas
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == "," or (buf[pos] == "[" and not started)):
+                started = started or buf[pos] == "["
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                page, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                block = f.read(READ_BLOCK_BYTES)
+                if not block:
+                    if buf[pos:].strip():
+                        raise
+                    return
+                buf = buf[pos:] + block
+                pos = 0
+                continue
+            yield page
+            pos = end
+            if pos > READ_BLOCK_BYTES:
+                buf, pos = buf[pos:], 0
+
+def _chunk_from_window(window: List[str], runs: List[List[int]], idx: int) -> Dict:
+    page_set = sorted({page for page, _ in runs if page is not None})
+    return {
+        "chunk_index": idx,
+        "content": " ".join(window),
+        "n_words": len(window),
+        "pages": page_set,
+        "page_range": [page_set[0], page_set[-1]] if page_set else None
+    }
+
+def _slide(window: List[str], runs: List[List[int]], step: int):
+    """drops the first `step` words from the window and its page runs"""
+    del window[:step]
+    while step and runs:
+        taken = min(step, runs[0][1])
+        runs[0][1] -= taken
+        step -= taken
+        if runs[0][1] == 0:
+            runs.pop(0)
+
+def stream_chunks(pages, chunk_words: int, overlap_words: int) -> Iterator[Dict]:
+    """
+    same chunks as make_chunks(*build_word_stream(pages)), but emitted as soon as the
+    window fills; only the current window is kept, with its pages as run-length
+    [page_number, n_words] pairs instead of one int per word
+    """
+    step = max(1, chunk_words - overlap_words)
+    window: List[str] = []
+    runs: List[List[int]] = []
+    idx = 0
+    for p in pages:
+        text = normalize_text(p.get("content", ""))
+        if not text:
+            continue
+        page_no = p.get("page_number")
+        for word in text.split():
+            if len(window) == chunk_words:
+                # a later word exists, so this full window is not the tail
+                yield _chunk_from_window(window, runs, idx)
+                idx += 1
+                _slide(window, runs, step)
+            window.append(word)
+            if runs and runs[-1][0] == page_no:
+                runs[-1][1] += 1
+            else:
+                runs.append([page_no, 1])
 
+    # windows that reach the end of the document, shrinking by `step` until one is a tiny tail
+    while window and len(window) >= MIN_WORDS_TO_KEEP_LAST:
+        yield _chunk_from_window(window, runs, idx)
         idx += 1
-        start += step
+        _slide(window, runs, step)
+
+def write_jsonl(records, out_path: str) -> int:
+    """writes one JSON object per line as records arrive; returns the count"""
+    tmp_path = out_path + ".tmp"
+    n = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            n += 1
+    os.replace(tmp_path, out_path)
+    return n
 
-    return chunks
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
-def process_one_file(input_path: str, filename: str):
+def process_one_file_streaming(input_path: str, filename: str, store: CorpusStore = None):
+    base = os.path.splitext(filename)[0]
+    pages = iter_pages(input_path)
+    first = next(pages, None)
+    if first is None:
+        print(f"⚠️  {filename}: no pages found, skipping.")
+        return
+    doc_id = first.get("doc_id", base)
+
+    def decorated():
+        def all_pages():
+            yield first
+            yield from pages
+        for i, ch in enumerate(stream_chunks(all_pages(), CHUNK_WORDS, OVERLAP_WORDS)):
+            ch["doc_id"] = doc_id
+            ch["source_file"] = filename
+            ch["chunk_id"] = f"{base}-{i:04d}"
+            yield ch
+
+    out_path = os.path.join(OUTPUT_FOLDER, f"{base}_chunks.jsonl")
+    n = write_jsonl(decorated(), out_path)
+    if store is not None:
+        # read back line by line so memory stays flat
+        store.put_chunks(doc_id, read_jsonl(out_path))
+    print(f"✅ {filename}: {n} chunks → {out_path}")
+
+def process_one_file(input_path: str, filename: str, store: CorpusStore = None):
     base = os.path.splitext(filename)[0]
     pages = load_pages(input_path)
     if not pages:
@@ -110,8 +358,7 @@ def process_one_file(input_path: str, filename: str):
     # ensure doc_id consistency
     doc_id = pages[0].get("doc_id", base)
 
-    words, page_map = build_word_stream(pages)
-    chunks = make_chunks(words, page_map, CHUNK_WORDS, OVERLAP_WORDS)
+    chunks = chunk_pages(pages)
 
     # decorate chunks with doc metadata and stable chunk_ids
     for i, ch in enumerate(chunks):
@@ -121,17 +368,30 @@ def process_one_file(input_path: str, filename: str):
 
     out_path = os.path.join(OUTPUT_FOLDER, f"{base}_chunks.json")
     with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=4, ensure_ascii=False)
+        json.dump(chunks, f, ensure_ascii=False)
+    if store is not None:
+        store.put_chunks(doc_id, chunks)
 
     print(f"✅ {filename}: {len(chunks)} chunks → {out_path}")
 
 def main():
+    global CHUNK_UNIT
+    parser = argparse.ArgumentParser(description="sliding-window chunks for each page JSON")
+    parser.add_argument("--unit", choices=("tokens", "words"), default=CHUNK_UNIT,
+                        help="size windows in embedding model tokens or in whitespace words")
+    parser.add_argument("--stream", action="store_true",
+                        help="constant-memory mode for very large documents (word windows), writes <name>_chunks.jsonl")
+    args = parser.parse_args()
+    CHUNK_UNIT = args.unit
+
     files = [f for f in os.listdir(INPUT_FOLDER) if f.lower().endswith(".json")]
     if not files:
         print(f"no JSON files found in {INPUT_FOLDER}")
         return
+    process = process_one_file_streaming if args.stream else process_one_file
+    store = CorpusStore()
     for fname in files:
-        process_one_file(os.path.join(INPUT_FOLDER, fname), fname)
+        process(os.path.join(INPUT_FOLDER, fname), fname, store)
 
 if __name__ == "__main__":
     main()
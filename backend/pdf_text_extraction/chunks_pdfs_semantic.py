@@ -1,10 +1,15 @@
 import os
 import json
 import re
-from sentence_transformers import SentenceTransformer, util
+from bisect import bisect_right
+import numpy as np
 import nltk
 from nltk.tokenize import sent_tokenize
 
+from corpus_store import CorpusStore
+from embedding_store import EmbeddingStore
+from model_registry import get_sentence_transformer
+
 # Download NLTK punkt tokenizer if not already
 nltk.download("punkt")
 nltk.download('punkt_tab')
@@ -13,75 +18,167 @@ nltk.download('punkt_tab')
 CHUNK_WORDS = 500
 MIN_WORDS_TO_KEEP_LAST = 50
 SIMILARITY_THRESHOLD = 0.75  # tweakable
+ENCODE_BATCH_SIZE = 64
+# also write mean-pooled sentence embeddings per chunk (<file>.npy next to the chunk JSON),
+# embeddings_huggingface.py can reuse them instead of re-encoding when the model matches
+SAVE_CHUNK_EMBEDDINGS = True
 
 # Load embedding model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
+model = get_sentence_transformer(MODEL_NAME)
+# sentences seen in earlier runs are not re-encoded (vectors here are L2-normalized)
+sentence_store = EmbeddingStore(f"{MODEL_NAME}-normalized")
 
 def clean_text(text):
     text = re.sub(r"\s+", " ", text)
     return text.strip()
 
-def semantic_chunk_text(text):
-    sentences = sent_tokenize(text)
-    chunks = []
-    current_chunk = []
+def encode_sentences(sentences):
+    """one batched encode for the whole document -> (n_sentences, dim) float32, L2-normalized"""
+    if not sentences:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype="float32")
+    return sentence_store.get_many(
+        sentences,
+        lambda batch: model.encode(batch, batch_size=ENCODE_BATCH_SIZE,
+                                   convert_to_numpy=True, normalize_embeddings=True),
+    )
+
+def semantic_chunk_spans(sentences, sent_emb):
+    """
+    greedy packing of sentences into ~CHUNK_WORDS chunks; at a boundary the last
+    sentence is repeated in the next chunk if it is semantically close to the next one.
+    returns [(start, end)] sentence ranges (end exclusive)
+    """
+    n = len(sentences)
+    word_counts = [len(s.split()) for s in sentences]
+    # cosine similarity of every sentence with the next one, all at once
+    adjacent_sim = np.einsum("ij,ij->i", sent_emb[:-1], sent_emb[1:]) if n > 1 else np.zeros(0)
+
+    spans = []
+
+    def emit(start, end):
+        if sum(word_counts[start:end]) >= MIN_WORDS_TO_KEEP_LAST:
+            spans.append((start, end))
+
+    start = 0
     current_length = 0
+    for i in range(n):
+        if current_length + word_counts[i] <= CHUNK_WORDS:
+            current_length += word_counts[i]
+            continue
+
+        # Check semantic overlap with next sentence
+        new_start = i
+        if i > start and i < n - 1 and adjacent_sim[i - 1] >= SIMILARITY_THRESHOLD:
+            new_start = i - 1  # keep last semantically close sentence
 
-    for i, sentence in enumerate(sentences):
-        words = sentence.split()
-        if current_length + len(words) <= CHUNK_WORDS:
-            current_chunk.append(sentence)
-            current_length += len(words)
-        else:
-            # Check semantic overlap with next sentence
-            overlap = []
-            if i < len(sentences) - 1:
-                last_sent_emb = model.encode(current_chunk[-1], convert_to_tensor=True)
-                next_sent_emb = model.encode(sentences[i], convert_to_tensor=True)
-                similarity = util.pytorch_cos_sim(last_sent_emb, next_sent_emb).item()
-
-                if similarity >= SIMILARITY_THRESHOLD:
-                    overlap.append(current_chunk[-1])  # keep last semantically close sentence
-
-            # Save current chunk
-            chunk_text = " ".join(current_chunk)
-            if len(chunk_text.split()) >= MIN_WORDS_TO_KEEP_LAST:
-                chunks.append(chunk_text)
-
-            # Start new chunk
-            current_chunk = overlap + [sentence]
-            current_length = sum(len(s.split()) for s in current_chunk)
+        # Save current chunk
+        if i > start:
+            emit(start, i)
+
+        # Start new chunk
+        start = new_start
+        current_length = sum(word_counts[start:i + 1])
 
     # Add final chunk
-    if current_chunk:
-        chunk_text = " ".join(current_chunk)
-        if len(chunk_text.split()) >= MIN_WORDS_TO_KEEP_LAST:
-            chunks.append(chunk_text)
+    if start < n:
+        emit(start, n)
+
+    return spans
+
+def pool_chunk_embeddings(sent_emb, spans):
+    """mean of the sentence embeddings in each span (re-normalized), via a prefix sum"""
+    if not spans:
+        return np.zeros((0, sent_emb.shape[1]), dtype="float32")
+    prefix = np.vstack([np.zeros((1, sent_emb.shape[1]), dtype="float64"),
+                        np.cumsum(sent_emb, axis=0, dtype="float64")])
+    starts = np.array([s for s, _ in spans])
+    ends = np.array([e for _, e in spans])
+    pooled = (prefix[ends] - prefix[starts]) / (ends - starts)[:, None]
+    pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled.astype("float32")
+
+def semantic_chunk_sentences(text):
+    """sentences, their embeddings and the chunk spans over them"""
+    sentences = sent_tokenize(text)
+    sent_emb = encode_sentences(sentences)
+    return sentences, sent_emb, semantic_chunk_spans(sentences, sent_emb)
+
+def semantic_chunk_text_with_embeddings(text):
+    """returns chunks and their pooled embeddings (one row per chunk)"""
+    sentences, sent_emb, spans = semantic_chunk_sentences(text)
+    chunks = [" ".join(sentences[s:e]) for s, e in spans]
+    return chunks, pool_chunk_embeddings(sent_emb, spans)
+
+def span_page_ranges(text, sentences, spans, page_starts, page_numbers):
+    """
+    [first, last] page of every chunk span; page_starts are the offsets in `text` where
+    each page's text begins. sentences are located in order with str.find
+    """
+    offsets, pos = [], 0
+    for sentence in sentences:
+        found = text.find(sentence, pos)
+        start = found if found >= 0 else pos
+        offsets.append((start, start + len(sentence)))
+        pos = offsets[-1][1] if found >= 0 else pos
+    page_at = lambda offset: page_numbers[max(0, bisect_right(page_starts, offset) - 1)]
+    return [[page_at(offsets[s][0]), page_at(max(offsets[e - 1][1] - 1, offsets[s][0]))] for s, e in spans]
 
+def semantic_chunk_text(text):
+    chunks, _ = semantic_chunk_text_with_embeddings(text)
     return chunks
 
+def chunk_file(file_path, file_name, output_file, store=None):
+    """semantic chunks of one page JSON written to output_file (+ pooled embeddings); returns the chunk count"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    page_starts, page_numbers = [], []
+    if isinstance(data, list):  
+        # same text as cleaning the joined pages, but we know where each page starts
+        pages = [(page.get("page_number", i), clean_text(page.get("content", ""))) for i, page in enumerate(data, start=1)]
+        pages = [(number, page_text) for number, page_text in pages if page_text]
+        offset = 0
+        for number, page_text in pages:
+            page_starts.append(offset)
+            page_numbers.append(number)
+            offset += len(page_text) + 1
+        text = " ".join(page_text for _, page_text in pages)
+    elif isinstance(data, dict):  
+        text = clean_text(data.get("content", data.get("text", "")))
+    else:  
+        text = ""
+    sentences, sent_emb, spans = semantic_chunk_sentences(text)
+    chunks = [" ".join(sentences[s:e]) for s, e in spans]
+    chunk_emb = pool_chunk_embeddings(sent_emb, spans)
+
+    output_data = {"file": file_name, "chunks": chunks}
+    if page_numbers:
+        output_data["page_ranges"] = span_page_ranges(text, sentences, spans, page_starts, page_numbers)
+    if SAVE_CHUNK_EMBEDDINGS:
+        # rows line up with output_data["chunks"]
+        output_data["embedding_model"] = MODEL_NAME
+        np.save(os.path.splitext(output_file)[0] + ".npy", chunk_emb)
+    with open(output_file, "w", encoding="utf-8") as out:
+        json.dump(output_data, out, ensure_ascii=False)
+    if store is not None:
+        # chunk ids match the vector store's docstore ids ("<chunk file>::<index>")
+        doc_id = data[0].get("doc_id", file_name) if isinstance(data, list) and data else file_name
+        store.put_chunks(doc_id, [
+            {"chunk_id": f"{file_name}::{i}", "content": chunk, "chunk_index": i, "source_file": file_name,
+             **({"page_range": output_data["page_ranges"][i]} if page_numbers else {})}
+            for i, chunk in enumerate(chunks)
+        ])
+    return len(chunks)
+
 def process_pdf_texts(input_folder, output_folder):
     os.makedirs(output_folder, exist_ok=True)
+    store = CorpusStore()
 
     for file_name in os.listdir(input_folder):
         if file_name.endswith(".json"):  # using the jsons you created earlier
-            file_path = os.path.join(input_folder, file_name)
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, list):  
-                text = clean_text(" ".join(page.get("content", "") for page in data)) 
-            elif isinstance(data, dict):  
-                text = clean_text(data.get("content", data.get("text", "")))
-            else:  
-                text = ""
-            chunks = semantic_chunk_text(text)
-
-            output_data = {"file": file_name, "chunks": chunks}
-            output_file = os.path.join(output_folder, file_name)
-            with open(output_file, "w", encoding="utf-8") as out:
-                json.dump(output_data, out, indent=4, ensure_ascii=False)
-
-            print(f"✅ Processed {file_name} into {len(chunks)} semantic chunks")
+            n_chunks = chunk_file(os.path.join(input_folder, file_name), file_name,
+                                  os.path.join(output_folder, file_name), store)
+            print(f"✅ Processed {file_name} into {n_chunks} semantic chunks")
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+"""
+named collections (e.g. one per customer): each has its own inputs, chunks and FAISS
+index + docstore + BM25, so a query only ever searches its own collection's vectors.
+
+    default   the original folders: pdfs/, images/, extracted_ocr_jsons/,
+              chunks_500words_using_semantic/, embeddings_forqa_huggingface/
+    <name>    collections/<name>/{pdfs, images, extracted, chunks, embeddings, corpus.sqlite}
+
+build one with the usual scripts:
+    python ingest_pipeline.py --collection acme
+"""
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List
+
+from corpus_store import CORPUS_DB
+from index_manager import IndexManager, IndexVersion
+
+COLLECTIONS_DIR = os.getenv("RAG_COLLECTIONS_DIR", "collections")
+DEFAULT_COLLECTION = "default"
+NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class UnknownCollection(KeyError):
+    pass
+
+
+def check_name(name: str) -> str:
+    if not NAME_RE.match(name or ""):
+        raise ValueError(f"invalid collection name {name!r} (lowercase letters, digits, '-' and '_')")
+    return name
+
+
+def collection_paths(name: str = DEFAULT_COLLECTION) -> Dict[str, str]:
+    if name == DEFAULT_COLLECTION:
+        output = "embeddings_forqa_huggingface"
+        return {
+            "pdfs": "pdfs",
+            "images": "images",
+            "extracted": "extracted_ocr_jsons",
+            "chunks": "chunks_500words_using_semantic",
+            "output": output,
+            "index": os.path.join(output, "faiss_index"),
+            "corpus": CORPUS_DB,
+        }
+    root = os.path.join(COLLECTIONS_DIR, check_name(name))
+    output = os.path.join(root, "embeddings")
+    return {
+        "pdfs": os.path.join(root, "pdfs"),
+        "images": os.path.join(root, "images"),
+        "extracted": os.path.join(root, "extracted"),
+        "chunks": os.path.join(root, "chunks"),
+        "output": output,
+        "index": os.path.join(output, "faiss_index"),
+        "corpus": os.path.join(root, "corpus.sqlite"),
+    }
+
+
+def list_collections() -> List[str]:
+    """collections with a built index"""
+    names = [DEFAULT_COLLECTION]
+    if os.path.isdir(COLLECTIONS_DIR):
+        names += sorted(n for n in os.listdir(COLLECTIONS_DIR) if NAME_RE.match(n))
+    return [n for n in names if os.path.exists(os.path.join(collection_paths(n)["index"], "index.faiss"))]
+
+
+class CollectionRegistry:
+    """
+    one IndexManager per collection, loaded on its first query (the index is memory-mapped,
+    so an idle collection costs little). on_swap callbacks get (collection, new version)
+    """
+
+    def __init__(self, load_fn: Callable[[str], tuple], check_interval: float = 10.0,
+                 drain_timeout: float = 60.0):
+        self.load_fn = load_fn
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+        self.on_swap: List[Callable[[str, IndexVersion], Any]] = []
+        self._managers: Dict[str, IndexManager] = {}
+        self._lock = threading.Lock()
+        self._watching = False
+
+    def manager(self, name: str = DEFAULT_COLLECTION) -> IndexManager:
+        name = name or DEFAULT_COLLECTION
+        manager = self._managers.get(name)
+        if manager is not None:
+            return manager
+        index_path = collection_paths(name)["index"]
+        with self._lock:
+            if name in self._managers:
+                return self._managers[name]
+            if not os.path.exists(os.path.join(index_path, "index.faiss")):
+                raise UnknownCollection(name)
+            manager = IndexManager(index_path, self.load_fn, self.check_interval, self.drain_timeout)
+            manager.on_swap.append(lambda version: self._swapped(name, version))
+            manager.load_initial()
+            if self._watching:
+                manager.start_watching()
+            self._managers[name] = manager
+        return manager
+
+    def _swapped(self, name: str, version: IndexVersion):
+        for callback in self.on_swap:
+            callback(name, version)
+
+    def loaded(self) -> Dict[str, IndexManager]:
+        return dict(self._managers)
+
+    def start_watching(self):
+        with self._lock:
+            self._watching = True
+            for manager in self._managers.values():
+                manager.start_watching()
+
+    def stop_watching(self):
+        with self._lock:
+            self._watching = False
+            for manager in self._managers.values():
+                manager.stop_watching()
+
+    def status(self) -> Dict[str, Dict]:
+        return {name: manager.status() for name, manager in self.loaded().items()}
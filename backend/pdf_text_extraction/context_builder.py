@@ -0,0 +1,133 @@
+import re
+from typing import List, Sequence
+
+from bm25_index import tokenize
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+# a retrieval-rank prior so that, at equal query overlap, sentences from better chunks win
+RANK_WEIGHT = 0.1
+
+
+def truncate_to_tokens(text: str, tokenizer, max_tokens: int) -> str:
+    """Trim text to fit the model's max input length."""
+    ids = tokenizer.encode(text, add_special_tokens=False, truncation=True, max_length=max_tokens)
+    return tokenizer.decode(ids, skip_special_tokens=True)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def count_tokens(text: str, tokenizer) -> int:
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def _fits_within(text: str, tokenizer, max_tokens: int) -> str:
+    """truncate_to_tokens, re-measured: decoding and re-encoding can come out longer"""
+    limit = max_tokens
+    while limit > 0:
+        out = truncate_to_tokens(text, tokenizer, limit)
+        n = count_tokens(out, tokenizer)
+        if n <= max_tokens:
+            return out
+        limit -= n - max_tokens
+    return ""
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _edge_fragment(key: str, seen: Sequence[str], at_start: bool) -> bool:
+    """
+    key is the tail (at_start: the chunk began mid-sentence) or the head (the chunk
+    ended mid-sentence) of a sentence already seen, cut at a word boundary
+    """
+    for full in seen:
+        if len(full) <= len(key):
+            continue
+        if at_start and full.endswith(key) and full[-len(key) - 1] == " ":
+            return True
+        if not at_start and full.startswith(key) and full[len(key)] == " ":
+            return True
+    return False
+
+
+def dedupe_sentences(chunks: Sequence[str]) -> List[tuple]:
+    """
+    (chunk rank, position, sentence) for every sentence not seen before; the sliding
+    window chunker repeats ~50 words between neighbours, so exact repeats are dropped,
+    and so is the first / last sentence of a chunk when it is only the cut-off end /
+    start of a sentence seen earlier. other sentences are kept even when their text
+    occurs inside an earlier one ("See table 1." next to "See table 10.")
+    """
+    seen = set()
+    seen_order = []
+    out = []
+    for rank, chunk in enumerate(chunks):
+        sentences = split_sentences(chunk)
+        for pos, sentence in enumerate(sentences):
+            key = _norm(sentence)
+            if not key or key in seen:
+                continue
+            if pos == 0 and _edge_fragment(key, seen_order, at_start=True):
+                continue
+            if pos == len(sentences) - 1 and _edge_fragment(key, seen_order, at_start=False):
+                continue
+            out.append((rank, pos, sentence))
+        for sentence in sentences:  # later chunks are compared with every sentence of this one
+            key = _norm(sentence)
+            if key and key not in seen:
+                seen.add(key)
+                seen_order.append(key)
+    return out
+
+
+def _join(sentences: Sequence[tuple], chosen: Sequence[int]) -> str:
+    """chosen sentences in reading order: chunk by chunk, sentence by sentence"""
+    parts, last_rank = [], None
+    for i in sorted(chosen):
+        rank, _, sentence = sentences[i]
+        if rank != last_rank and parts:
+            parts.append("\n\n")
+        elif parts:
+            parts.append(" ")
+        parts.append(sentence)
+        last_rank = rank
+    return "".join(parts)
+
+
+def build_context(query: str, chunks: Sequence[str], tokenizer, max_tokens: int) -> str:
+    """
+    packs the most query-relevant sentences of the retrieved chunks (best first) into
+    max_tokens generator tokens, then restores reading order so the context stays coherent.
+    the joined text is measured again (joiners and tokens merging across sentence edges
+    aren't in the per-sentence counts) and the weakest sentences go until it fits.
+    falls back to plain truncation when not even one sentence fits
+    """
+    if not chunks or max_tokens <= 0:
+        return ""
+    sentences = dedupe_sentences(chunks)
+    if not sentences:
+        return ""
+
+    lengths = [len(ids) for ids in
+               tokenizer([s for _, _, s in sentences], add_special_tokens=False)["input_ids"]]
+    query_terms = set(tokenize(query))
+
+    def score(i):
+        rank, _, sentence = sentences[i]
+        overlap = len(query_terms & set(tokenize(sentence)))
+        return overlap - RANK_WEIGHT * rank
+
+    chosen, used = [], 0  # best first
+    for i in sorted(range(len(sentences)), key=score, reverse=True):
+        if used + lengths[i] <= max_tokens:
+            chosen.append(i)
+            used += lengths[i]
+    while chosen:
+        context = _join(sentences, chosen)
+        if count_tokens(context, tokenizer) <= max_tokens:
+            return context
+        chosen.pop()
+    return _fits_within("\n\n".join(chunks), tokenizer, max_tokens)
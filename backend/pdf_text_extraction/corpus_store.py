@@ -0,0 +1,202 @@
+"""
+SQLite storage for the corpus, so later stages and the API can read single pages or
+chunks by id without parsing whole JSON files or unpickling the whole docstore.
+
+    CorpusStore     pages (per document) and chunks (by chunk id) written by the
+                    extraction / chunking scripts, in CORPUS_DB
+    SqliteDocstore  LangChain docstore for the FAISS vector store; FAISS.save_local
+                    pickles only its file path, chunk text stays on disk and is read
+                    through SQLite's memory map, shared by every process
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+CORPUS_DB = os.getenv("RAG_CORPUS_DB", "corpus.sqlite")
+DOCSTORE_FILE = "docstore.sqlite"  # inside the FAISS index folder
+# how much of a database file SQLite may memory-map (pages are shared via the OS page cache)
+MMAP_SIZE = int(os.getenv("RAG_SQLITE_MMAP_BYTES", str(1 << 30)))
+
+
+class _SqliteFile:
+    """one connection per thread (and per process, so forked workers never share one)"""
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._pinned = None  # (connection, pid) shared by all threads, see pin()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._pinned is not None and self._pinned[1] == os.getpid():
+            return self._pinned[0]
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            conn.executescript(self.SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def pin(self) -> bool:
+        """
+        opens the file now, on one connection shared by every thread of this process, so
+        reads keep going to this file even after a builder renames a new one over the path.
+        needs an SQLite built serialized (sqlite3.threadsafety == 3); returns False otherwise
+        and threads keep opening the path lazily
+        """
+        if sqlite3.threadsafety != 3:
+            return False
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._pinned = (conn, os.getpid())
+        return True
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        if self._pinned is not None and self._pinned[1] == os.getpid():
+            self._pinned[0].close()
+        self._pinned = None
+
+    # pickled (FAISS.save_local) as just the path
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+
+class CorpusStore(_SqliteFile):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        doc_id TEXT NOT NULL, page_number INTEGER NOT NULL, content TEXT NOT NULL,
+        meta TEXT, PRIMARY KEY (doc_id, page_number));
+    CREATE TABLE IF NOT EXISTS chunks (
+        chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, chunk_index INTEGER NOT NULL,
+        content TEXT NOT NULL, meta TEXT);
+    CREATE INDEX IF NOT EXISTS chunks_by_doc ON chunks (doc_id, chunk_index);
+    """
+
+    def __init__(self, path: str = CORPUS_DB):
+        super().__init__(path)
+
+    # ---------- pages ----------
+    def put_pages(self, doc_id: str, pages: Sequence[Dict]):
+        """replaces all pages of doc_id; pages are the extractor's {"page_number", "content", ...} dicts"""
+        rows = []
+        for i, page in enumerate(pages, start=1):
+            extra = {k: v for k, v in page.items() if k not in ("doc_id", "page_number", "content")}
+            rows.append((doc_id, page.get("page_number", i), page.get("content", ""),
+                         json.dumps(extra, ensure_ascii=False) if extra else None))
+        with self._conn() as conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?)", rows)
+
+    def iter_pages(self, doc_id: str) -> Iterator[Dict]:
+        cur = self._conn().execute(
+            "SELECT page_number, content, meta FROM pages WHERE doc_id = ? ORDER BY page_number", (doc_id,))
+        for page_number, content, meta in cur:
+            yield {"doc_id": doc_id, "page_number": page_number, "content": content,
+                   **(json.loads(meta) if meta else {})}
+
+    def page_doc_ids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT doc_id FROM pages ORDER BY doc_id")]
+
+    # ---------- chunks ----------
+    def put_chunks(self, doc_id: str, chunks: Iterable[Dict]):
+        """
+        replaces all chunks of doc_id; each chunk needs "chunk_id" and "content", the rest
+        is metadata. chunks may be a generator, rows are inserted as they come
+        """
+        def rows():
+            for i, chunk in enumerate(chunks):
+                extra = {k: v for k, v in chunk.items() if k not in ("chunk_id", "content", "doc_id", "chunk_index")}
+                yield (chunk["chunk_id"], doc_id, chunk.get("chunk_index", i), chunk["content"],
+                       json.dumps(extra, ensure_ascii=False) if extra else None)
+        with self._conn() as conn:
+            conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows())
+
+    def get_chunk(self, chunk_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT doc_id, chunk_index, content, meta FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        if row is None:
+            return None
+        doc_id, chunk_index, content, meta = row
+        return {"chunk_id": chunk_id, "doc_id": doc_id, "chunk_index": chunk_index, "content": content,
+                **(json.loads(meta) if meta else {})}
+
+    def iter_chunks(self, doc_id: str) -> Iterator[Dict]:
+        cur = self._conn().execute(
+            "SELECT chunk_id FROM chunks WHERE doc_id = ? ORDER BY chunk_index", (doc_id,))
+        for (chunk_id,) in cur.fetchall():
+            yield self.get_chunk(chunk_id)
+
+
+class SqliteDocstore(_SqliteFile, Docstore, AddableMixin):
+    """drop-in for InMemoryDocstore: search / add / delete by docstore id"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT);
+    """
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._conn().execute("SELECT page_content, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]) if row[1] else {})
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        try:
+            with self._conn() as conn:  # one transaction, rolled back on error
+                conn.executemany("INSERT INTO docs VALUES (?, ?, ?)", [
+                    (doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                    for doc_id, doc in texts.items()
+                ])
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Tried to add ids that already exist: {e}") from e
+
+    def delete(self, ids: List) -> None:
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in ids])
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def iter_metadata(self) -> Iterator[tuple]:
+        """(id, metadata) of every document, in one query"""
+        for doc_id, metadata in self._conn().execute("SELECT id, metadata FROM docs"):
+            yield doc_id, json.loads(metadata) if metadata else {}
+
+    def copy_to(self, path: str) -> "SqliteDocstore":
+        """a copy of this docstore at `path`, to change without touching the file being served"""
+        if os.path.exists(path):
+            os.remove(path)
+        dest = sqlite3.connect(path)
+        self._conn().backup(dest)
+        dest.close()
+        return type(self)(path)
+
+    @classmethod
+    def from_documents(cls, path: str, docs: Dict[str, Document]) -> "SqliteDocstore":
+        """writes a fresh docstore file (built next to the old one and swapped in atomically)"""
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        tmp = cls(tmp_path)
+        if docs:
+            tmp.add(docs)
+        tmp.close()
+        # processes that still have the old file open keep reading it until they reload
+        os.replace(tmp_path, path)
+        return cls(path)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from file_lock import file_lock
+
+# ===============================
+# CONFIG
+# ===============================
+EMBEDDING_CACHE_DIR = os.getenv("RAG_EMBEDDING_CACHE_DIR", "embedding_cache")
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def model_slug(model_name: str) -> str:
+    """'sentence-transformers/all-MiniLM-L6-v2' -> 'sentence-transformers__all-MiniLM-L6-v2'"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+
+
+class EmbeddingStore:
+    """
+    persistent embeddings for ONE model, keyed by the sha1 of the text:
+
+        <root>/<model slug>/vectors.f32  float32 rows, append-only, read through np.memmap
+        <root>/<model slug>/keys.txt     one text hash per line, line i <-> row i
+        <root>/<model slug>/meta.json    {"model": ..., "dim": ...}
+        <root>/<model slug>/.lock        held while the files are repaired or appended to
+
+    only texts never seen before with this model are sent to compute_fn.
+    several processes may share a folder: appends happen under the file lock, after
+    picking up the rows other processes appended (so no text is stored twice)
+    """
+
+    def __init__(self, model_name: str, root: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dir = os.path.join(root, model_slug(model_name))
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.keys_path = os.path.join(self.dir, "keys.txt")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._n = 0  # rows on disk we know of
+        self._keys_offset = 0  # bytes of keys.txt read so far
+        self._mmap = None
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _load(self):
+        with file_lock(self.lock_path):
+            self._read_meta()
+            if self.dim is None or not os.path.exists(self.keys_path):
+                return
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                keys = [line.strip() for line in f if line.strip()]
+
+            # an interrupted append can leave the two files out of step -
+            # cut both back to the rows they agree on
+            row_bytes = 4 * self.dim
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            n = min(len(keys), size // row_bytes)
+            if size != n * row_bytes:
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(n * row_bytes)
+            if len(keys) != n:
+                keys = keys[:n]
+                with open(self.keys_path, "w", encoding="utf-8") as f:
+                    f.write("".join(k + "\n" for k in keys))
+
+            self._rows = {k: i for i, k in enumerate(keys)}
+            self._n = n
+            self._keys_offset = os.path.getsize(self.keys_path)
+            self._remap()
+
+    def _read_meta(self):
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _sync(self):
+        """picks up rows other processes appended since we last looked (call under the file lock)"""
+        self._read_meta()
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        if not data:
+            return
+        # the lock holder writes whole lines, vectors first
+        keys = data.decode("utf-8").split()
+        for i, k in enumerate(keys):
+            self._rows.setdefault(k, self._n + i)
+        self._n += len(keys)
+        self._keys_offset += len(data)
+        self._remap()
+
+    def _remap(self):
+        self._mmap = (np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(self._n, self.dim))
+                      if self._n else None)
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """call under the file lock, right after _sync()"""
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"embedding dim {vectors.shape[1]} != cached dim {self.dim} for {self.model_name}")
+
+        # another process may have stored some of these while we were computing them
+        new = [i for i, k in enumerate(keys) if k not in self._rows]
+        if not new:
+            return
+        keys = [keys[i] for i in new]
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors[new], dtype="float32").tobytes())
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            f.write("".join(k + "\n" for k in keys))
+
+        for i, k in enumerate(keys):
+            self._rows[k] = self._n + i
+        self._n += len(keys)
+        self._keys_offset = os.path.getsize(self.keys_path)
+        self._remap()
+
+    def get_many(self, texts: Sequence[str],
+                 compute_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> np.ndarray:
+        """returns a (len(texts), dim) float32 matrix, computing only unseen texts"""
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                with file_lock(self.lock_path):
+                    self._sync()
+            missing = {}
+            for k, t in zip(keys, texts):
+                if k not in self._rows and k not in missing:
+                    missing[k] = t
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+            if missing:
+                # computed without the file lock, so other processes aren't held up
+                new_vectors = np.asarray(compute_fn(list(missing.values())), dtype="float32")
+                with file_lock(self.lock_path):
+                    self._sync()
+                    self._append(list(missing.keys()), new_vectors)
+
+            if not keys:
+                return np.zeros((0, self.dim or 0), dtype="float32")
+            rows = np.fromiter((self._rows[k] for k in keys), dtype=np.int64, count=len(keys))
+            return np.array(self._mmap[rows])
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    drop-in wrapper around a LangChain Embeddings object (e.g. HuggingFaceEmbeddings)
+    that serves repeated texts from an EmbeddingStore
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str = None, root: str = EMBEDDING_CACHE_DIR):
+        self.embeddings = embeddings
+        model_name = model_name or getattr(embeddings, "model_name", None)
+        if not model_name:
+            raise ValueError("model_name is required to key the embedding cache")
+        self.store = EmbeddingStore(model_name, root)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.store.get_many(texts, self.embeddings.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        # not stored: some models embed queries differently from documents, and
+        # user queries are mostly one-offs that would grow the store without bound
+        return self.embeddings.embed_query(text)
@@ -1,7 +1,19 @@
 import os
 import json
+import hashlib
+import argparse
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from ann_index import INDEX_TYPES, build_ann_index, index_type_of, supports_remove
+from bm25_index import build_from_vectorstore
+from collection_registry import DEFAULT_COLLECTION, collection_paths
+from corpus_store import DOCSTORE_FILE, SqliteDocstore
+from embedding_store import CachedEmbeddings
+from file_lock import file_lock
+from model_registry import LazyEmbeddings
+from retrieval import save_vectorstore, staged_docstore_path
+from sharded_index import load_manifest as load_shard_manifest, remove_shards, write_shards
 
 # ===============================
 # CONFIG
@@ -10,61 +22,310 @@ CHUNKS_DIR = "chunks_500words_using_semantic"
 OUTPUT_DIR = "embeddings_forqa_huggingface"
 INDEX_PATH = os.path.join(OUTPUT_DIR, "faiss_index")
 METADATA_FILE = os.path.join(OUTPUT_DIR, "metadata.json")
+# which chunk file produced which vectors (used by incremental updates)
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "manifest.json")
+# lexical (BM25) index over the same chunks, used by the API's hybrid retriever
+BM25_FILE = os.path.join(INDEX_PATH, "bm25.json")
+# chunk texts + metadata live in SQLite next to the index instead of the pickled
+# in-memory docstore; index.pkl then only holds the id mapping and this path
+DOCSTORE_PATH = os.path.join(INDEX_PATH, DOCSTORE_FILE)
+
+# FAISS index type: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"
+# (see ann_index.py, and run it to compare recall/latency before switching)
+INDEX_TYPE = "flat"
+ANN_PARAMS = {
+    "nlist": 1024,          # IVF cells
+    "nprobe": 16,           # IVF cells searched per query
+    "pq_m": 16,             # PQ sub-quantizers (must divide the embedding dim)
+    "pq_bits": 8,
+    "hnsw_m": 32,           # HNSW links per node
+    "ef_construction": 80,
+    "ef_search": 64,
+    "train_sample": 50000,  # vectors used to train IVF quantizers
+}
+# also cut the index into this many shards by document (faiss_index/shards/, see
+# sharded_index.py) so the API can search them in parallel (RAG_SHARD_SEARCH);
+# None = keep the shard count the index already has, 0 = no shards
+SHARDS = None
 
 # Use a local Hugging Face embedding model
 # MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2" # small + fast
 MODEL_NAME = "sentence-transformers/multi-qa-mpnet-base-dot-v1" # better for Q&A tasks
-embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+# texts already embedded with this model (by an earlier build) are read from embedding_cache/
+# the model itself is only loaded if something actually needs embedding
+embeddings = CachedEmbeddings(LazyEmbeddings(MODEL_NAME), MODEL_NAME)
+
+# reuse the mean-pooled sentence embeddings written by chunks_pdfs_semantic.py (<file>.npy)
+# instead of re-encoding chunk text; only used when the chunker ran with the same model.
+# pooled vectors are an approximation of encoding the whole chunk, so this is opt-in.
+USE_POOLED_CHUNK_EMBEDDINGS = False
+
+def use_collection(name=DEFAULT_COLLECTION):
+    """points every path above at a collection's folders (see collection_registry.py)"""
+    global CHUNKS_DIR, OUTPUT_DIR, INDEX_PATH, METADATA_FILE, MANIFEST_FILE, BM25_FILE, DOCSTORE_PATH
+    paths = collection_paths(name)
+    CHUNKS_DIR, OUTPUT_DIR, INDEX_PATH = paths["chunks"], paths["output"], paths["index"]
+    METADATA_FILE = os.path.join(OUTPUT_DIR, "metadata.json")
+    MANIFEST_FILE = os.path.join(OUTPUT_DIR, "manifest.json")
+    BM25_FILE = os.path.join(INDEX_PATH, "bm25.json")
+    DOCSTORE_PATH = os.path.join(INDEX_PATH, DOCSTORE_FILE)
+
+def update_lock():
+    """
+    one build / update of a collection's index at a time, across processes: the CLI,
+    and ingest workers of every API process (index and docstore are rewritten)
+    """
+    return file_lock(os.path.join(OUTPUT_DIR, ".update.lock"))
 
 # ===============================
 # LOAD CHUNKS
 # ===============================
-def load_chunks():
-    texts, metadatas = [], []
-    for filename in os.listdir(CHUNKS_DIR):
-        if filename.endswith(".json"):
-            filepath = os.path.join(CHUNKS_DIR, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                file_name = data.get("file", filename)
-                for idx, chunk in enumerate(data.get("chunks", [])):
-                    if chunk.strip():
-                        texts.append(chunk.strip())
-                        metadatas.append({
-                            "source": file_name,
-                            "chunk_id": idx,
-                            "model": MODEL_NAME
-                        })
-    return texts, metadatas
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def list_chunk_files():
+    return sorted(f for f in os.listdir(CHUNKS_DIR) if f.endswith(".json"))
+
+def chunk_doc_id(filename, idx):
+    """stable docstore id for a chunk, so it can be deleted/replaced later"""
+    return f"{filename}::{idx}"
+
+def same_model(a, b):
+    strip = lambda name: (name or "").split("/")[-1]
+    return bool(a) and strip(a) == strip(b)
+
+def load_pooled_vectors(filename, data, chunk_indexes):
+    """precomputed chunk vectors for this file, or None if they can't be used"""
+    if not USE_POOLED_CHUNK_EMBEDDINGS or not same_model(data.get("embedding_model"), MODEL_NAME):
+        return None
+    npy_path = os.path.join(CHUNKS_DIR, os.path.splitext(filename)[0] + ".npy")
+    if not os.path.exists(npy_path):
+        return None
+    matrix = np.load(npy_path)
+    if len(matrix) != len(data.get("chunks", [])):
+        return None  # stale file
+    return matrix[chunk_indexes].tolist()
+
+def load_chunk_file(filename):
+    """returns texts, metadatas, ids, vectors (None unless pooled vectors are reused) for one chunk JSON"""
+    texts, metadatas, ids, chunk_indexes = [], [], [], []
+    filepath = os.path.join(CHUNKS_DIR, filename)
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+        file_name = data.get("file", filename)
+        # [first, last] page per chunk, written by both chunkers (used by filtered queries)
+        page_ranges = data.get("page_ranges") or []
+        for idx, chunk in enumerate(data.get("chunks", [])):
+            if chunk.strip():
+                texts.append(chunk.strip())
+                metadata = {
+                    "source": file_name,
+                    "chunk_id": idx,
+                    "model": MODEL_NAME
+                }
+                if idx < len(page_ranges) and page_ranges[idx]:
+                    metadata["page_range"] = page_ranges[idx]
+                metadatas.append(metadata)
+                ids.append(chunk_doc_id(filename, idx))
+                chunk_indexes.append(idx)
+    vectors = load_pooled_vectors(filename, data, chunk_indexes)
+    return texts, metadatas, ids, vectors
+
+def load_and_embed(filenames):
+    """
+    loads chunk files and returns texts, metadatas, ids, vectors, {filename: ids};
+    everything without reusable vectors is embedded in one embed_documents call
+    """
+    texts, metadatas, ids, vectors, file_ids = [], [], [], [], {}
+    to_embed = []
+    for filename in filenames:
+        t, m, i, v = load_chunk_file(filename)
+        if v is None:
+            to_embed.extend(range(len(texts), len(texts) + len(t)))
+            v = [None] * len(t)
+        texts.extend(t)
+        metadatas.extend(m)
+        ids.extend(i)
+        vectors.extend(v)
+        file_ids[filename] = i
+
+    if to_embed:
+        for pos, vec in zip(to_embed, embeddings.embed_documents([texts[p] for p in to_embed])):
+            vectors[pos] = vec
+    reused = len(texts) - len(to_embed)
+    if reused:
+        print(f"♻️  reused pooled embeddings for {reused} chunks")
+    return texts, metadatas, ids, vectors, file_ids
+
+# ===============================
+# MANIFEST / METADATA
+# ===============================
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(files):
+    """files: {chunk filename: {"sha256": ..., "ids": [docstore ids]}}"""
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump({"model": MODEL_NAME, "index_type": INDEX_TYPE, "files": files}, f, indent=2)
+
+def save_bm25(vectorstore):
+    bm25 = build_from_vectorstore(vectorstore)
+    bm25.save(BM25_FILE)
+    print(f"✅ BM25 index ({len(bm25)} chunks) saved at {BM25_FILE}")
+
+def shard_count():
+    manifest = load_shard_manifest(INDEX_PATH)
+    return manifest["n_shards"] if manifest else 0
+
+def save_shards(vectorstore):
+    """re-cuts the shards after every save (positions move when vectors are dropped)"""
+    n_shards = shard_count() if SHARDS is None else SHARDS
+    if n_shards <= 1:
+        remove_shards(INDEX_PATH)
+        return
+    manifest = write_shards(vectorstore, INDEX_PATH, n_shards, INDEX_TYPE, ANN_PARAMS)
+    sizes = [shard["vectors"] for shard in manifest["shards"]]
+    types = [shard["index_type"] for shard in manifest["shards"]]
+    print(f"✅ {n_shards} shards saved at {INDEX_PATH}/shards (vectors per shard: {sizes}, index types: {types})")
+
+def save_metadata(num_chunks):
+    meta = {
+        "model": MODEL_NAME,
+        "index_type": INDEX_TYPE,
+        "num_chunks": num_chunks,
+        "index_path": INDEX_PATH
+    }
+    with open(METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ Metadata saved at {METADATA_FILE}")
 
 # ===============================
 # CREATE EMBEDDINGS
 # ===============================
 def create_embeddings():
-    texts, metadatas = load_chunks()
+    """full rebuild: embeds every chunk in CHUNKS_DIR"""
+    filenames = list_chunk_files()
+    texts, metadatas, ids, vectors, file_ids = load_and_embed(filenames)
+    files = {
+        f: {"sha256": file_sha256(os.path.join(CHUNKS_DIR, f)), "ids": file_ids[f]}
+        for f in filenames
+    }
     print(f"✅ Loaded {len(texts)} chunks from {CHUNKS_DIR}")
+    if not texts:
+        print("⚠️  nothing to embed")
+        return
 
     # Create FAISS vector store
-    vectorstore = FAISS.from_texts(
-        texts,
+    vectorstore = FAISS.from_embeddings(
+        list(zip(texts, vectors)),
         embeddings,
-        metadatas=metadatas
+        metadatas=metadatas,
+        ids=ids
     )
+    if INDEX_TYPE != "flat":
+        # same vectors in the same order, so index_to_docstore_id still lines up
+        vectorstore.index = build_ann_index(np.asarray(vectors, dtype="float32"), INDEX_TYPE, **ANN_PARAMS)
+        print(f"✅ Built {INDEX_TYPE} index ({ANN_PARAMS})")
 
     # Save FAISS index locally
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    vectorstore.save_local(INDEX_PATH)
+    os.makedirs(INDEX_PATH, exist_ok=True)
+    vectorstore.docstore = SqliteDocstore.from_documents(staged_docstore_path(INDEX_PATH), vectorstore.docstore._dict)
+    save_vectorstore(vectorstore, INDEX_PATH)
     print(f"✅ FAISS index saved at {INDEX_PATH}")
+    save_shards(vectorstore)
+    save_bm25(vectorstore)
 
-    # Save metadata
-    meta = {
-        "model": MODEL_NAME,
-        "num_chunks": len(texts),
-        "index_path": INDEX_PATH
-    }
-    with open(METADATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(meta, f, indent=2)
-    print(f"✅ Metadata saved at {METADATA_FILE}")
+    save_manifest(files)
+    save_metadata(len(texts))
+
+# ===============================
+# INCREMENTAL UPDATE
+# ===============================
+def update_embeddings():
+    """
+    embeds only chunk files that are new or changed since the last run,
+    drops vectors of changed/deleted files and saves the merged index.
+    falls back to a full rebuild if there is no usable manifest.
+    """
+    manifest = load_manifest()
+    if (manifest is None or manifest.get("model") != MODEL_NAME
+            or manifest.get("index_type", "flat") != INDEX_TYPE
+            or not os.path.exists(os.path.join(INDEX_PATH, "index.faiss"))):
+        print("ℹ️  no manifest for this model/index type, doing a full build")
+        create_embeddings()
+        return
+
+    old_files = manifest.get("files", {})
+    current = {f: file_sha256(os.path.join(CHUNKS_DIR, f)) for f in list_chunk_files()}
+
+    changed = [f for f, h in current.items() if f in old_files and old_files[f]["sha256"] != h]
+    added = [f for f in current if f not in old_files]
+    removed = [f for f in old_files if f not in current]
+
+    if not (changed or added or removed):
+        print("✅ index is up to date, nothing to embed")
+        if SHARDS is not None and SHARDS != shard_count():
+            save_shards(FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True))
+        return
+
+    vectorstore = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+    if isinstance(vectorstore.docstore, SqliteDocstore):
+        # the server keeps reading docstore.sqlite until it loads the new index: changes
+        # go to a copy that save_vectorstore swaps in together with the index
+        vectorstore.docstore = SqliteDocstore(DOCSTORE_PATH).copy_to(staged_docstore_path(INDEX_PATH))
+    else:
+        # index written before the SQLite docstore: migrate it
+        vectorstore.docstore = SqliteDocstore.from_documents(staged_docstore_path(INDEX_PATH), vectorstore.docstore._dict)
+
+    # 1) drop vectors of files that changed or disappeared
+    stale_ids = [i for f in changed + removed for i in old_files[f]["ids"]]
+    if stale_ids and not supports_remove(vectorstore.index):
+        # IVF keeps stale ids after remove_ids, HNSW graphs can't delete vectors
+        print(f"ℹ️  {index_type_of(vectorstore.index)} index can't drop vectors in place, doing a full build")
+        create_embeddings()
+        return
+    if stale_ids:
+        vectorstore.delete(stale_ids)
+
+    # 2) embed only the new/changed files
+    files = {f: old_files[f] for f in current if f in old_files and f not in changed}
+    texts, metadatas, ids, vectors, file_ids = load_and_embed(changed + added)
+    for filename in changed + added:
+        files[filename] = {"sha256": current[filename], "ids": file_ids[filename]}
+    if texts:
+        vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+    save_vectorstore(vectorstore, INDEX_PATH)
+    print(f"✅ {len(added)} added, {len(changed)} changed, {len(removed)} removed "
+          f"({len(texts)} chunks embedded, {len(stale_ids)} vectors dropped)")
+    save_shards(vectorstore)
+    save_bm25(vectorstore)
+
+    save_manifest(files)
+    save_metadata(len(vectorstore.index_to_docstore_id))
 
 if __name__ == "__main__":
-    create_embeddings()
+    parser = argparse.ArgumentParser(description="build/update the FAISS index from chunk JSONs")
+    parser.add_argument("--full", action="store_true", help="re-embed everything instead of only new/changed files")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="which collection's chunks to index")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--shards", type=int, default=SHARDS, help="split the index into N shards by document (0 = none)")
+    for name, value in ANN_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+    args = parser.parse_args()
+    INDEX_TYPE = args.index_type
+    ANN_PARAMS = {name: getattr(args, name) for name in ANN_PARAMS}
+    SHARDS = args.shards
+    use_collection(args.collection)
+    with update_lock():
+        if args.full:
+            create_embeddings()
+        else:
+            update_embeddings()
@@ -0,0 +1,62 @@
+"""
+exclusive lock across processes, held on a side file, for files that several processes
+append to or rewrite (the embedding store, a collection's index). every `with` opens its
+own file description, so threads of one process exclude each other too.
+fcntl.flock where available, msvcrt.locking on Windows; where neither exists the lock is a
+no-op, and require_file_lock() refuses to start more than one writer process
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # everything else
+    msvcrt = None
+
+LOCKING = fcntl is not None or msvcrt is not None
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        # locks the first byte; LK_LOCK gives up after ~10 s, keep waiting like flock does
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def require_file_lock(processes: int, what: str = "processes"):
+    """raises at startup if `processes` writers would share files without a working lock"""
+    if not LOCKING and processes > 1:
+        raise RuntimeError(f"{processes} {what} configured, but this platform has no file lock "
+                           "(neither fcntl nor msvcrt): run a single one")
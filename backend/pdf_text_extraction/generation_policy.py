@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from context_builder import truncate_to_tokens
+from model_registry import get_qa_reader
+
+# ===============================
+# CONFIG
+# ===============================
+# max_new_tokens per question type; most questions are one-line facts, only
+# "explain / how / why / list" questions need room to write
+TOKEN_BUDGETS = {
+    "yes_no": 16,
+    "factoid": 32,
+    "definition": 64,
+    "other": 96,
+    "explanation": 200,
+}
+QUESTION_PATTERNS = [
+    ("explanation", re.compile(r"^(how (do|does|did|should|can|to)|why|explain|describe|summari[sz]e|list|compare|what are the (\w+ )?(steps|differences|requirements|reasons))\b")),
+    ("factoid", re.compile(r"^(who|when|where|which|how (many|much|long|often|old|far))\b|^what (year|date|time|number|percentage|amount)\b")),
+    ("definition", re.compile(r"^(what (is|are|was|were|does)|define|meaning of)\b")),
+    ("yes_no", re.compile(r"^(is|are|was|were|do|does|did|can|could|should|will|would|has|have|must)\b")),
+]
+# cut the answer here (decoder-only models tend to carry on with another Q/A round)
+STOP_SEQUENCES = ("\nQuestion:", "\nContext:", "\n\n\n")
+# greedy, one beam, reuse the KV cache between decoding steps
+GREEDY_KWARGS = {"do_sample": False, "num_beams": 1, "use_cache": True}
+
+
+def classify_question(question: str) -> str:
+    q = question.strip().lower()
+    for kind, pattern in QUESTION_PATTERNS:
+        if pattern.search(q):
+            return kind
+    return "other"
+
+
+def token_budget(question: str, cap: int = 300) -> int:
+    return min(cap, TOKEN_BUDGETS[classify_question(question)])
+
+
+def apply_stop_sequences(text: str, stops: Sequence[str] = STOP_SEQUENCES) -> str:
+    cut = min((i for i in (text.find(s) for s in stops) if i >= 0), default=len(text))
+    return text[:cut].strip()
+
+
+# ===============================
+# STOPPING CRITERIA
+# ===============================
+class PerRowTokenBudget(StoppingCriteria):
+    """
+    each row of a batched generate stops after its own number of new tokens, so one
+    micro-batch can mix a 16-token yes/no question with a 200-token explanation
+    (run generate with max_new_tokens=max(budgets))
+    """
+
+    def __init__(self, budgets: Sequence[int]):
+        self.budgets = torch.tensor(list(budgets))
+        self.start = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        if self.start is None:
+            self.start = input_ids.shape[1] - 1
+        generated = input_ids.shape[1] - self.start
+        return (generated >= self.budgets).to(input_ids.device)
+
+
+class StopOnStrings(StoppingCriteria):
+    """stops a row once its last few decoded tokens contain one of the stop strings"""
+
+    def __init__(self, tokenizer, stops: Sequence[str] = STOP_SEQUENCES, lookback: int = 8):
+        self.tokenizer = tokenizer
+        self.stops = tuple(stops)
+        self.lookback = lookback
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        tails = self.tokenizer.batch_decode(input_ids[:, -self.lookback:], skip_special_tokens=True)
+        return torch.tensor([any(s in t for s in self.stops) for t in tails], device=input_ids.device)
+
+
+def generation_kwargs(questions: Sequence[str], tokenizer=None, cap: int = 300,
+                      stops: Sequence[str] = STOP_SEQUENCES) -> Dict:
+    """
+    generate() kwargs for one batch (in the same order as the prompts): greedy with KV
+    cache, a token budget per question, stop strings when a tokenizer is given.
+    needs transformers >= 4.39 (per-row stopping criteria)
+    """
+    budgets = [token_budget(q, cap) for q in questions]
+    criteria = [PerRowTokenBudget(budgets)]
+    if tokenizer is not None and stops:
+        criteria.append(StopOnStrings(tokenizer, stops))
+    return {
+        **GREEDY_KWARGS,
+        "max_new_tokens": max(budgets),
+        "stopping_criteria": StoppingCriteriaList(criteria),
+    }
+
+
+# ===============================
+# EXTRACTIVE SHORTCUT
+# ===============================
+class ExtractiveReader:
+    """
+    the extractive QA reader from rag_local.py as a shortcut: when it finds a span with
+    score >= min_score the span is the answer and generation is skipped.
+    only tried for question types a span can answer
+    """
+
+    def __init__(self, model_name: str = "deepset/roberta-base-squad2", min_score: float = 0.5,
+                 max_context_tokens: int = 400, question_types: Sequence[str] = ("factoid", "definition")):
+        self.model_name = model_name
+        self.min_score = min_score
+        self.max_context_tokens = max_context_tokens
+        self.question_types = tuple(question_types)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        return get_qa_reader(self.model_name, device=-1)
+
+    def applies_to(self, question: str) -> bool:
+        return classify_question(question) in self.question_types
+
+    def answer_batch(self, questions: Sequence[str], contexts: Sequence[str]) -> List[Optional[str]]:
+        """per question the extracted answer, or None when the reader isn't confident"""
+        answers = [None] * len(questions)
+        todo = [j for j, c in enumerate(contexts) if c and c.strip()]
+        if not todo:
+            return answers
+        reader = self.load()
+        inputs = [
+            {"question": questions[j], "context": truncate_to_tokens(contexts[j], reader.tokenizer, self.max_context_tokens)}
+            for j in todo
+        ]
+        outputs = reader(inputs, batch_size=len(inputs))
+        if isinstance(outputs, dict):  # single input
+            outputs = [outputs]
+        for j, out in zip(todo, outputs):
+            answer = out.get("answer", "").strip()
+            if answer and out.get("score", 0.0) >= self.min_score:
+                answers[j] = answer
+                self.hits += 1
+            else:
+                self.misses += 1
+        return answers
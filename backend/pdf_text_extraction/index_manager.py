@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from retrieval import MetadataIndex
+
+logger = logging.getLogger("rag.index")
+
+
+def index_fingerprint(index_path: str) -> Optional[Tuple]:
+    """(name, size, mtime) of every file in the index folder, None if it doesn't exist"""
+    if not index_path or not os.path.isdir(index_path):
+        return None
+    entries = []
+    for name in sorted(os.listdir(index_path)):
+        try:
+            st = os.stat(os.path.join(index_path, name))
+        except FileNotFoundError:
+            continue  # a save renamed it away meanwhile; the next check sees the result
+        entries.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(entries)
+
+
+class IndexVersion:
+    """one loaded copy of the index; `refs` counts the queries still using it"""
+
+    def __init__(self, version: int, vectorstore, bm25, fingerprint, shards=None):
+        self.version = version
+        self.vectorstore = vectorstore
+        self.bm25 = bm25
+        self.shards = shards  # sharded_index.ShardedSearcher, or None to search the full index
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.refs = 0
+        self._metadata = None
+        self._metadata_lock = threading.Lock()
+
+    def metadata(self) -> MetadataIndex:
+        """per-vector source / page span for filtered queries, built on the first one"""
+        with self._metadata_lock:
+            if self._metadata is None:
+                self._metadata = MetadataIndex.from_vectorstore(self.vectorstore)
+        return self._metadata
+
+
+class IndexManager:
+    """
+    serves the index under index_path and swaps in a rebuilt one without a restart:
+
+      - load_fn(index_path) -> (vectorstore, bm25, shards) loads a new version off the
+        request path (bm25 / shards may be None)
+      - queries take the current version with acquire(); a swap only changes which version
+        new queries get, the old one is released once its last query is done (drained)
+      - a watcher thread polls the folder and reloads once its files have stopped changing
+        for one interval (the builder writes several files); POST /admin/index/reload
+        calls reload() directly
+      - on_swap callbacks run after every swap (e.g. clearing the answer cache)
+    """
+
+    def __init__(self, index_path: str, load_fn: Callable[[str], tuple],
+                 check_interval: float = 10.0, drain_timeout: float = 60.0):
+        self.index_path = index_path
+        self.load_fn = load_fn
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+        self.on_swap: List[Callable[[IndexVersion], Any]] = []
+
+        self._lock = threading.Condition()
+        self._reload_lock = threading.Lock()  # one load at a time
+        self._current: Optional[IndexVersion] = None
+        self._next_version = 1
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    # ---------- serving ----------
+    def load_initial(self):
+        fingerprint = index_fingerprint(self.index_path)
+        vectorstore, bm25, shards = self.load_fn(self.index_path)
+        self._swap(vectorstore, bm25, shards, fingerprint)
+
+    @contextmanager
+    def acquire(self):
+        """the current version, kept alive (not released) until the block exits"""
+        with self._lock:
+            current = self._current
+            current.refs += 1
+        try:
+            yield current
+        finally:
+            with self._lock:
+                current.refs -= 1
+                self._lock.notify_all()
+
+    @property
+    def current(self) -> IndexVersion:
+        return self._current
+
+    # ---------- reloading ----------
+    def reload(self, force: bool = False) -> Dict:
+        """loads the index on disk if it differs from the served one (or force); returns status()"""
+        with self._reload_lock:
+            fingerprint = index_fingerprint(self.index_path)
+            if fingerprint is None:
+                raise FileNotFoundError(f"no index at {self.index_path}")
+            if not force and self._current is not None and fingerprint == self._current.fingerprint:
+                return self.status()
+            t0 = time.perf_counter()
+            try:
+                vectorstore, bm25, shards = self.load_fn(self.index_path)
+            except Exception:
+                self.failed_reloads += 1
+                raise
+            old = self._swap(vectorstore, bm25, shards, fingerprint)
+            logger.info("index v%d loaded in %.2fs", self._current.version, time.perf_counter() - t0)
+        if old is not None:
+            threading.Thread(target=self._drain, args=(old,), daemon=True).start()
+        return self.status()
+
+    def _swap(self, vectorstore, bm25, shards, fingerprint) -> Optional[IndexVersion]:
+        new = IndexVersion(self._next_version, vectorstore, bm25, fingerprint, shards)
+        self._next_version += 1
+        with self._lock:
+            old, self._current = self._current, new
+        if old is not None:
+            self.reloads += 1
+        for callback in self.on_swap:
+            callback(new)
+        return old
+
+    def _drain(self, old: IndexVersion):
+        """waits for queries still on `old`, then lets go of it"""
+        deadline = time.monotonic() + self.drain_timeout
+        with self._lock:
+            while old.refs > 0 and time.monotonic() < deadline:
+                self._lock.wait(timeout=1.0)
+            if old.refs > 0:
+                logger.warning("index v%d still has %d queries after %.0fs, releasing anyway",
+                               old.version, old.refs, self.drain_timeout)
+        close = getattr(old.vectorstore.docstore, "close", None)
+        if close is not None:
+            close()
+        if old.shards is not None:
+            old.shards.close()
+        old.vectorstore = old.bm25 = old.shards = old._metadata = None
+        logger.info("index v%d drained", old.version)
+
+    # ---------- watching ----------
+    def start_watching(self):
+        if self.check_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.check_interval + 1)
+            self._watcher = None
+
+    def _watch(self):
+        pending = None
+        while not self._stop.wait(self.check_interval):
+            fingerprint = index_fingerprint(self.index_path)
+            if fingerprint is None or fingerprint == self._current.fingerprint:
+                pending = None
+                continue
+            if fingerprint != pending:
+                # still being written, look again next interval
+                pending = fingerprint
+                continue
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("index reload failed, still serving v%d", self._current.version)
+            pending = None
+
+    def status(self) -> Dict:
+        current = self._current
+        return {
+            "version": current.version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "vectors": int(current.vectorstore.index.ntotal) if current else 0,
+            "hybrid": bool(current and current.bm25 is not None),
+            "shards": current.shards.n_shards if current and current.shards is not None else 0,
+            "in_flight": current.refs if current else 0,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+        }
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# ===============================
+# CONFIG
+# ===============================
+# torch  - fp32 PyTorch (what the scripts used originally)
+# int8   - PyTorch with dynamic int8 quantization of every nn.Linear
+# onnx   - ONNX Runtime graph (exported once, cached under ONNX_CACHE_DIR)
+BACKENDS = ("torch", "int8", "onnx")
+ONNX_CACHE_DIR = os.getenv("RAG_ONNX_CACHE_DIR", "onnx_models")
+
+PARITY_TEXTS = [
+    "What does the Missouri Department of Health say about water sampling?",
+    "Lead and copper samples must be collected from the cold water tap after six hours of stagnation.",
+    "Public water systems are required to notify customers of violations.",
+    "The sample report lists results for each contaminant tested.",
+]
+
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+def quantize_dynamic_int8(module):
+    """int8 weights for every nn.Linear, activations quantized on the fly (CPU only)"""
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+
+
+# ===============================
+# LOADERS (used by model_registry)
+# ===============================
+def load_embeddings(model_name: str, backend: str = "torch", **options):
+    check_backend(backend)
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if backend == "onnx":
+        # sentence-transformers >= 3.2 exports/loads the ONNX graph itself
+        model_kwargs = {**options.pop("model_kwargs", {}), "backend": "onnx"}
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs, **options)
+
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, **options)
+    if backend == "int8":
+        # langchain_huggingface keeps the SentenceTransformer in _client, langchain_community in client
+        st_model = getattr(embeddings, "_client", None) or getattr(embeddings, "client")
+        transformer = st_model[0]
+        transformer.auto_model = quantize_dynamic_int8(transformer.auto_model)
+    return embeddings
+
+
+def load_generator(model_name: str, task: str = "text2text-generation", backend: str = "torch", **options):
+    check_backend(backend)
+    from transformers import AutoTokenizer, pipeline
+
+    if backend == "onnx":
+        from optimum.onnxruntime import (ORTModelForCausalLM, ORTModelForQuestionAnswering,
+                                         ORTModelForSeq2SeqLM)
+        model_cls = {
+            "text2text-generation": ORTModelForSeq2SeqLM,
+            "text-generation": ORTModelForCausalLM,
+            "question-answering": ORTModelForQuestionAnswering,
+        }[task]
+        export_dir = _onnx_dir(model_name)
+        if os.path.isdir(export_dir):
+            model = model_cls.from_pretrained(export_dir)
+            tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        else:
+            model = model_cls.from_pretrained(model_name, export=True)
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model.save_pretrained(export_dir)
+            tokenizer.save_pretrained(export_dir)
+        # onnxruntime picks its own execution provider, torch device options don't apply
+        options.pop("device", None)
+        options.pop("device_map", None)
+        return pipeline(task, model=model, tokenizer=tokenizer, **options)
+
+    pipe = pipeline(task, model=model_name, **options)
+    if backend == "int8":
+        pipe.model = quantize_dynamic_int8(pipe.model)
+    return pipe
+
+
+# ===============================
+# PARITY CHECK
+# ===============================
+def _timed(fn, repeats=3):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    return out, (time.perf_counter() - t0) / repeats
+
+
+def embedding_parity(model_name: str, backend: str, texts: List[str] = PARITY_TEXTS) -> Dict:
+    """cosine similarity of `backend` vectors vs fp32 torch, and the speedup"""
+    ref_model = load_embeddings(model_name, "torch")
+    cand_model = load_embeddings(model_name, backend)
+    ref, ref_s = _timed(lambda: np.asarray(ref_model.embed_documents(texts)))
+    cand, cand_s = _timed(lambda: np.asarray(cand_model.embed_documents(texts)))
+    cos = (ref * cand).sum(1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1))
+    return {
+        "model": model_name,
+        "backend": backend,
+        "min_cosine": round(float(cos.min()), 5),
+        "mean_cosine": round(float(cos.mean()), 5),
+        "fp32_ms": round(ref_s * 1000, 2),
+        "backend_ms": round(cand_s * 1000, 2),
+        "speedup": round(ref_s / cand_s, 2) if cand_s else None,
+    }
+
+
+def generator_parity(model_name: str, backend: str, texts: List[str] = PARITY_TEXTS,
+                     max_new_tokens: int = 64) -> Dict:
+    """share of prompts where greedy output matches fp32 exactly, and the speedup"""
+    ref_pipe = load_generator(model_name, backend="torch", device=-1)
+    cand_pipe = load_generator(model_name, backend=backend, device=-1)
+    prompts = [f"Question: {t}\nAnswer:" for t in texts]
+    generate = lambda pipe: [o["generated_text"].strip() for o in
+                             pipe(prompts, max_new_tokens=max_new_tokens, do_sample=False)]
+    ref, ref_s = _timed(lambda: generate(ref_pipe))
+    cand, cand_s = _timed(lambda: generate(cand_pipe))
+    return {
+        "model": model_name,
+        "backend": backend,
+        "exact_match": round(sum(a == b for a, b in zip(ref, cand)) / len(ref), 3),
+        "fp32_ms": round(ref_s * 1000, 2),
+        "backend_ms": round(cand_s * 1000, 2),
+        "speedup": round(ref_s / cand_s, 2) if cand_s else None,
+        "mismatches": [{"fp32": a, "backend": b} for a, b in zip(ref, cand) if a != b],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare an int8/onnx backend against fp32 torch")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="int8")
+    parser.add_argument("--embed-model", default="sentence-transformers/multi-qa-mpnet-base-dot-v1")
+    parser.add_argument("--gen-model", default="google/flan-t5-base")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail if any embedding is less similar than this")
+    parser.add_argument("--min-exact-match", type=float, default=0.75, help="fail if fewer generations match fp32")
+    args = parser.parse_args()
+
+    report = {
+        "embeddings": embedding_parity(args.embed_model, args.backend),
+        "generator": generator_parity(args.gen_model, args.backend),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    ok = (report["embeddings"]["min_cosine"] >= args.min_cosine
+          and report["generator"]["exact_match"] >= args.min_exact_match)
+    print("✅ parity ok" if ok else "❌ parity check failed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
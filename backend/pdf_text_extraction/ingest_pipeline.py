@@ -0,0 +1,305 @@
+"""
+one entry point for ingestion: extract -> chunk -> embed.
+
+every stage output is stored under pipeline_cache/<stage>/<key>, where key hashes the
+stage config and the content of its input, so a stage only runs when its input or
+config changed (and switching a config back reuses the old outputs). the outputs are
+then copied to the folders the standalone scripts use, so those keep working:
+
+    pdfs/, images/  --extract-->  extracted_ocr_jsons/  --chunk-->  CHUNKS_DIR  --embed-->  FAISS index
+
+(or a named collection's folders with --collection, see collection_registry.py)
+
+documents go through extract + chunk concurrently; embedding is one incremental
+index update at the end (embeddings_huggingface.update_embeddings).
+
+    python ingest_pipeline.py                      # semantic chunks (default)
+    python ingest_pipeline.py --chunk-method words # sliding window (chunks_pdfs.py, model-token sized) instead
+    python ingest_pipeline.py --collection acme    # collections/acme/pdfs -> its own index
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# ===============================
+# CONFIG
+# ===============================
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+CACHE_DIR = "pipeline_cache"
+STATE_FILE = os.path.join(CACHE_DIR, "state.json")
+CHUNK_METHODS = ("semantic", "words")
+DOC_WORKERS = min(4, os.cpu_count() or 1)
+# bump when a stage's code changes in a way that changes its output
+PIPELINE_VERSION = 2
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def stage_key(stage: str, config: dict, input_hash: str) -> str:
+    return sha256_text(json.dumps({"stage": stage, "config": config, "input": input_hash}, sort_keys=True))
+
+
+def write_json_atomic(path: str, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+class Pipeline:
+    def __init__(self, chunk_method: str = "semantic", doc_workers: int = DOC_WORKERS, force: bool = False,
+                 collection: str = "default"):
+        from collection_registry import collection_paths
+        from text_extract_with_ocr import OCR_WORKERS
+
+        self.collection = collection
+        self.paths = collection_paths(collection)
+        self.chunk_method = chunk_method
+        self.doc_workers = doc_workers
+        self.ocr_workers = OCR_WORKERS
+        self.force = force
+        self.state = self._load_state()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self._store = None
+
+    # ---------- state ----------
+    def _load_state(self):
+        if os.path.exists(STATE_FILE):
+            with open(STATE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"hashes": {}, "docs": {}}
+
+    def _save_state(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_json_atomic(STATE_FILE, self.state)
+
+    def content_hash(self, path: str) -> str:
+        """sha256 of a file, remembered by (size, mtime) so unchanged files aren't re-read"""
+        from text_extract_with_ocr import file_sha256
+
+        st = os.stat(path)
+        with self.lock:
+            memo = self.state["hashes"].get(path)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime:
+            return memo[2]
+        digest = file_sha256(path)
+        with self.lock:
+            self.state["hashes"][path] = [st.st_size, st.st_mtime, digest]
+        return digest
+
+    def store(self):
+        from corpus_store import CorpusStore
+
+        with self.lock:
+            if self._store is None:
+                self._store = CorpusStore(self.paths["corpus"])
+        return self._store
+
+    def materialize(self, cached: str, dest: str):
+        """copies a cached output to where the standalone scripts expect it (if it differs)"""
+        if os.path.exists(dest) and self.content_hash(dest) == self.content_hash(cached):
+            return
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        shutil.copyfile(cached, dest + ".tmp")
+        os.replace(dest + ".tmp", dest)
+
+    # ---------- stages ----------
+    def extract_config(self):
+        from text_extract_with_ocr import OCR_DPI
+        return {"version": PIPELINE_VERSION, "ocr_dpi": OCR_DPI}
+
+    def chunk_config(self):
+        if self.chunk_method == "semantic":
+            import chunks_pdfs_semantic as sem
+            return {"version": PIPELINE_VERSION, "method": "semantic", "model": sem.MODEL_NAME,
+                    "chunk_words": sem.CHUNK_WORDS, "min_words_last": sem.MIN_WORDS_TO_KEEP_LAST,
+                    "threshold": sem.SIMILARITY_THRESHOLD, "pooled": sem.SAVE_CHUNK_EMBEDDINGS}
+        import chunks_pdfs as windows
+        if windows.CHUNK_UNIT == "tokens":
+            return {"version": PIPELINE_VERSION, "method": "words", "unit": "tokens",
+                    "tokenizer": windows.TOKENIZER_MODEL, "chunk_tokens": windows.CHUNK_TOKENS,
+                    "overlap_tokens": windows.OVERLAP_TOKENS, "min_tokens_last": windows.MIN_TOKENS_TO_KEEP_LAST}
+        return {"version": PIPELINE_VERSION, "method": "words", "chunk_words": windows.CHUNK_WORDS,
+                "overlap_words": windows.OVERLAP_WORDS, "min_words_last": windows.MIN_WORDS_TO_KEEP_LAST}
+
+    def run_extract(self, source_path: str, filename: str, ocr_pool) -> str:
+        from text_extract_with_ocr import extract_from_image, extract_from_pdf, hash_path_for
+
+        digest = self.content_hash(source_path)
+        key = stage_key("extract", self.extract_config(), digest)
+        cached = os.path.join(CACHE_DIR, "extract", key + ".json")
+        if os.path.exists(cached) and not self.force:
+            self.stats["extract_cached"] += 1
+        else:
+            if filename.lower().endswith(".pdf"):
+                pages = extract_from_pdf(source_path, filename, ocr_pool)
+            else:
+                pages = extract_from_image(source_path, filename)
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            write_json_atomic(cached, pages)
+            if pages:
+                self.store().put_pages(pages[0]["doc_id"], pages)
+            self.stats["extract_run"] += 1
+
+        extracted = os.path.join(self.paths["extracted"], os.path.splitext(filename)[0] + ".json")
+        self.materialize(cached, extracted)
+        # keeps text_extract_with_ocr.py's own skip check in sync
+        with open(hash_path_for(extracted), "w", encoding="utf-8") as f:
+            f.write(digest)
+        return cached
+
+    def run_chunk(self, extracted: str, base: str) -> list:
+        # keyed on the extracted text, so a PDF that changed without changing its text isn't re-chunked
+        key = stage_key("chunk", self.chunk_config(), self.content_hash(extracted))
+        cached = os.path.join(CACHE_DIR, "chunk", key + ".json")
+        file_name = base + ".json"
+        if os.path.exists(cached) and not self.force:
+            self.stats["chunk_cached"] += 1
+        else:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            if self.chunk_method == "semantic":
+                from chunks_pdfs_semantic import chunk_file
+                chunk_file(extracted, file_name, cached, self.store())
+            else:
+                self._word_chunks(extracted, file_name, cached)
+            self.stats["chunk_run"] += 1
+
+        outputs = [os.path.join(self.paths["chunks"], file_name)]
+        self.materialize(cached, outputs[0])
+        npy = os.path.splitext(cached)[0] + ".npy"
+        if os.path.exists(npy):
+            outputs.append(os.path.join(self.paths["chunks"], base + ".npy"))
+            self.materialize(npy, outputs[1])
+        return outputs
+
+    def _word_chunks(self, extracted: str, file_name: str, out_path: str):
+        """sliding-window chunks in the chunk-file format embeddings_huggingface.py reads"""
+        from chunks_pdfs import chunk_pages, load_pages
+
+        pages = load_pages(extracted)
+        chunks = chunk_pages(pages)
+        write_json_atomic(out_path, {"file": file_name, "chunks": [c["content"] for c in chunks],
+                                     "page_ranges": [c["page_range"] for c in chunks]})
+        base = os.path.splitext(file_name)[0]
+        doc_id = pages[0].get("doc_id", base) if pages else base
+        # same ids / metadata as chunks_pdfs.process_one_file
+        self.store().put_chunks(doc_id, [
+            {**c, "doc_id": doc_id, "source_file": file_name, "chunk_id": f"{base}-{i:04d}"}
+            for i, c in enumerate(chunks)
+        ])
+
+    def process_document(self, source_path: str, filename: str, ocr_pool):
+        from text_extract_with_ocr import hash_path_for
+
+        base = os.path.splitext(filename)[0]
+        extracted = os.path.join(self.paths["extracted"], base + ".json")
+        extracted_cache = self.run_extract(source_path, filename, ocr_pool)
+        outputs = self.run_chunk(extracted, base)
+        with self.lock:
+            self.state["docs"][source_path] = {
+                "collection": self.collection,
+                "extracted": [extracted, hash_path_for(extracted)],
+                "chunks": outputs,
+                "extract_cache": extracted_cache,
+            }
+
+    def run_embed(self):
+        import embeddings_huggingface as indexer
+
+        indexer.use_collection(self.collection)
+        # incremental: only chunk files whose hash changed are embedded.
+        # the file lock also keeps out uploads handled by other API worker processes
+        with indexer.update_lock():
+            indexer.update_embeddings()
+
+    # ---------- driver ----------
+    def sources(self):
+        found = []
+        for folder, exts in ((self.paths["pdfs"], (".pdf",)), (self.paths["images"], IMAGE_EXTENSIONS)):
+            if os.path.isdir(folder):
+                found += [(os.path.join(folder, f), f) for f in sorted(os.listdir(folder)) if f.lower().endswith(exts)]
+        return found
+
+    def remove_vanished(self, current_paths):
+        """drops the outputs of documents that were deleted from the input folders"""
+        ours = [p for p, doc in self.state["docs"].items() if doc.get("collection", "default") == self.collection]
+        for path in [p for p in ours if p not in current_paths]:
+            doc = self.state["docs"].pop(path)
+            for out in doc.get("chunks", []) + doc.get("extracted", []):
+                if os.path.exists(out):
+                    os.remove(out)
+            self.stats["removed"] += 1
+        self.state["hashes"] = {p: h for p, h in self.state["hashes"].items() if os.path.exists(p)}
+
+    def run(self, embed: bool = True):
+        t0 = time.perf_counter()
+        sources = self.sources()
+        failed = []
+        with ProcessPoolExecutor(max_workers=self.ocr_workers) as ocr_pool, \
+                ThreadPoolExecutor(max_workers=self.doc_workers) as docs:
+            futures = {docs.submit(self.process_document, path, name, ocr_pool): name for path, name in sources}
+            for future, name in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(name)
+                    print(f"❌ {name}: {e}")
+        self.remove_vanished({path for path, _ in sources})
+        self._save_state()
+
+        s = self.stats
+        print(f"📄 extract: {s['extract_run']} run, {s['extract_cached']} cached")
+        print(f"✂️  chunk ({self.chunk_method}): {s['chunk_run']} run, {s['chunk_cached']} cached")
+        if s["removed"]:
+            print(f"🗑️  {s['removed']} removed document(s)")
+        if embed:
+            print("🧮 embed")
+            self.run_embed()
+        print(f"✅ pipeline done in {time.perf_counter() - t0:.1f}s"
+              + (f", {len(failed)} failed: {failed}" if failed else ""))
+        return failed
+
+
+def ingest_document(source_path: str, filename: str, collection: str = "default",
+                    chunk_method: str = "semantic", ocr_threads: int = 1):
+    """
+    extract + chunk one document (the API's upload queue, see ingest_queue.py); returns the
+    chunk files written. doesn't touch STATE_FILE, the next full run records the document
+    (its stage outputs are cache hits by then)
+    """
+    pipeline = Pipeline(chunk_method, doc_workers=1, collection=collection)
+    # tesseract runs as its own process, so threads are enough to drive it
+    with ThreadPoolExecutor(max_workers=ocr_threads) as ocr_pool:
+        pipeline.process_document(source_path, filename, ocr_pool)
+    return pipeline.state["docs"][source_path]["chunks"]
+
+
+def embed_documents(collection: str = "default"):
+    """incremental index update for everything chunked so far in a collection"""
+    Pipeline(collection=collection).run_embed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extract -> chunk -> embed, re-running only what changed")
+    parser.add_argument("--chunk-method", choices=CHUNK_METHODS, default="semantic")
+    parser.add_argument("--workers", type=int, default=DOC_WORKERS, help="documents processed at the same time")
+    parser.add_argument("--force", action="store_true", help="ignore cached stage outputs")
+    parser.add_argument("--no-embed", action="store_true", help="stop after chunking")
+    parser.add_argument("--collection", default="default", help="see collection_registry.py")
+    args = parser.parse_args()
+
+    failed = Pipeline(args.chunk_method, args.workers, args.force, args.collection).run(embed=not args.no_embed)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
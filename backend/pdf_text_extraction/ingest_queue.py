@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("rag.ingest")
+
+
+class QueueFull(Exception):
+    pass
+
+
+def limit_worker(threads: int, niceness: int):
+    """
+    runs in every ingest process before its first job: caps the threads torch, OpenMP
+    (tesseract) and pdf2image may use and lowers the CPU priority, so ingestion only
+    gets the cores the serving process leaves idle
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["OMP_THREAD_LIMIT"] = str(threads)  # tesseract
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    import text_extract_with_ocr
+    text_extract_with_ocr.OCR_WORKERS = threads
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+class IngestJob:
+    def __init__(self, filename: str, path: str, collection: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.collection = collection
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = None
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "collection": self.collection,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestQueue:
+    """
+    runs uploaded documents through ingestion in separate processes:
+
+      - prepare_fn(path, filename, collection) (extract + chunk) runs in a pool of
+        `max_workers` processes, each limited to `threads` threads at nice `niceness`
+      - embed_fn(collection) (the incremental index update) runs in the same pool, one at
+        a time in this process; embed_fn must also lock the collection's index against
+        other processes (ingest_pipeline.embed_documents holds a file lock)
+      - on_indexed(job) runs afterwards in this process (e.g. swapping in the new index)
+
+    at most `max_pending` jobs are queued or running, submit() raises QueueFull beyond that.
+    the pool is started by the first submit
+    """
+
+    def __init__(self, prepare_fn: Callable[[str, str, str], Any], embed_fn: Callable[[str], Any],
+                 on_indexed: Optional[Callable[[IngestJob], Any]] = None,
+                 max_workers: int = 1, threads: int = 1, niceness: int = 10,
+                 max_pending: int = 16, keep_finished: int = 200):
+        self.prepare_fn = prepare_fn
+        self.embed_fn = embed_fn
+        self.on_indexed = on_indexed
+        self.max_workers = max(1, max_workers)
+        self.threads = max(1, threads)
+        self.niceness = niceness
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+
+        self._lock = threading.Lock()
+        # this process only, so pool workers don't queue up on the file lock; other API
+        # processes are kept out by embed_fn's file lock (see file_lock.require_file_lock)
+        self._embed_lock = threading.Lock()
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._pool = None
+        self._runners = None
+        self.completed = 0
+        self.failed = 0
+
+    def _start(self):
+        if self._pool is None:
+            # spawn, not fork: the serving process has threads (and torch) running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=limit_worker,
+                initargs=(self.threads, self.niceness),
+            )
+            # these only wait on the pool
+            self._runners = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rag-ingest")
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+
+    def submit(self, filename: str, path: str, collection: str = "default") -> IngestJob:
+        with self._lock:
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} documents are already being ingested")
+            self._start()
+            job = IngestJob(filename, path, collection)
+            self._jobs[job.id] = job
+            self._forget_old()
+        self._runners.submit(self._run, job)
+        return job
+
+    def _forget_old(self):
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob):
+        job.status, job.started_at = "running", time.time()
+        try:
+            job.stage = "extract+chunk"
+            chunk_files = self._pool.submit(self.prepare_fn, job.path, job.filename, job.collection).result()
+            job.result = {"chunk_files": chunk_files}
+            job.stage = "embed"
+            with self._embed_lock:
+                self._pool.submit(self.embed_fn, job.collection).result()
+            if self.on_indexed is not None:
+                job.stage = "reload"
+                job.result["index"] = self.on_indexed(job)
+            job.status = "done"
+            self.completed += 1
+        except Exception as e:
+            logger.exception("ingesting %s failed in stage %s", job.filename, job.stage)
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            self.failed += 1
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def shutdown(self):
+        """drops queued jobs; a job already in a worker process is left to finish"""
+        if self._pool is None:
+            return
+        self._runners.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._runners = None
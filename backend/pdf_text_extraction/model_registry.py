@@ -0,0 +1,180 @@
+"""
+one place that loads models: each (kind, name, options) is loaded once per process,
+on first use, and shared by everything that asks for it.
+
+    from model_registry import get_embeddings, get_generator
+    llm = get_generator("google/flan-t5-base")      # loads now
+    llm = lazy_generator("google/flan-t5-base")     # loads on first call / attribute access
+
+multi-worker serving: call preload_for_fork() in the parent before workers are forked
+(e.g. gunicorn --preload -k uvicorn.workers.UvicornWorker app:app) so every worker
+shares the same weight pages copy-on-write instead of loading its own copy.
+"""
+import gc
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("rag.models")
+
+_models: Dict[Tuple, Any] = {}
+_key_locks: Dict[Tuple, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _key(kind: str, name: str, options: Dict) -> Tuple:
+    return (kind, name, tuple(sorted(options.items())))
+
+
+def _get_or_load(key: Tuple, loader: Callable[[], Any]) -> Any:
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _key_locks.setdefault(key, threading.Lock())
+    # per-model lock: two threads asking for the same model load it once,
+    # different models can load in parallel
+    with lock:
+        model = _models.get(key)
+        if model is None:
+            t0 = time.perf_counter()
+            model = loader()
+            _models[key] = model
+            logger.info("loaded %s %s in %.1fs", key[0], key[1], time.perf_counter() - t0)
+    return model
+
+
+# ===============================
+# LOADERS
+# ===============================
+def get_embeddings(model_name: str, backend: str = "torch", **options) -> Embeddings:
+    """LangChain HuggingFaceEmbeddings; backend is "torch", "int8" or "onnx" (see inference_backends.py)"""
+    def load():
+        from inference_backends import load_embeddings
+        return load_embeddings(model_name, backend, **options)
+    return _get_or_load(_key("embeddings", model_name, {**options, "backend": backend}), load)
+
+
+def get_sentence_transformer(model_name: str, **options):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, **options)
+    return _get_or_load(_key("sentence_transformer", model_name, options), load)
+
+
+def get_tokenizer(model_name: str):
+    """the model's fast (Rust) tokenizer, which gives the character offsets of every token"""
+    def load():
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        if not tokenizer.is_fast:
+            raise ValueError(f"{model_name} has no fast tokenizer (needed for offset mappings)")
+        return tokenizer
+    return _get_or_load(_key("tokenizer", model_name, {}), load)
+
+
+def get_generator(model_name: str, task: str = "text2text-generation", backend: str = "torch", **options):
+    """
+    transformers pipeline; defaults to CPU (device=-1) unless device/device_map is given.
+    backend is "torch", "int8" or "onnx" (see inference_backends.py)
+    """
+    if "device" not in options and "device_map" not in options:
+        options["device"] = -1
+
+    def load():
+        from inference_backends import load_generator
+        return load_generator(model_name, task, backend, **options)
+    return _get_or_load(_key(task, model_name, {**options, "backend": backend}), load)
+
+
+def get_cross_encoder(model_name: str, device: str = "cpu"):
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device=device)
+    return _get_or_load(_key("cross_encoder", model_name, {"device": device}), load)
+
+
+def get_qa_reader(model_name: str, device: int = -1, backend: str = "torch"):
+    """extractive question-answering pipeline (its tokenizer is .tokenizer)"""
+    return get_generator(model_name, task="question-answering", backend=backend, device=device)
+
+
+# ===============================
+# LAZY HANDLES
+# ===============================
+class LazyModel:
+    """stands in for a model until it is first called or an attribute is read"""
+
+    def __init__(self, loader: Callable[[], Any]):
+        self._loader = loader
+
+    def __call__(self, *args, **kwargs):
+        return self._loader()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._loader(), name)
+
+
+def lazy_generator(model_name: str, task: str = "text2text-generation", backend: str = "torch",
+                   **options) -> LazyModel:
+    return LazyModel(lambda: get_generator(model_name, task, backend, **options))
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings object that loads the model on the first embed call"""
+
+    def __init__(self, model_name: str, backend: str = "torch", **options):
+        self.model_name = model_name
+        self.backend = backend
+        self.options = options
+
+    def _model(self) -> Embeddings:
+        return get_embeddings(self.model_name, self.backend, **self.options)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model().embed_query(text)
+
+
+# ===============================
+# WARM-UP / FORK
+# ===============================
+def loaded_models() -> List[Tuple[str, str]]:
+    return [(kind, name) for kind, name, _ in _models]
+
+
+def warmup():
+    """one tiny forward pass through every loaded model (first-call allocations, lazy init)"""
+    for (kind, name, _), model in list(_models.items()):
+        t0 = time.perf_counter()
+        if kind == "embeddings":
+            model.embed_query("warm up")
+        elif kind == "sentence_transformer":
+            model.encode(["warm up"])
+        elif kind == "cross_encoder":
+            model.predict([("warm up", "warm up")])
+        elif kind == "question-answering":
+            model({"question": "warm up?", "context": "warm up"})
+        else:
+            model("warm up", max_new_tokens=1)
+        logger.info("warmed up %s %s in %.2fs", kind, name, time.perf_counter() - t0)
+
+
+def preload_for_fork(*loaders: Callable[[], Any]):
+    """
+    load models in the parent process before workers fork, so their weights are
+    shared copy-on-write. gc.freeze() moves everything loaded so far out of the
+    garbage collector's reach, so collections in the workers don't touch (and
+    thereby copy) those pages.
+    don't warm up here: running torch ops before fork can leave OpenMP thread
+    pools in a bad state in the children - call warmup() in each worker instead.
+    """
+    for load in loaders:
+        load()
+    gc.collect()
+    gc.freeze()
@@ -1,9 +1,10 @@
 import os
 from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
+
+from model_registry import get_embeddings
 
 # Step 1: Reload embeddings (using Hugging Face model)
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+embeddings = get_embeddings("sentence-transformers/all-MiniLM-L6-v2")
 
 # Load FAISS index you already created
 vectorstore = FAISS.load_local("embeddings/faiss_index", embeddings, allow_dangerous_deserialization=True)
@@ -1,12 +1,12 @@
 import os
 from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
-from transformers import pipeline
+
+from model_registry import get_embeddings, get_generator
 
 
 def main():
     # Step 1: Reload embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1")
+    embeddings = get_embeddings("sentence-transformers/multi-qa-mpnet-base-dot-v1")
     vectorstore = FAISS.load_local("embeddings_forqa_huggingface/faiss_index", embeddings, allow_dangerous_deserialization=True)
 
     # Step 2: Ask query from terminal
@@ -19,10 +19,9 @@ def main():
     citations = [doc.metadata for doc in results]
 
     # Step 4: Load a lightweight Hugging Face LLM (runs fine on CPU)
-    llm = pipeline(
-        "text2text-generation",
-        model="google/flan-t5-base",   # 👈 small model, fast on CPU
-        device=-1                     # force CPU
+    llm = get_generator(
+        "google/flan-t5-base",   # 👈 small model, fast on CPU
+        device=-1                # force CPU
     )
 
     # Step 5: Create a RAG-style prompt
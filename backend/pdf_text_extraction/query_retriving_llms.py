@@ -1,11 +1,12 @@
 import os
 from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
-from transformers import pipeline
+
+from generation_policy import apply_stop_sequences, generation_kwargs
+from model_registry import get_embeddings, get_generator
 
 def main():
     # Step 1: Reload embeddings (Hugging Face model for embeddings)
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    embeddings = get_embeddings("sentence-transformers/all-MiniLM-L6-v2")
 
     # Load FAISS index (make sure this path matches your index)
     vectorstore = FAISS.load_local("embeddings/faiss_index", embeddings, allow_dangerous_deserialization=True)
@@ -20,11 +21,10 @@ def main():
     citations = [doc.metadata for doc in results]
 
     # Step 4: Hugging Face LLM (you can change to mistral/falcon/llama2 etc.)
-    llm = pipeline(
-        "text-generation",
-        model="tiiuae/falcon-7b-instruct",   # <--- change model if needed
+    llm = get_generator(
+        "tiiuae/falcon-7b-instruct",   # <--- change model if needed
+        task="text-generation",
         device_map="auto",
-        max_new_tokens=300
     )
 
     # Step 5: Create a RAG-style prompt
@@ -39,11 +39,11 @@ Question: {query}
 
 Answer:"""
 
-    # Step 6: Generate answer
-    response = llm(prompt, max_new_tokens=300, do_sample=True, temperature=0.3)
+    # Step 6: Generate answer (greedy, budget by question type, stops before a new "Question:")
+    response = llm(prompt, return_full_text=False, **generation_kwargs([query], llm.tokenizer))
 
     print("\n=== Final Answer ===")
-    print(response[0]["generated_text"].split("Answer:")[-1].strip())
+    print(apply_stop_sequences(response[0]["generated_text"]))
 
     print("\n=== Sources ===")
     for idx, src in enumerate(citations, 1):
@@ -2,17 +2,12 @@
 import os
 from typing import List, Tuple
 from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
 
-from sentence_transformers import CrossEncoder
-from transformers import AutoTokenizer, AutoModelForQuestionAnswering, pipeline
+from context_builder import truncate_to_tokens
+from model_registry import get_embeddings, get_qa_reader
+from reranking import Reranker
 
 # ---------- Helpers ----------
-def truncate_to_tokens(text: str, tokenizer, max_tokens: int) -> str:
-    """Trim text to fit the model's max input length."""
-    ids = tokenizer.encode(text, add_special_tokens=False, truncation=True, max_length=max_tokens)
-    return tokenizer.decode(ids, skip_special_tokens=True)
-
 def pretty_src(meta: dict) -> str:
     """Compact source print (customize for your metadata keys)."""
     # common keys: 'source', 'page', 'file', 'path'
@@ -26,7 +21,7 @@ def pretty_src(meta: dict) -> str:
 def main():
     # 1) Load the same embedding model you used to build the FAISS index
     # If you embedded with another model, switch it here to match exactly.
-    embed = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    embed = get_embeddings("sentence-transformers/all-MiniLM-L6-v2")
 
     # 2) Load FAISS index
     vectorstore = FAISS.load_local(
@@ -39,21 +34,17 @@ def main():
     query = input("Enter your query: ").strip()
 
     # 4) Retrieve more than you need, we’ll rerank and keep top-3
-    retrieved_docs = vectorstore.similarity_search(query, k=8)
+    retrieved = vectorstore.similarity_search_with_score(query, k=8)
 
     # 5) Re-rank with a CPU-friendly cross-encoder (boosts accuracy a lot)
-    reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2", device="cpu")
-    pairs = [(query, d.page_content) for d in retrieved_docs]
-    scores = reranker.predict(pairs)  # higher = more relevant
-    reranked = sorted(zip(retrieved_docs, scores), key=lambda x: x[1], reverse=True)[:3]
-    top_docs = [d for d, _ in reranked]
+    reranker = Reranker("cross-encoder/ms-marco-MiniLM-L-6-v2", top_n=3, device="cpu")
+    top_docs = [d for d, _ in reranker.rerank_batch([query], [retrieved])[0]]
 
     # 6) CPU extractive reader (accurate, small)
     # qa_model_name = "deepset/roberta-base-squad2"
     qa_model_name = "deepset/roberta-base-squad2"
-    qa_tok = AutoTokenizer.from_pretrained(qa_model_name)
-    qa_model = AutoModelForQuestionAnswering.from_pretrained(qa_model_name)
-    qa = pipeline("question-answering", model=qa_model, tokenizer=qa_tok, device=-1)
+    qa = get_qa_reader(qa_model_name, device=-1)
+    qa_tok = qa.tokenizer
 
     # roberta-base-squad2 has 512-token limit; reserve ~112 for question + special tokens
     MAX_CTX_TOKENS = 400
@@ -0,0 +1,69 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from model_registry import get_cross_encoder
+
+DEFAULT_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class Reranker:
+    """
+    rescores retrieved chunks with a cross-encoder: all (query, chunk) pairs of a batch
+    go through one predict call, each query keeps its top_n chunks scoring at least
+    min_score (but never fewer than min_keep, so the prompt isn't left empty)
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, top_n: int = 3,
+                 min_score: Optional[float] = None, min_keep: int = 1,
+                 batch_size: int = 32, device: str = "cpu"):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.min_score = min_score
+        self.min_keep = min_keep
+        self.batch_size = batch_size
+        self.device = device
+        # running estimate of the cost of one pair, used by fits()
+        self.seconds_per_pair: Optional[float] = None
+        self.runs = 0
+        self.skipped = 0
+
+    def load(self):
+        return get_cross_encoder(self.model_name, device=self.device)
+
+    def fits(self, n_pairs: int, remaining_s: float) -> bool:
+        """would scoring n_pairs finish within remaining_s? (unknown cost -> try it)"""
+        if remaining_s <= 0:
+            return False
+        if self.seconds_per_pair is None:
+            return True
+        return n_pairs * self.seconds_per_pair <= remaining_s
+
+    def rerank_batch(self, queries: Sequence[str],
+                     hits_per_query: Sequence[List[Tuple[Document, float]]]) -> List[List[Tuple[Document, float]]]:
+        """returns, per query, (Document, cross-encoder score) sorted best first"""
+        pairs = [(q, doc.page_content) for q, hits in zip(queries, hits_per_query) for doc, _ in hits]
+        if not pairs:
+            return [[] for _ in queries]
+
+        t0 = time.perf_counter()
+        scores = self.load().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        per_pair = (time.perf_counter() - t0) / len(pairs)
+        self.seconds_per_pair = per_pair if self.seconds_per_pair is None else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+        self.runs += 1
+
+        results, start = [], 0
+        for hits in hits_per_query:
+            scored = sorted(((doc, float(s)) for (doc, _), s in zip(hits, scores[start:start + len(hits)])),
+                            key=lambda x: x[1], reverse=True)
+            start += len(hits)
+            results.append(self.select(scored))
+        return results
+
+    def select(self, scored: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        kept = scored[: self.top_n]
+        if self.min_score is not None:
+            above = [(doc, s) for doc, s in kept if s >= self.min_score]
+            kept = above if len(above) >= self.min_keep else kept[: self.min_keep]
+        return kept
@@ -0,0 +1,299 @@
+import json
+import logging
+import math
+import os
+import pickle
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from bm25_index import reciprocal_rank_fusion
+from corpus_store import DOCSTORE_FILE, SqliteDocstore
+
+logger = logging.getLogger("rag.retrieval")
+
+# filters matching at most this many vectors are searched exactly (brute force over just
+# those vectors); larger ones search the index with an IDSelector
+EXACT_FILTER_MAX = 4096
+# written last by save_vectorstore: which index.faiss / index.pkl / docstore belong together
+STAMP_FILE = "index.stamp"
+STAMPED_FILES = ("index.faiss", "index.pkl", DOCSTORE_FILE)
+LOAD_ATTEMPTS = 5
+
+
+def read_index_mmap(path: str):
+    """
+    memory-maps a FAISS index file read-only: vectors (flat / HNSW storage, IVF lists)
+    stay in the OS page cache and are shared by every process that maps the same file.
+    falls back to a normal read on FAISS builds without mmap support for this index type
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError as e:
+        logger.warning("can't memory-map %s (%s), reading it into memory", path, e)
+        return faiss.read_index(path)
+
+
+def save_vectorstore(vectorstore: FAISS, index_path: str):
+    """
+    save_local, but every file is swapped in with a rename: processes that memory-map
+    the old index.faiss keep a valid file (overwriting it in place would crash them)
+    and a reloading server never reads a half-written one.
+    a SqliteDocstore built elsewhere (staged_docstore_path) is renamed in along with the index.
+    the renames are separate, so the stamp written after them is what tells a loader
+    that the files it read are one version (load_vectorstore)
+    """
+    tmp_dir = index_path.rstrip("/\\") + ".saving"
+    live_docstore = os.path.join(index_path, DOCSTORE_FILE)
+    staged = None
+    if (isinstance(vectorstore.docstore, SqliteDocstore)
+            and os.path.abspath(vectorstore.docstore.path) != os.path.abspath(live_docstore)):
+        staged = vectorstore.docstore.path
+        vectorstore.docstore.close()
+        vectorstore.docstore = SqliteDocstore(live_docstore)  # the path that gets pickled
+    vectorstore.save_local(tmp_dir)
+    os.makedirs(index_path, exist_ok=True)
+    if staged is not None:
+        os.replace(staged, live_docstore)
+    for name in ("index.faiss", "index.pkl"):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(index_path, name))
+    os.rmdir(tmp_dir)
+    stamp_tmp = os.path.join(index_path, STAMP_FILE + ".tmp")
+    with open(stamp_tmp, "w") as f:
+        json.dump(_file_ids(index_path), f)
+    os.replace(stamp_tmp, os.path.join(index_path, STAMP_FILE))
+
+
+def _file_ids(index_path: str) -> Dict[str, List[int]]:
+    """(inode, size, mtime) of the stamped files; a rename keeps all three, a new version changes them"""
+    ids = {}
+    for name in STAMPED_FILES:
+        try:
+            st = os.stat(os.path.join(index_path, name))
+        except FileNotFoundError:
+            continue
+        ids[name] = [st.st_ino, st.st_size, st.st_mtime_ns]
+    return ids
+
+
+def _read_stamp(index_path: str) -> Optional[Dict[str, List[int]]]:
+    try:
+        with open(os.path.join(index_path, STAMP_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None  # saved before stamps existed
+
+
+def staged_docstore_path(index_path: str) -> str:
+    """where builders write the next docstore while the current one is being served"""
+    return os.path.join(index_path, DOCSTORE_FILE + ".next")
+
+
+def load_vectorstore(index_path: str, embeddings, mmap: bool = True, read_index: bool = True) -> FAISS:
+    """
+    FAISS.load_local, optionally with a memory-mapped (read-only) index, or without
+    reading index.faiss at all (read_index=False: index is None, for servers that
+    search shards).
+    a SQLite docstore is re-pointed at the folder it was loaded from, so index
+    folders can be moved or copied, and pinned to the file that was there.
+    retries while a save is swapping files in, so the index, pickle and docstore
+    are always of the same version
+    """
+    for attempt in range(LOAD_ATTEMPTS):
+        before = _file_ids(index_path)
+        vectorstore = _load_vectorstore(index_path, embeddings, mmap, read_index)
+        after = _file_ids(index_path)
+        stamp = _read_stamp(index_path)
+        if before == after and (stamp is None or stamp == after):
+            return vectorstore
+        if isinstance(vectorstore.docstore, SqliteDocstore):
+            vectorstore.docstore.close()
+        logger.info("%s changed while loading (a save is in progress), retrying", index_path)
+        time.sleep(0.2 * (attempt + 1))
+    raise RuntimeError(f"{index_path} kept changing while loading, no consistent version to read")
+
+
+def _load_vectorstore(index_path: str, embeddings, mmap: bool, read_index: bool) -> FAISS:
+    if read_index and not mmap:
+        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    else:
+        index = read_index_mmap(os.path.join(index_path, "index.faiss")) if read_index else None
+        with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vectorstore = FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    if isinstance(vectorstore.docstore, SqliteDocstore):
+        vectorstore.docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILE))
+        vectorstore.docstore.pin()
+    else:
+        logger.warning("%s has a pickled in-memory docstore; run embeddings_huggingface.py "
+                       "to move it to SQLite so workers share it", index_path)
+    return vectorstore
+
+
+# ---------- metadata pre-filtering ----------
+def source_key(source: str) -> str:
+    """"report.pdf", "report.json" and "report" all name the same document"""
+    return os.path.splitext(os.path.basename(source or ""))[0].lower()
+
+
+class MetadataIndex:
+    """
+    source document and page span of every vector (by FAISS position), so a metadata
+    filter turns into the set of positions to search before the search runs
+    """
+
+    def __init__(self, sources: Dict[str, np.ndarray], page_first: np.ndarray, page_last: np.ndarray):
+        self.sources = sources
+        self.page_first = page_first  # -1 = chunk without page info
+        self.page_last = page_last
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "MetadataIndex":
+        docstore = vectorstore.docstore
+        if isinstance(docstore, SqliteDocstore):
+            metadata = dict(docstore.iter_metadata())  # one query instead of one per chunk
+        else:
+            metadata = {doc_id: getattr(docstore.search(doc_id), "metadata", {})
+                        for doc_id in vectorstore.index_to_docstore_id.values()}
+        n = vectorstore.index.ntotal
+        by_source = defaultdict(list)
+        first = np.full(n, -1, dtype=np.int32)
+        last = np.full(n, -1, dtype=np.int32)
+        for pos, doc_id in vectorstore.index_to_docstore_id.items():
+            meta = metadata.get(doc_id) or {}
+            by_source[source_key(meta.get("source"))].append(pos)
+            if meta.get("page_range"):
+                first[pos], last[pos] = meta["page_range"]
+        return cls({name: np.asarray(p, dtype=np.int64) for name, p in by_source.items()}, first, last)
+
+    def select(self, sources: Optional[Sequence[str]] = None, page_from: Optional[int] = None,
+               page_to: Optional[int] = None) -> np.ndarray:
+        """
+        sorted FAISS positions of the chunks from any of `sources` that overlap the page
+        range [page_from, page_to] (either end may be open); chunks without page info
+        never match a page range
+        """
+        mask = np.ones(len(self.page_first), dtype=bool)
+        if sources:
+            mask[:] = False
+            for source in sources:
+                positions = self.sources.get(source_key(source))
+                if positions is not None:
+                    mask[positions] = True
+        if page_from is not None or page_to is not None:
+            mask &= self.page_first >= 0
+            if page_from is not None:
+                mask &= self.page_last >= page_from
+            if page_to is not None:
+                mask &= self.page_first <= page_to
+        return np.flatnonzero(mask)
+
+
+def _filtered_search(index, vectors: np.ndarray, k: int, allowed: np.ndarray):
+    """index.search restricted to the positions in `allowed`"""
+    if len(allowed) <= EXACT_FILTER_MAX:
+        try:
+            candidates = index.reconstruct_batch(allowed)
+        except RuntimeError:
+            candidates = None  # e.g. IVF without a direct map
+        if candidates is not None:
+            scores, rows = faiss.knn(vectors, candidates, min(k, len(allowed)), metric=index.metric_type)
+            indices = np.where(rows >= 0, allowed[np.maximum(rows, 0)], -1)
+            return scores, indices
+
+    selector = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(np.ascontiguousarray(allowed, dtype=np.int64)))
+    if hasattr(index, "hnsw"):
+        # the graph walk only counts selected nodes, widen it in proportion to what's filtered out
+        widen = index.ntotal / len(allowed)
+        params = faiss.SearchParametersHNSW(
+            sel=selector, efSearch=int(min(16 * index.hnsw.efSearch, math.ceil(index.hnsw.efSearch * widen))))
+    else:
+        try:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+        except RuntimeError:
+            params = faiss.SearchParameters(sel=selector)
+    return index.search(vectors, k, params=params)
+
+
+def batch_vector_search_ids(vectorstore, query_vectors: List[List[float]],
+                            k: int = 3, allowed: Optional[np.ndarray] = None,
+                            searcher=None) -> List[List[Tuple[str, float]]]:
+    """
+    runs one FAISS search for a whole batch of query vectors, only over the
+    positions in `allowed` (MetadataIndex.select) when given; with a `searcher`
+    (sharded_index.ShardedSearcher) the shards are searched instead of the full index
+    returns, per query, a list of (docstore id, score)
+    """
+    if len(query_vectors) == 0:
+        return []
+    if allowed is not None and len(allowed) == 0:
+        return [[] for _ in query_vectors]
+    vectors = np.asarray(query_vectors, dtype="float32")
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+
+    if searcher is not None:
+        scores, indices = searcher.search(vectors, k, allowed)
+    elif allowed is None:
+        scores, indices = vectorstore.index.search(vectors, k)
+    else:
+        scores, indices = _filtered_search(vectorstore.index, vectors, k, allowed)
+
+    results = []
+    for row_scores, row_ids in zip(scores, indices):
+        results.append([
+            (vectorstore.index_to_docstore_id[int(i)], float(score))
+            for score, i in zip(row_scores, row_ids)
+            if i != -1  # fewer than k vectors in the index
+        ])
+    return results
+
+
+def lookup_documents(vectorstore, hits: List[Tuple[str, float]]) -> List[Tuple[Document, float]]:
+    docs = []
+    for doc_id, score in hits:
+        doc = vectorstore.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append((doc, score))
+    return docs
+
+
+def batch_similarity_search(vectorstore, query_vectors: List[List[float]],
+                            k: int = 3, allowed: Optional[np.ndarray] = None,
+                            searcher=None) -> List[List[Tuple[Document, float]]]:
+    """
+    batched version of similarity_search_with_score
+    returns, per query, a list of (Document, score)
+    """
+    return [lookup_documents(vectorstore, hits)
+            for hits in batch_vector_search_ids(vectorstore, query_vectors, k, allowed, searcher)]
+
+
+def batch_hybrid_search(vectorstore, bm25, queries: List[str], query_vectors: List[List[float]],
+                        k: int = 3, candidates: int = 20, rrf_k: int = 60,
+                        allowed: Optional[np.ndarray] = None, searcher=None) -> List[List[Tuple[Document, float]]]:
+    """
+    vector + BM25 retrieval merged with reciprocal rank fusion;
+    each retriever contributes its top `candidates`, the fused top-k is returned
+    with the RRF score. `allowed` restricts both retrievers to the same chunks
+    """
+    vector_hits = batch_vector_search_ids(vectorstore, query_vectors, candidates, allowed, searcher)
+    bm25_allowed = None
+    if allowed is not None:
+        bm25_allowed = bm25.positions(vectorstore.index_to_docstore_id[int(i)] for i in allowed)
+    results = []
+    for query, v_hits in zip(queries, vector_hits):
+        lexical_hits = bm25.search(query, candidates, allowed=bm25_allowed)
+        fused = reciprocal_rank_fusion([
+            [doc_id for doc_id, _ in v_hits],
+            [doc_id for doc_id, _ in lexical_hits],
+        ], k=rrf_k)
+        results.append(lookup_documents(vectorstore, fused[:k]))
+    return results
@@ -37,7 +37,7 @@ for filename in os.listdir(pdf_folder):
         # Save JSON for this PDF
         output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.json")
         with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(extracted_data, f, indent=4, ensure_ascii=False)
+            json.dump(extracted_data, f, ensure_ascii=False)
         
         print(f"✅ Saved extracted text to {output_file}")
 
@@ -0,0 +1,352 @@
+"""
+the FAISS index split into N shards by source document, searched in parallel:
+
+    faiss_index/shards/manifest.json        shard list + which index version they were cut from
+    faiss_index/shards/shard_000.faiss      the vectors of the documents hashed to shard 0
+    faiss_index/shards/shard_000.ids.npy    their positions in the full index (sorted)
+
+a query batch goes to every shard at once (one thread per shard in this process, or one
+local worker process per shard) and the per-shard top-k lists are merged with a heap.
+results are positions in the full index, so index_to_docstore_id, the docstore, BM25 and
+metadata filters work unchanged, and a server using the shards doesn't load the full
+index at all (ShardSetIndex stands in for it). build the shards with
+    python embeddings_huggingface.py --shards 4
+and measure the fan-out against the single index with
+    python sharded_index.py --mode processes
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import DEFAULT_INDEX_PATH, apply_search_params, build_ann_index, index_type_of, index_vectors
+from retrieval import _filtered_search, read_index_mmap
+
+logger = logging.getLogger("rag.shards")
+
+# ===============================
+# CONFIG
+# ===============================
+SHARDS_DIR = "shards"  # inside the FAISS index folder
+MANIFEST_FILE = "manifest.json"
+SEARCH_MODES = ("threads", "processes")
+# shards with fewer vectors get a flat index whatever --index-type says: too few to train
+# IVF cells / PQ codebooks on, and a flat scan that small is about as fast anyway
+ANN_SHARD_MIN_VECTORS = 10000
+
+
+def shard_dir(index_path: str) -> str:
+    return os.path.join(index_path, SHARDS_DIR)
+
+
+def source_of(doc_id: str) -> str:
+    """docstore ids are "<chunk file>::<index>" (embeddings_huggingface.chunk_doc_id)"""
+    return doc_id.rsplit("::", 1)[0]
+
+
+def shard_of(source: str, n_shards: int) -> int:
+    """stable across runs and processes (unlike hash())"""
+    return int(hashlib.sha1(source.encode("utf-8")).hexdigest()[:8], 16) % n_shards
+
+
+def ids_digest(index_to_docstore_id: Dict[int, str]) -> str:
+    """identifies the full index the shards were cut from (ids in position order)"""
+    h = hashlib.sha256()
+    for pos in range(len(index_to_docstore_id)):
+        h.update(index_to_docstore_id[pos].encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+# ===============================
+# BUILD
+# ===============================
+def _replace_with(path: str, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_shards(vectorstore, index_path: str, n_shards: int, index_type: str = "flat",
+                 ann_params: Optional[Dict] = None, min_ann_vectors: int = ANN_SHARD_MIN_VECTORS) -> Dict:
+    """
+    cuts the saved index into n_shards; all chunks of a document land in the same shard.
+    each shard is an index of the same type, trained on its own vectors, except shards
+    under min_ann_vectors, which are flat. the manifest is written last, so a server
+    never picks up half a set of shards
+    """
+    vectors = index_vectors(vectorstore.index)
+    n = len(vectors)
+    assignment = np.fromiter(
+        (shard_of(source_of(vectorstore.index_to_docstore_id[pos]), n_shards) for pos in range(n)),
+        dtype=np.int64, count=n,
+    )
+    folder = shard_dir(index_path)
+    os.makedirs(folder, exist_ok=True)
+    shards = []
+    for s in range(n_shards):
+        positions = np.flatnonzero(assignment == s)
+        if index_type == "flat" or len(positions) < min_ann_vectors:
+            index = faiss.IndexFlat(vectors.shape[1], vectorstore.index.metric_type)
+            index.add(vectors[positions])
+        else:
+            index = build_ann_index(vectors[positions], index_type, **(ann_params or {}))
+        name = f"shard_{s:03d}"
+        _replace_with(os.path.join(folder, f"{name}.faiss"), lambda tmp: faiss.write_index(index, tmp))
+        with open(os.path.join(folder, f"{name}.ids.npy.tmp"), "wb") as f:
+            np.save(f, positions)
+        os.replace(os.path.join(folder, f"{name}.ids.npy.tmp"), os.path.join(folder, f"{name}.ids.npy"))
+        shards.append({"name": name, "vectors": int(len(positions)), "index_type": index_type_of(index)})
+
+    manifest = {
+        "n_shards": n_shards,
+        "ntotal": n,
+        "dim": int(vectors.shape[1]),
+        "metric_type": int(vectorstore.index.metric_type),
+        "index_type": index_type,
+        "ids_digest": ids_digest(vectorstore.index_to_docstore_id),
+        "shards": shards,
+    }
+
+    def write_manifest(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    _replace_with(os.path.join(folder, MANIFEST_FILE), write_manifest)
+    # shards of an earlier build with more shards
+    keep = {f"{s['name']}{ext}" for s in shards for ext in (".faiss", ".ids.npy")} | {MANIFEST_FILE}
+    for name in os.listdir(folder):
+        if name not in keep:
+            os.remove(os.path.join(folder, name))
+    return manifest
+
+
+def remove_shards(index_path: str):
+    shutil.rmtree(shard_dir(index_path), ignore_errors=True)
+
+
+def load_manifest(index_path: str) -> Optional[Dict]:
+    path = os.path.join(shard_dir(index_path), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ===============================
+# SEARCH
+# ===============================
+def load_shard(index_path: str, name: str, mmap: bool = True, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple:
+    folder = shard_dir(index_path)
+    path = os.path.join(folder, f"{name}.faiss")
+    index = read_index_mmap(path) if mmap else faiss.read_index(path)
+    apply_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    ids = np.load(os.path.join(folder, f"{name}.ids.npy"), mmap_mode="r" if mmap else None)
+    return index, ids
+
+
+def search_shard(index, ids: np.ndarray, vectors: np.ndarray, k: int,
+                 allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """top-k of one shard as (scores, positions in the full index), -1 padded like faiss"""
+    if allowed is not None:
+        # full-index positions -> this shard's rows (both sorted)
+        rows = np.searchsorted(ids, allowed)
+        inside = rows < len(ids)
+        rows = rows[inside]
+        local = rows[ids[rows] == allowed[inside]]
+        if len(local) == 0:
+            return np.zeros((len(vectors), 0), dtype="float32"), np.zeros((len(vectors), 0), dtype=np.int64)
+        scores, found = _filtered_search(index, vectors, k, local.astype(np.int64))
+    elif index.ntotal == 0:
+        return np.zeros((len(vectors), 0), dtype="float32"), np.zeros((len(vectors), 0), dtype=np.int64)
+    else:
+        scores, found = index.search(vectors, min(k, index.ntotal))
+    return scores, np.where(found >= 0, ids[np.maximum(found, 0)], -1)
+
+
+def merge_topk(results: List[Tuple[np.ndarray, np.ndarray]], k: int,
+               descending: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """k-way heap merge of per-shard result lists (each already sorted by score)"""
+    n_queries = len(results[0][0]) if results else 0
+    scores = np.full((n_queries, k), -np.inf if descending else np.inf, dtype="float32")
+    positions = np.full((n_queries, k), -1, dtype=np.int64)
+    for q in range(n_queries):
+        lists = [
+            [(float(s), int(p)) for s, p in zip(shard_scores[q], shard_positions[q]) if p >= 0]
+            for shard_scores, shard_positions in results
+        ]
+        merged = heapq.merge(*lists, key=lambda hit: hit[0], reverse=descending)
+        for j, (score, pos) in enumerate(islice(merged, k)):
+            scores[q, j], positions[q, j] = score, pos
+    return scores, positions
+
+
+# one shard per worker process, loaded by the pool initializer
+_worker_shard = None
+
+
+def _init_worker(index_path: str, name: str, mmap: bool, threads: int, nprobe, ef_search):
+    global _worker_shard
+    faiss.omp_set_num_threads(threads)  # this worker's own OpenMP pool
+    _worker_shard = load_shard(index_path, name, mmap, nprobe, ef_search)
+
+
+def _worker_search(vectors: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+    index, ids = _worker_shard
+    return search_shard(index, ids, vectors, k, allowed)
+
+
+class ShardSetIndex:
+    """
+    stands in for the full index on a vectorstore served from shards: size, dimension and
+    metric for the code that reads them (status, MetadataIndex), no vectors
+    """
+
+    def __init__(self, manifest: Dict):
+        self.ntotal = manifest["ntotal"]
+        self.d = manifest["dim"]
+        self.metric_type = manifest["metric_type"]
+
+    def search(self, *args, **kwargs):
+        raise RuntimeError("this index is served from shards, search it with ShardedSearcher")
+
+
+class ShardedSearcher:
+    """
+    searches every shard concurrently and merges their top-k; search() has the signature
+    and output of index.search (plus `allowed`), with positions in the full index.
+
+      threads    shards are mapped in this process and searched from a thread pool
+                 (faiss releases the GIL); the server's OpenMP setting is left alone,
+                 so threads_per_shard doesn't apply
+      processes  one spawned worker process per shard, each mapping only its shard file
+                 and running threads_per_shard OpenMP threads; stands in for shards on
+                 separate machines
+
+    the shards are only used when their manifest matches the loaded index (see load())
+    """
+
+    def __init__(self, index_path: str, manifest: Dict, mode: str = "threads", mmap: bool = True,
+                 threads_per_shard: int = 1, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 metric_type: int = faiss.METRIC_L2):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"unknown shard search mode {mode!r}, expected one of {SEARCH_MODES}")
+        self.index_path = index_path
+        self.manifest = manifest
+        self.mode = mode
+        self.descending = metric_type == faiss.METRIC_INNER_PRODUCT
+        self.n_shards = manifest["n_shards"]
+        names = [shard["name"] for shard in manifest["shards"]]
+        if mode == "threads":
+            self.shards = [load_shard(index_path, name, mmap, nprobe, ef_search) for name in names]
+            self._pool = ThreadPoolExecutor(max_workers=self.n_shards, thread_name_prefix="rag-shard")
+        else:
+            # spawn, not fork: the serving process has threads (and torch) running
+            context = multiprocessing.get_context("spawn")
+            self._pools = [
+                ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                    initargs=(index_path, name, mmap, threads_per_shard, nprobe, ef_search))
+                for name in names
+            ]
+
+    @classmethod
+    def load(cls, index_path: str, vectorstore, **kwargs) -> Optional["ShardedSearcher"]:
+        """
+        the searcher for the shards next to index_path, None if there are none or they are stale.
+        only vectorstore.index_to_docstore_id is compared, so the vectorstore may be loaded
+        without its index (load_vectorstore(read_index=False))
+        """
+        manifest = load_manifest(index_path)
+        if manifest is None:
+            return None
+        if ("metric_type" not in manifest
+                or manifest["ntotal"] != len(vectorstore.index_to_docstore_id)
+                or manifest["ids_digest"] != ids_digest(vectorstore.index_to_docstore_id)):
+            logger.warning("shards in %s were cut from another version of the index, not using them "
+                           "(rebuild with embeddings_huggingface.py --shards N)", index_path)
+            return None
+        return cls(index_path, manifest, metric_type=manifest["metric_type"], **kwargs)
+
+    def search(self, vectors: np.ndarray, k: int,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if self.mode == "threads":
+            futures = [self._pool.submit(search_shard, index, ids, vectors, k, allowed)
+                       for index, ids in self.shards]
+        else:
+            futures = [pool.submit(_worker_search, vectors, k, allowed) for pool in self._pools]
+        return merge_topk([future.result() for future in futures], k, self.descending)
+
+    def close(self):
+        if self.mode == "threads":
+            self._pool.shutdown(wait=False)
+            self.shards = []
+        else:
+            for pool in self._pools:
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._pools = []
+
+
+# ===============================
+# THROUGHPUT REPORT
+# ===============================
+def measure_qps(search, queries: np.ndarray, k: int, clients: int) -> float:
+    """single-query searches from `clients` concurrent callers, like the API sees them"""
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        t0 = time.perf_counter()
+        list(pool.map(lambda q: search(q[None, :], k), queries))
+        return len(queries) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="query throughput of the sharded index vs the single index")
+    parser.add_argument("--index-path", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="processes")
+    parser.add_argument("--clients", type=int, default=1, help="concurrent callers")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.index_path)
+    if manifest is None:
+        print(f"⚠️  no shards in {args.index_path}, build them with embeddings_huggingface.py --shards N")
+        return
+    full = faiss.read_index(os.path.join(args.index_path, "index.faiss"))
+    rng = np.random.default_rng(0)
+    vectors = index_vectors(full)
+    picks = rng.choice(len(vectors), args.queries, replace=True)
+    queries = vectors[picks] + 0.1 * rng.normal(size=(len(picks), vectors.shape[1])).astype("float32") * vectors.std()
+    queries = queries.astype("float32")
+
+    # same thread budget for both: one OpenMP thread per search
+    faiss.omp_set_num_threads(1)
+    single_qps = measure_qps(full.search, queries, args.k, args.clients)
+    searcher = ShardedSearcher(args.index_path, manifest, mode=args.mode, metric_type=full.metric_type)
+    try:
+        searcher.search(queries[:1], args.k)  # start the workers
+        _, truth = full.search(queries[:100], args.k)
+        _, found = searcher.search(queries[:100], args.k)
+        agree = float(np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)]))
+        sharded_qps = measure_qps(searcher.search, queries, args.k, args.clients)
+    finally:
+        searcher.close()
+    print(f"{full.ntotal} vectors, {manifest['n_shards']} shards ({args.mode}), {args.clients} clients")
+    print(f"single index : {single_qps:8.1f} queries/s")
+    print(f"sharded      : {sharded_qps:8.1f} queries/s  ({sharded_qps / single_qps:.2f}x, "
+          f"top-{args.k} overlap with single index {agree:.3f})")
+
+
+if __name__ == "__main__":
+    main()
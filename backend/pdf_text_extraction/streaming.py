@@ -0,0 +1,42 @@
+import json
+from threading import Thread
+from typing import Iterator
+
+from transformers import TextIteratorStreamer
+
+
+def stream_generate(llm, prompt: str, max_new_tokens: int = 300, **generate_kwargs) -> Iterator[str]:
+    """
+    runs the text2text pipeline on a background thread and yields decoded text
+    pieces as soon as the model produces them
+    """
+    streamer = TextIteratorStreamer(llm.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def _generate():
+        try:
+            llm(prompt, max_new_tokens=max_new_tokens, streamer=streamer, **generate_kwargs)
+        except Exception as e:  # surface it on the consumer side
+            errors.append(e)
+            streamer.end()
+
+    thread = Thread(target=_generate, daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def sse_event(event: str, data) -> str:
+    """formats one server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# headers that keep proxies (nginx etc.) from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
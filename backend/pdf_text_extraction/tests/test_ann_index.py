@@ -0,0 +1,38 @@
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import INDEX_TYPES, build_ann_index, index_type_of, supports_remove
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+@pytest.mark.parametrize("n", [1, 2, 5, 39, 200, 300])
+def test_small_corpora_build_and_search(index_type, n):
+    rng = np.random.default_rng(n)
+    vectors = rng.random((n, 64), dtype="float32")
+    index = build_ann_index(vectors, index_type, nprobe=256, ef_search=256)
+    assert index.ntotal == n
+    scores, ids = index.search(vectors[:3], min(3, n))
+    assert ((ids >= 0) & (ids < n)).all()
+    if index_type != "ivf_pq":  # PQ codes are approximate even for the vector itself
+        assert (ids[:, 0] == np.arange(min(3, n))).all()
+
+
+def test_ivf_pq_codebook_fits_the_corpus():
+    index = build_ann_index(np.random.default_rng(0).random((200, 768), dtype="float32"), "ivf_pq")
+    assert index_type_of(index) == "ivf_pq"
+    assert faiss.downcast_index(index).pq.nbits == 7  # 2**7 <= 200 < 2**8
+    big = build_ann_index(np.random.default_rng(0).random((300, 64), dtype="float32"), "ivf_pq")
+    assert faiss.downcast_index(big).pq.nbits == 8
+
+
+def test_single_vector_ivf_falls_back_to_flat():
+    index = build_ann_index(np.ones((1, 16), dtype="float32"), "ivf_pq")
+    assert index_type_of(index) == "flat"
+
+
+@pytest.mark.parametrize("index_type, removable", [("flat", True), ("ivf_flat", False), ("ivf_pq", False),
+                                                   ("hnsw", False)])
+def test_supports_remove(index_type, removable):
+    vectors = np.random.default_rng(1).random((300, 64), dtype="float32")
+    assert supports_remove(build_ann_index(vectors, index_type)) is removable
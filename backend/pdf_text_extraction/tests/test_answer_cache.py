@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   PFAS? ") == normalize_query("what is pfas") == "what is pfas"
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.put("What is PFAS?", None, "answer")
+    assert cache.get_exact("what is pfas") == "answer"
+    assert cache.get_exact("what is PFOA") is None
+    assert cache.snapshot()["exact_hits"] == 1
+
+
+def test_semantic_hit_above_threshold_only():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("q1", [1.0, 0.0, 0.0], "a1")
+    assert cache.get_semantic("another wording", [0.95, 0.1, 0.0]) == "a1"
+    assert cache.get_semantic("unrelated", [0.0, 1.0, 0.0]) is None
+    stats = cache.snapshot()
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 1)
+
+
+def test_scopes_never_share_answers():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("q", [1.0, 0.0], "from a", scope="a|")
+    assert cache.get_exact("q", scope="b|") is None
+    assert cache.get_semantic("q", [1.0, 0.0], scope="b|") is None
+    assert cache.get_semantic("q", [1.0, 0.0], scope="a|") == "from a"
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = AnswerCache(max_entries=2)
+    cache.put("a", None, 1)
+    cache.put("b", None, 2)
+    assert cache.get_exact("a") == 1  # "b" is now the least recently used
+    cache.put("c", None, 3)
+    assert cache.get_exact("b") is None
+    assert (cache.get_exact("a"), cache.get_exact("c")) == (1, 3)
+    assert cache.snapshot()["evictions"] == 1
+
+
+def test_ttl_expires_both_tiers(clock):
+    cache = AnswerCache(ttl_seconds=60, similarity_threshold=0.9)
+    cache.put("q", [0.0, 1.0], "answer")
+    clock.now += 30
+    assert cache.get_exact("q") == "answer"
+    clock.now += 31
+    assert cache.get_semantic("similar", [0.0, 1.0]) is None
+    assert cache.get_exact("q") is None
+    assert cache.snapshot()["expirations"] == 1
+
+
+def test_invalidate_by_scope_prefix():
+    cache = AnswerCache()
+    cache.put("q", None, "one", scope="reports|")
+    cache.put("q", None, "two", scope="default|")
+    cache.invalidate(scope_prefix="reports|")
+    assert cache.get_exact("q", scope="reports|") is None
+    assert cache.get_exact("q", scope="default|") == "two"
+    cache.invalidate()
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_zero_vector_is_stored_without_semantic_match():
+    cache = AnswerCache()
+    cache.put("q", np.zeros(3), "answer")
+    assert cache.get_semantic("other", np.zeros(3)) is None
+    assert cache.get_exact("q") == "answer"
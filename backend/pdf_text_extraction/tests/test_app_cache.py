@@ -0,0 +1,101 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("transformers")
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+import app  # noqa: E402  (run from backend/pdf_text_extraction: loads the default index)
+from answer_cache import AnswerCache  # noqa: E402
+from index_manager import IndexManager  # noqa: E402
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=16)
+
+
+class FakeRegistry:
+    def __init__(self, manager):
+        self._manager = manager
+
+    def manager(self, name=None):
+        return self._manager
+
+
+class FakeLLM:
+    """answers with the index version served when generation starts; may swap before finishing"""
+
+    def __init__(self, manager, swap_during_generation=False):
+        self.manager = manager
+        self.swap = swap_during_generation
+
+    def __call__(self, prompts, **kwargs):
+        version = self.manager.current.version
+        if self.swap:
+            self.manager.reload(force=True)  # a rebuilt index lands while this batch generates
+        return [{"generated_text": f"answer from v{version}"} for _ in prompts]
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    def load_fn(index_path):
+        vectorstore = FAISS.from_texts(["lead limits", "copper sampling"], EMBEDDINGS)
+        return vectorstore, None, None
+
+    manager = IndexManager(str(tmp_path), load_fn)
+    manager.load_initial()
+    cache = AnswerCache()
+    manager.on_swap.append(lambda version: cache.invalidate(scope_prefix=f"{app.DEFAULT_COLLECTION}|"))
+
+    monkeypatch.setattr(app, "collections", FakeRegistry(manager))
+    monkeypatch.setattr(app, "answer_cache", cache)
+    monkeypatch.setattr(app, "reranker", None)
+    monkeypatch.setattr(app, "extractive", None)
+    monkeypatch.setattr(app, "embed_queries", EMBEDDINGS.embed_documents)
+    monkeypatch.setattr(app, "make_context", lambda query, docs: " ".join(d.page_content for d in docs))
+    monkeypatch.setattr(app, "generate_kwargs", lambda questions: {})
+    monkeypatch.setattr(app, "count_tokens", len)
+    return manager, cache
+
+
+def ask(question):
+    request = app.QueryRequest(query=question)
+    [(answer, _)] = app.answer_batch([request], [0.0])
+    return request, answer
+
+
+def test_answer_is_cached_for_the_version_it_came_from(served, monkeypatch):
+    manager, cache = served
+    monkeypatch.setattr(app, "llm", FakeLLM(manager))
+    request, answer = ask("what are the lead limits?")
+    assert answer == {"answer": "answer from v1"}
+    assert cache.get_exact(request.query, app.current_scope(request)) == answer
+
+
+def test_swap_between_retrieve_and_put_does_not_cache_a_stale_answer(served, monkeypatch):
+    manager, cache = served
+    monkeypatch.setattr(app, "llm", FakeLLM(manager, swap_during_generation=True))
+    request, answer = ask("what are the lead limits?")
+    assert answer == {"answer": "answer from v1"}
+    assert manager.current.version == 2
+    # retrieved from v1: returned to its caller, but never served for v2
+    assert cache.get_exact(request.query, app.current_scope(request)) is None
+    assert cache.get_semantic(request.query, EMBEDDINGS.embed_query(request.query),
+                              app.current_scope(request)) is None
+
+    monkeypatch.setattr(app, "llm", FakeLLM(manager))
+    _, fresh = ask("what are the lead limits?")
+    assert fresh == {"answer": "answer from v2"}
+
+
+def test_use_cache_false_neither_reads_nor_writes_the_cache(served, monkeypatch):
+    manager, cache = served
+    monkeypatch.setattr(app, "llm", FakeLLM(manager))
+    request, answer = ask("what are the lead limits?")
+    cache.put(request.query, EMBEDDINGS.embed_query(request.query), {"answer": "cached"},
+              app.current_scope(request))
+
+    bypass = app.QueryRequest(query="what are the lead limits?", use_cache=False)
+    [(fresh, _)] = app.answer_batch([bypass], [0.0])
+    assert fresh == {"answer": "answer from v1"}
+    assert cache.snapshot()["exact_hits"] + cache.snapshot()["semantic_hits"] == 0
+    assert cache.get_exact(request.query, app.current_scope(request)) == {"answer": "cached"}
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_batches_concurrent_submits_in_order():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        finally:
+            await batcher.stop()
+
+    assert run(main()) == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+
+def test_arrival_times_are_per_item():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items, arrived):
+        seen.append((list(items), list(arrived)))
+        release.wait(5)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=0, pass_arrival_times=True)
+        await batcher.start()
+        try:
+            first = asyncio.ensure_future(batcher.submit("early"))
+            await asyncio.sleep(0.05)  # "early" is running, the next ones queue behind it
+            before = time.perf_counter()
+            later = [asyncio.ensure_future(batcher.submit(name)) for name in ("late1", "late2")]
+            await asyncio.sleep(0.1)
+            release.set()
+            await asyncio.gather(first, *later)
+            return before
+        finally:
+            await batcher.stop()
+
+    before = run(main())
+    assert [items for items, _ in seen] == [["early"], ["late1", "late2"]]
+    (early_at,), late_at = seen[0][1], seen[1][1]
+    assert early_at < before <= min(late_at)
+
+
+def test_errors_reach_every_caller():
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_wait_ms=20)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    results = run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_submit_before_start():
+    with pytest.raises(RuntimeError):
+        run(MicroBatcher(lambda items: items).submit(1))
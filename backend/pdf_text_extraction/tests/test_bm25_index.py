@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from bm25_index import BM25Index, build_from_vectorstore, reciprocal_rank_fusion, tokenize
+from retrieval import batch_hybrid_search
+
+DOCS = {
+    "a.json::0": "Lead limits under 40-CFR-141 for drinking water systems",
+    "a.json::1": "Copper and lead sampling at the tap, first draw",
+    "b.json::0": "Nitrate monitoring schedule for groundwater wells",
+    "b.json::1": "Radium and Pb-210 in groundwater, annual monitoring",
+    "c.json::0": "Annual report of the water utility board",
+}
+
+
+@pytest.fixture
+def bm25():
+    return BM25Index.build(list(DOCS), DOCS.values())
+
+
+def test_tokenize_keeps_codes_and_drops_stopwords():
+    assert tokenize("What is the 40-CFR-141 limit for Pb-210?") == ["40-cfr-141", "limit", "pb-210"]
+
+
+def test_exact_terms_rank_first(bm25):
+    assert bm25.search("40-cfr-141")[0][0] == "a.json::0"
+    assert bm25.search("pb-210 groundwater")[0][0] == "b.json::1"
+    # idf: the rarer term decides between two "groundwater" chunks
+    assert bm25.search("nitrate groundwater")[0][0] == "b.json::0"
+
+
+def test_search_returns_only_matches_best_first(bm25):
+    hits = bm25.search("lead", k=10)
+    assert {doc_id for doc_id, _ in hits} == {"a.json::0", "a.json::1"}
+    assert hits[0][1] >= hits[1][1] > 0
+    assert bm25.search("uranium") == []
+    assert len(bm25.search("monitoring groundwater annual water", k=2)) == 2
+
+
+def test_allowed_restricts_rows(bm25):
+    allowed = bm25.positions(["b.json::0", "b.json::1", "missing::0"])
+    assert sorted(bm25.positions(["b.json::1", "b.json::0"])) == sorted(allowed)
+    hits = bm25.search("lead groundwater", allowed=allowed)
+    assert {doc_id for doc_id, _ in hits} == {"b.json::0", "b.json::1"}
+
+
+def test_save_load_round_trip(bm25, tmp_path):
+    path = str(tmp_path / "bm25.json")
+    bm25.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(bm25)
+    for query in ("lead", "groundwater monitoring", "40-cfr-141"):
+        assert loaded.search(query) == pytest.approx(bm25.search(query))
+
+
+def test_rrf_rewards_agreement():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["y", "x", "w", "z"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_hybrid_search_finds_exact_term_and_respects_filter():
+    embeddings = DeterministicFakeEmbedding(size=16)  # vectors carry no meaning here
+    vectorstore = FAISS.from_texts(list(DOCS.values()), embeddings, ids=list(DOCS))
+    bm25 = build_from_vectorstore(vectorstore)
+    query = "pb-210"
+    vectors = [embeddings.embed_query(query)]
+
+    found = batch_hybrid_search(vectorstore, bm25, [query], vectors, k=3, candidates=5)[0]
+    assert "Pb-210" in found[0][0].page_content
+
+    positions = {doc_id: pos for pos, doc_id in vectorstore.index_to_docstore_id.items()}
+    allowed = np.sort(np.array([positions["a.json::0"], positions["c.json::0"]]))
+    found = batch_hybrid_search(vectorstore, bm25, [query], vectors, k=3, candidates=5, allowed=allowed)[0]
+    assert {doc.page_content for doc, _ in found} == {DOCS["a.json::0"], DOCS["c.json::0"]}
@@ -0,0 +1,104 @@
+import re
+
+import numpy as np
+import pytest
+
+import chunks_pdfs
+from chunks_pdfs import (build_text_stream, build_word_stream, make_chunks, make_token_chunks,
+                         token_offsets, token_windows, window_bounds)
+
+
+class PieceTokenizer:
+    """stand-in for a fast tokenizer: words cut into `piece`-char tokens, punctuation apart"""
+
+    def __init__(self, piece=4):
+        self.piece = piece
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, **kwargs):
+        offsets = []
+        for m in re.finditer(r"\w+|[^\w\s]", text):
+            offsets += [(i, min(i + self.piece, m.end())) for i in range(m.start(), m.end(), self.piece)]
+        return {"offset_mapping": offsets}
+
+
+def covered(text, offsets, starts, ends):
+    """characters of `text` inside at least one window"""
+    mask = np.zeros(len(text), dtype=bool)
+    for s, e in zip(starts, ends):
+        mask[offsets[s, 0]:offsets[e - 1, 1]] = True
+    return mask
+
+
+def words_text(n_words, length=8):
+    return " ".join("w" * length for _ in range(n_words))
+
+
+# ---------- word windows ----------
+def test_window_bounds_slides_and_drops_tiny_tail():
+    starts, ends = window_bounds(23, 10, 2, 5)
+    assert starts.tolist() == [0, 8, 16]
+    assert ends.tolist() == [10, 18, 23]
+    # the window starting at 16 is 7 long (kept), nothing after it
+    starts, ends = window_bounds(20, 10, 2, 5)
+    assert list(zip(starts, ends)) == [(0, 10), (8, 18)]
+    assert window_bounds(0, 10, 2, 5)[0].size == 0
+
+
+def test_make_chunks_pages_follow_the_words(monkeypatch):
+    monkeypatch.setattr(chunks_pdfs, "MIN_WORDS_TO_KEEP_LAST", 0)
+    pages = [{"page_number": 1, "content": "a b c"}, {"page_number": 2, "content": ""},
+             {"page_number": 3, "content": "d e f g"}]
+    words, page_map = build_word_stream(pages)
+    chunks = make_chunks(words, page_map, 4, 1)
+    assert [c["content"] for c in chunks] == ["a b c d", "d e f g", "g"]
+    assert [c["pages"] for c in chunks] == [[1, 3], [3], [3]]
+    assert chunks[0]["page_range"] == [1, 3]
+
+
+# ---------- token windows ----------
+@pytest.mark.parametrize("overlap", [0, 3, 15])
+@pytest.mark.parametrize("word_len", [4, 9, 30])
+def test_token_windows_cover_the_whole_text(overlap, word_len):
+    text = words_text(300, word_len)
+    offsets = token_offsets(text, PieceTokenizer())
+    starts, ends = token_windows(text, offsets, 20, overlap, 8)
+    assert covered(text, offsets, starts, ends)[[c != " " for c in text]].all()
+    assert ((ends - starts) <= 20).all()
+    assert ends[-1] == len(offsets)
+
+
+def test_token_windows_reach_the_end_when_no_grid_window_does():
+    # 396 words of 3 tokens each: the old grid of starts never produced a window ending at n
+    text = words_text(396, 12)
+    offsets = token_offsets(text, PieceTokenizer())
+    starts, ends = token_windows(text, offsets, 16, 4, 8)
+    assert covered(text, offsets, starts, ends)[[c != " " for c in text]].all()
+
+
+def test_token_windows_start_and_end_on_words():
+    text = words_text(200, 10)
+    offsets = token_offsets(text, PieceTokenizer())
+    starts, ends = token_windows(text, offsets, 20, 5, 8)
+    for s, e in zip(starts, ends):
+        chunk = text[offsets[s, 0]:offsets[e - 1, 1]]
+        assert re.fullmatch(r"w{10}( w{10})*", chunk)
+
+
+def test_token_windows_widen_a_short_tail():
+    text = words_text(21, 4)  # 21 one-token words
+    offsets = token_offsets(text, PieceTokenizer())
+    starts, ends = token_windows(text, offsets, 10, 0, 5)
+    assert list(zip(starts, ends)) == [(0, 10), (10, 20), (11, 21)]
+
+
+def test_make_token_chunks_fit_the_model_and_keep_pages():
+    pages = [{"page_number": p, "content": words_text(40, 6)} for p in (1, 2, 3)]
+    chunks = make_token_chunks(pages, PieceTokenizer(), 32, 4)
+    text, _, _ = build_text_stream(pages)
+    assert all(c["n_tokens"] <= 30 for c in chunks)  # 32 minus [CLS]/[SEP]
+    assert chunks[0]["pages"] == [1] and chunks[-1]["pages"] == [3]
+    assert any(c["pages"] == [1, 2] for c in chunks)
+    assert text.startswith(chunks[0]["content"]) and text.endswith(chunks[-1]["content"])
@@ -0,0 +1,108 @@
+import re
+
+import pytest
+
+from context_builder import build_context, count_tokens, dedupe_sentences
+
+
+class WordTokenizer:
+    """stand-in for the generator's tokenizer: words, punctuation and newline runs are tokens"""
+
+    TOKEN_RE = re.compile(r"\w+|[^\w\s]|\n+")
+    EOS = "</s>"
+
+    def _tokens(self, text, add_special_tokens):
+        tokens = self.TOKEN_RE.findall(text)
+        return tokens + [self.EOS] if add_special_tokens else tokens
+
+    def __call__(self, text, add_special_tokens=True):
+        if isinstance(text, list):
+            return {"input_ids": [self._tokens(t, add_special_tokens) for t in text]}
+        return {"input_ids": self._tokens(text, add_special_tokens)}
+
+    def encode(self, text, add_special_tokens=True, truncation=False, max_length=None):
+        tokens = self._tokens(text, add_special_tokens)
+        return tokens[:max_length] if truncation else tokens
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(t for t in ids if not (skip_special_tokens and t == self.EOS))
+
+
+@pytest.fixture
+def tokenizer():
+    return WordTokenizer()
+
+
+CHUNKS = [
+    "Lead in drinking water is limited to 15 ppb. Utilities sample at the tap. Results go to the state.",
+    "Copper has an action level of 1.3 ppm. Corrosion control lowers both metals.",
+    "The report lists every sampling site. Sites are chosen by pipe material.",
+]
+
+
+@pytest.mark.parametrize("max_tokens", [5, 12, 20, 27, 33, 40, 60, 200])
+def test_budget_is_respected_including_joiners(tokenizer, max_tokens):
+    context = build_context("lead limit in water", CHUNKS, tokenizer, max_tokens)
+    assert context
+    assert count_tokens(context, tokenizer) <= max_tokens
+
+
+def test_sentence_lengths_alone_would_overflow(tokenizer):
+    # both sentences fit by their own counts (4 + 4 = 8), but the "\n\n" between chunks is a token
+    chunks = ["Lead is toxic.", "Copper is regulated."]
+    context = build_context("lead copper", chunks, tokenizer, 8)
+    assert count_tokens(context, tokenizer) <= 8
+    assert context == "Lead is toxic."
+
+
+def test_reading_order_is_restored(tokenizer):
+    # the most relevant sentence comes last in the last chunk, it still ends the context
+    context = build_context("copper action level", CHUNKS[:2], tokenizer, 25)
+    assert context.index("Lead in drinking water") < context.index("Copper has an action level")
+    assert "\n\n" in context  # chunks stay apart
+
+
+def test_best_sentences_win_under_a_tight_budget(tokenizer):
+    context = build_context("copper action level", CHUNKS, tokenizer, 12)
+    assert context == "Copper has an action level of 1.3 ppm."
+
+
+def test_overlapping_windows_are_deduped():
+    first = "Utilities sample at the tap. Results go to the state. Sites are chosen by pipe"
+    second = "go to the state. Sites are chosen by pipe material. Old lead lines come first."
+    sentences = [s for _, _, s in dedupe_sentences([first, second])]
+    assert sentences == [
+        "Utilities sample at the tap.",
+        "Results go to the state.",
+        "Sites are chosen by pipe",
+        "Sites are chosen by pipe material.",
+        "Old lead lines come first.",
+    ]
+
+
+def test_cut_off_sentence_at_chunk_end_is_dropped():
+    first = "Copper has an action level of 1.3 ppm. Corrosion control lowers both metals."
+    second = "Lead is limited to 15 ppb. Copper has an action level"
+    assert [s for _, _, s in dedupe_sentences([first, second])] == [
+        "Copper has an action level of 1.3 ppm.",
+        "Corrosion control lowers both metals.",
+        "Lead is limited to 15 ppb.",
+    ]
+
+
+def test_short_sentences_inside_longer_ones_are_kept():
+    chunks = ["Since 1991 lead is regulated. See table 10.", "Values are in mg/L. Lead is regulated. See table 1."]
+    assert [s for _, _, s in dedupe_sentences(chunks)] == [
+        "Since 1991 lead is regulated.", "See table 10.", "Values are in mg/L.", "Lead is regulated.", "See table 1."]
+
+
+def test_truncation_fallback_when_no_sentence_fits(tokenizer):
+    long_sentence = " ".join(["word"] * 50) + "."
+    context = build_context("word", [long_sentence], tokenizer, 10)
+    assert context == " ".join(["word"] * 10)
+    assert count_tokens(context, tokenizer) <= 10
+
+
+def test_empty_inputs(tokenizer):
+    assert build_context("q", [], tokenizer, 50) == ""
+    assert build_context("q", CHUNKS, tokenizer, 0) == ""
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_store import CachedEmbeddings, EmbeddingStore
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class Counting:
+    """compute_fn that records which texts it was asked for"""
+
+    def __init__(self, dim=8):
+        self.fake = DeterministicFakeEmbedding(size=dim)
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return self.fake.embed_documents(texts)
+
+
+def test_round_trip_through_disk(tmp_path):
+    compute = Counting()
+    store = EmbeddingStore(MODEL, root=str(tmp_path))
+    first = store.get_many(["a", "b", "a"], compute)
+    assert compute.calls == [["a", "b"]]
+    assert first.shape == (3, 8) and first.dtype == np.float32
+    assert (first[0] == first[2]).all()
+
+    reopened = EmbeddingStore(MODEL, root=str(tmp_path))
+    assert len(reopened) == 2
+    again = reopened.get_many(["b", "a", "c"], compute)
+    assert compute.calls == [["a", "b"], ["c"]]
+    np.testing.assert_array_equal(again[:2], first[[1, 0]])
+    np.testing.assert_array_equal(again[2], np.asarray(compute.fake.embed_documents(["c"])[0], dtype="float32"))
+    assert (reopened.hits, reopened.misses) == (2, 1)
+
+
+def test_models_are_kept_apart(tmp_path):
+    compute = Counting()
+    EmbeddingStore(MODEL, root=str(tmp_path)).get_many(["a"], compute)
+    EmbeddingStore("other/model", root=str(tmp_path)).get_many(["a"], compute)
+    assert compute.calls == [["a"], ["a"]]
+
+
+def test_stores_sharing_a_folder_see_each_others_rows(tmp_path):
+    compute = Counting()
+    one = EmbeddingStore(MODEL, root=str(tmp_path))
+    two = EmbeddingStore(MODEL, root=str(tmp_path))
+    one.get_many(["a", "b"], compute)
+    two.get_many(["b", "c"], compute)  # "b" is picked up from disk, not recomputed
+    assert compute.calls == [["a", "b"], ["c"]]
+    one.get_many(["c"], compute)
+    assert compute.calls == [["a", "b"], ["c"]]
+
+    reopened = EmbeddingStore(MODEL, root=str(tmp_path))
+    assert len(reopened) == 3
+    with open(reopened.keys_path) as f:
+        assert len(f.read().split()) == 3  # nothing stored twice
+
+
+def test_interrupted_append_is_cut_back(tmp_path):
+    compute = Counting()
+    store = EmbeddingStore(MODEL, root=str(tmp_path))
+    expected = store.get_many(["a", "b"], compute)
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"\0" * 12)  # half a row, its key never written
+
+    reopened = EmbeddingStore(MODEL, root=str(tmp_path))
+    assert len(reopened) == 2
+    np.testing.assert_array_equal(reopened.get_many(["a", "b"], compute), expected)
+    reopened.get_many(["c"], compute)
+    np.testing.assert_array_equal(EmbeddingStore(MODEL, root=str(tmp_path)).get_many(["a", "b"], compute), expected)
+
+
+def test_dim_mismatch_is_an_error(tmp_path):
+    EmbeddingStore(MODEL, root=str(tmp_path)).get_many(["a"], Counting(dim=8))
+    with pytest.raises(ValueError):
+        EmbeddingStore(MODEL, root=str(tmp_path)).get_many(["b"], Counting(dim=4))
+
+
+def test_cached_embeddings_skip_queries(tmp_path):
+    cached = CachedEmbeddings(DeterministicFakeEmbedding(size=8), model_name=MODEL, root=str(tmp_path))
+    cached.embed_documents(["a", "b"])
+    cached.embed_query("a question")
+    assert len(cached.store) == 2
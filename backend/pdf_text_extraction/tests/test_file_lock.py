@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import file_lock
+from file_lock import file_lock as lock
+
+
+def hold(path, log, seconds):
+    with lock(path):
+        with open(log, "a") as f:
+            f.write(f"{os.getpid()} in\n")
+        time.sleep(seconds)
+        with open(log, "a") as f:
+            f.write(f"{os.getpid()} out\n")
+
+
+@pytest.mark.skipif(not file_lock.LOCKING, reason="no file lock on this platform")
+def test_processes_exclude_each_other(tmp_path):
+    path, log = str(tmp_path / ".lock"), str(tmp_path / "log")
+    context = multiprocessing.get_context("spawn")
+    procs = [context.Process(target=hold, args=(path, log, 0.2)) for _ in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    with open(log) as f:
+        lines = f.read().split()
+    events = lines[1::2]
+    assert events == ["in", "out"] * 3  # never two holders at once
+
+
+class FakeMsvcrt:
+    LK_LOCK, LK_UNLCK = 1, 0
+
+    def __init__(self, busy=0):
+        self.busy = busy  # LK_LOCK attempts that time out before the lock is free
+        self.calls = []
+
+    def locking(self, fd, mode, nbytes):
+        self.calls.append((mode, nbytes))
+        if mode == self.LK_LOCK and self.busy:
+            self.busy -= 1
+            raise OSError("deadlock avoided")
+
+
+def test_msvcrt_fallback_waits_for_the_lock(tmp_path, monkeypatch):
+    fake = FakeMsvcrt(busy=2)
+    monkeypatch.setattr(file_lock, "fcntl", None)
+    monkeypatch.setattr(file_lock, "msvcrt", fake)
+    monkeypatch.setattr(file_lock.time, "sleep", lambda s: None)
+    with lock(str(tmp_path / ".lock")):
+        assert fake.calls == [(fake.LK_LOCK, 1)] * 3
+    assert fake.calls[-1] == (fake.LK_UNLCK, 1)
+
+
+def test_require_file_lock(monkeypatch):
+    file_lock.require_file_lock(4)
+    monkeypatch.setattr(file_lock, "LOCKING", False)
+    file_lock.require_file_lock(1)
+    with pytest.raises(RuntimeError):
+        file_lock.require_file_lock(2, "API workers")
@@ -0,0 +1,62 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from generation_policy import (PerRowTokenBudget, StopOnStrings, apply_stop_sequences,  # noqa: E402
+                               classify_question, generation_kwargs, token_budget)
+
+
+@pytest.mark.parametrize("question, kind", [
+    ("Is lead regulated in tap water?", "yes_no"),
+    ("When was the rule published?", "factoid"),
+    ("How many samples are required?", "factoid"),
+    ("What is PFAS?", "definition"),
+    ("Why does copper corrode pipes?", "explanation"),
+    ("List the sampling steps", "explanation"),
+    ("Lead limits", "other"),
+])
+def test_classify_question(question, kind):
+    assert classify_question(question) == kind
+
+
+def test_token_budget_is_capped():
+    assert token_budget("Why is lead toxic?") == 200
+    assert token_budget("Why is lead toxic?", cap=50) == 50
+
+
+def test_apply_stop_sequences():
+    assert apply_stop_sequences("15 ppb.\nQuestion: and copper?") == "15 ppb."
+    assert apply_stop_sequences(" no stop here ") == "no stop here"
+
+
+def step(criteria, prompt_len, new_tokens, rows):
+    """what generate() passes after `new_tokens` decoding steps"""
+    return criteria(torch.zeros((rows, prompt_len + new_tokens), dtype=torch.long), None)
+
+
+def test_per_row_token_budget():
+    criteria = PerRowTokenBudget([1, 3, 2])
+    assert step(criteria, 5, 1, 3).tolist() == [True, False, False]
+    assert step(criteria, 5, 2, 3).tolist() == [True, False, True]
+    assert step(criteria, 5, 3, 3).tolist() == [True, True, True]
+
+
+class CharTokenizer:
+    """one character per token id"""
+
+    def batch_decode(self, ids, skip_special_tokens=True):
+        return ["".join(chr(int(i)) for i in row) for row in ids]
+
+
+def test_stop_on_strings():
+    rows = ["an answer\nQuestion:", "still going on"]
+    ids = torch.tensor([[ord(c) for c in row.ljust(20)] for row in rows])
+    assert StopOnStrings(CharTokenizer(), lookback=12)(ids, None).tolist() == [True, False]
+
+
+def test_generation_kwargs_uses_the_largest_budget():
+    kwargs = generation_kwargs(["Is it safe?", "Explain the rule"], cap=300)
+    assert kwargs["max_new_tokens"] == 200
+    assert kwargs["do_sample"] is False and kwargs["num_beams"] == 1
+    assert len(kwargs["stopping_criteria"]) == 1  # no tokenizer, no stop strings
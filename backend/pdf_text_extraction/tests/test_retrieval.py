@@ -0,0 +1,136 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import retrieval
+from ann_index import build_ann_index
+from corpus_store import SqliteDocstore
+from retrieval import (MetadataIndex, _filtered_search, load_vectorstore, save_vectorstore, source_key,
+                       staged_docstore_path)
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def build(embeddings, index_path, texts):
+    """a fresh index the way embeddings_huggingface builds one: docstore staged, then swapped in"""
+    os.makedirs(index_path, exist_ok=True)
+    vectorstore = FAISS.from_texts(texts, embeddings, metadatas=[{"doc_id": t} for t in texts])
+    vectorstore.docstore = SqliteDocstore.from_documents(staged_docstore_path(index_path),
+                                                         vectorstore.docstore._dict)
+    save_vectorstore(vectorstore, index_path)
+    vectorstore.docstore.close()
+
+
+def texts_of(vectorstore):
+    return sorted(vectorstore.docstore.search(i).page_content
+                  for i in vectorstore.index_to_docstore_id.values())
+
+
+def test_save_then_load(tmp_path, embeddings):
+    index_path = str(tmp_path / "index")
+    build(embeddings, index_path, ["alpha", "beta"])
+    assert os.path.exists(os.path.join(index_path, retrieval.STAMP_FILE))
+    assert not os.path.exists(staged_docstore_path(index_path))
+
+    vectorstore = load_vectorstore(index_path, embeddings)
+    assert vectorstore.index.ntotal == 2
+    assert texts_of(vectorstore) == ["alpha", "beta"]
+
+
+def test_load_refuses_mixed_versions(tmp_path, embeddings, monkeypatch):
+    index_path, other = str(tmp_path / "index"), str(tmp_path / "other")
+    build(embeddings, index_path, ["alpha", "beta"])
+    build(embeddings, other, ["gamma", "delta", "epsilon"])
+    # a save interrupted between its renames: new index.faiss, old pickle and stamp
+    os.replace(os.path.join(other, "index.faiss"), os.path.join(index_path, "index.faiss"))
+
+    monkeypatch.setattr(retrieval.time, "sleep", lambda s: None)
+    with pytest.raises(RuntimeError):
+        load_vectorstore(index_path, embeddings)
+
+
+def test_load_without_stamp(tmp_path, embeddings):
+    index_path = str(tmp_path / "index")
+    build(embeddings, index_path, ["alpha"])
+    os.remove(os.path.join(index_path, retrieval.STAMP_FILE))  # saved by an older version
+    assert texts_of(load_vectorstore(index_path, embeddings)) == ["alpha"]
+
+
+def test_loaded_docstore_survives_a_new_save(tmp_path, embeddings):
+    index_path = str(tmp_path / "index")
+    build(embeddings, index_path, ["alpha", "beta"])
+    served = load_vectorstore(index_path, embeddings)
+
+    build(embeddings, index_path, ["gamma"])
+
+    # other threads of the serving process open the docstore only now
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(texts_of(served)))
+    thread.start()
+    thread.join()
+    assert seen == [["alpha", "beta"]]
+    assert texts_of(load_vectorstore(index_path, embeddings)) == ["gamma"]
+
+
+# ---------- metadata pre-filtering ----------
+def test_source_key():
+    assert source_key("/data/Report.PDF") == source_key("report.json") == source_key("report") == "report"
+
+
+@pytest.fixture
+def metadata_index(embeddings):
+    metadatas = [
+        {"source": "a.pdf", "page_range": [1, 2]},
+        {"source": "a.pdf", "page_range": [3, 5]},
+        {"source": "b.pdf", "page_range": [1, 1]},
+        {"source": "b.pdf"},  # no page info
+        {"source": "c.pdf", "page_range": [7, 9]},
+    ]
+    vectorstore = FAISS.from_texts([f"t{i}" for i in range(5)], embeddings, metadatas=metadatas)
+    return MetadataIndex.from_vectorstore(vectorstore)
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({}, [0, 1, 2, 3, 4]),
+    ({"sources": ["A.pdf"]}, [0, 1]),
+    ({"sources": ["b", "c.json", "unknown.pdf"]}, [2, 3, 4]),
+    ({"page_from": 3}, [1, 4]),
+    ({"page_to": 2}, [0, 2]),
+    ({"page_from": 2, "page_to": 3}, [0, 1]),
+    ({"sources": ["b.pdf"], "page_from": 1}, [2]),
+    ({"sources": ["unknown"]}, []),
+])
+def test_metadata_select(metadata_index, kwargs, expected):
+    assert metadata_index.select(**kwargs).tolist() == expected
+
+
+def brute_force(vectors, base, allowed, k):
+    dists = ((vectors[:, None, :] - base[allowed][None, :, :]) ** 2).sum(-1)
+    return allowed[np.argsort(dists, axis=1)[:, :k]]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+@pytest.mark.parametrize("exact_max", [4096, 0])  # exact path / IDSelector path
+def test_filtered_search_stays_inside_allowed(index_type, exact_max, monkeypatch):
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(400, 8)).astype("float32")
+    queries = rng.normal(size=(5, 8)).astype("float32")
+    index = build_ann_index(base, index_type, nlist=4, nprobe=4, ef_search=200)
+    allowed = np.sort(rng.choice(400, 60, replace=False)).astype(np.int64)
+    monkeypatch.setattr(retrieval, "EXACT_FILTER_MAX", exact_max)
+
+    scores, found = _filtered_search(index, queries, 5, allowed)
+    assert np.isin(found, allowed).all()
+    assert (np.diff(scores, axis=1) >= 0).all()
+    expected = brute_force(queries, base, allowed, 5)
+    if index_type == "hnsw" and exact_max == 0:
+        assert np.mean([len(set(f) & set(e)) / 5 for f, e in zip(found, expected)]) >= 0.8
+    else:
+        assert (found == expected).all()
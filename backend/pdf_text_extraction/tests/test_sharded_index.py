@@ -0,0 +1,88 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval import MetadataIndex, batch_vector_search_ids, load_vectorstore, save_vectorstore
+from sharded_index import ShardedSearcher, ShardSetIndex, write_shards
+
+
+@pytest.fixture
+def saved_index(tmp_path):
+    """40 chunks of 8 documents, saved and cut into 3 shards"""
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = [f"chunk {i} of doc {i % 8}" for i in range(40)]
+    metadatas = [{"source": f"doc{i % 8}.pdf", "page_range": [i, i]} for i in range(40)]
+    ids = [f"doc{i % 8}.json::{i}" for i in range(40)]
+    vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+    index_path = str(tmp_path / "index")
+    save_vectorstore(vectorstore, index_path)
+    write_shards(vectorstore, index_path, n_shards=3)
+    return index_path, embeddings, vectorstore
+
+
+def test_sharded_search_matches_full_index(saved_index):
+    index_path, embeddings, full = saved_index
+    served = load_vectorstore(index_path, embeddings, read_index=False)
+    assert served.index is None
+    omp_threads = faiss.omp_get_max_threads()
+    searcher = ShardedSearcher.load(index_path, served, threads_per_shard=omp_threads + 2)
+    assert searcher is not None
+    assert faiss.omp_get_max_threads() == omp_threads  # the server's setting, untouched
+    served.index = ShardSetIndex(searcher.manifest)
+    try:
+        queries = [embeddings.embed_query(f"chunk {i}") for i in (0, 13, 27)]
+        expected = batch_vector_search_ids(full, queries, k=5)
+        found = batch_vector_search_ids(served, queries, k=5, searcher=searcher)
+        assert [[i for i, _ in hits] for hits in found] == [[i for i, _ in hits] for hits in expected]
+
+        # filters work off the stand-in's ntotal and the docstore
+        allowed = MetadataIndex.from_vectorstore(served).select(sources=["doc3"])
+        assert len(allowed) == 5
+        for hits in batch_vector_search_ids(served, queries, k=3, allowed=allowed, searcher=searcher):
+            assert hits and all(doc_id.startswith("doc3.json::") for doc_id, _ in hits)
+    finally:
+        searcher.close()
+
+
+def test_stale_shards_are_not_used(saved_index):
+    index_path, embeddings, full = saved_index
+    full.add_texts(["one more chunk"], metadatas=[{"source": "doc9.pdf"}], ids=["doc9.json::0"])
+    save_vectorstore(full, index_path)
+    assert ShardedSearcher.load(index_path, load_vectorstore(index_path, embeddings, read_index=False)) is None
+
+
+def test_stand_in_has_no_vectors(saved_index):
+    index_path, _, _ = saved_index
+    searcher = ShardedSearcher.load(index_path, load_vectorstore(index_path, DeterministicFakeEmbedding(size=16)))
+    try:
+        stand_in = ShardSetIndex(searcher.manifest)
+        assert (stand_in.ntotal, stand_in.d) == (40, 16)
+        with pytest.raises(RuntimeError):
+            stand_in.search(np.zeros((1, 16), dtype="float32"), 1)
+    finally:
+        searcher.close()
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq", "hnsw"])
+def test_small_shards_are_flat(tmp_path, index_type):
+    """--shards 4 --index-type ivf_pq on a few hundred chunks"""
+    embeddings = DeterministicFakeEmbedding(size=64)
+    texts = [f"chunk {i}" for i in range(300)]
+    vectorstore = FAISS.from_texts(texts, embeddings, ids=[f"doc{i % 30}.json::{i}" for i in range(300)])
+    index_path = str(tmp_path / "index")
+    save_vectorstore(vectorstore, index_path)
+
+    manifest = write_shards(vectorstore, index_path, n_shards=4, index_type=index_type)
+    assert {shard["index_type"] for shard in manifest["shards"]} == {"flat"}
+
+    # above the threshold shards are trained, even small ones
+    manifest = write_shards(vectorstore, index_path, n_shards=4, index_type=index_type, min_ann_vectors=10)
+    assert {shard["index_type"] for shard in manifest["shards"]} == {index_type}
+    searcher = ShardedSearcher.load(index_path, vectorstore)
+    try:
+        scores, positions = searcher.search(np.asarray(embeddings.embed_documents(texts[:4])), 5)
+        assert ((positions >= 0) & (positions < 300)).all()
+    finally:
+        searcher.close()
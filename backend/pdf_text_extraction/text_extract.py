@@ -36,6 +36,6 @@ for filename in os.listdir(pdf_folder):
 
 # Save as JSON
 with open(output_file, "w", encoding="utf-8") as f:
-    json.dump(extracted_data, f, indent=4, ensure_ascii=False)
+    json.dump(extracted_data, f, ensure_ascii=False)
 
 print(f"\n✅ Extraction completed! Saved to {output_file}")
@@ -2,8 +2,13 @@ from pypdf import PdfReader
 from pdf2image import convert_from_path
 import pytesseract
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import os
 import json
+import tempfile
+
+from corpus_store import CorpusStore
 
 # Update this with your Poppler bin path
 POPPLER_PATH = r"C:\poppler\poppler-25.07.0\Library\bin"
@@ -17,11 +22,92 @@ image_folder = "images"   # optional: contains standalone images (jpg/png)
 
 # Output folder
 output_folder = "extracted_ocr_jsons"
-os.makedirs(output_folder, exist_ok=True)
 
-def extract_from_pdf(pdf_path, filename):
+# OCR runs in a process pool, one page per task
+OCR_WORKERS = os.cpu_count() or 1
+# DPI used when rasterizing scanned pages (pdf2image default is 200)
+OCR_DPI = 200
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_path_for(output_file):
+    # sidecar next to the JSON (not *.json, so the chunkers don't pick it up)
+    return os.path.splitext(output_file)[0] + ".sha256"
+
+
+def is_up_to_date(output_file, digest):
+    """True if output_file was written from an input with the same content hash"""
+    hash_file = hash_path_for(output_file)
+    if not (os.path.exists(output_file) and os.path.exists(hash_file)):
+        return False
+    with open(hash_file, "r", encoding="utf-8") as f:
+        return f.read().strip() == digest
+
+
+def save_extracted(output_file, extracted_data, digest, store=None):
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(extracted_data, f, ensure_ascii=False)
+    if store is not None and extracted_data:
+        # same pages, readable one at a time by doc_id (the source file name)
+        store.put_pages(extracted_data[0]["doc_id"], extracted_data)
+    # written last, so an interrupted run never looks finished
+    with open(hash_path_for(output_file), "w", encoding="utf-8") as f:
+        f.write(digest)
+
+
+def page_runs(page_numbers):
+    """[1,2,3,7,8] -> [(1,3), (7,8)]"""
+    runs = []
+    for p in sorted(page_numbers):
+        if runs and p == runs[-1][1] + 1:
+            runs[-1][1] = p
+        else:
+            runs.append([p, p])
+    return [tuple(r) for r in runs]
+
+
+def ocr_image_file(image_path):
+    """worker task: OCR one rendered page image"""
+    with Image.open(image_path) as img:
+        return pytesseract.image_to_string(img)
+
+
+def rasterize_pages(pdf_path, page_numbers, out_dir):
+    """
+    renders the given pages to PNG files in out_dir
+    each contiguous run of pages is one poppler call (instead of one call per page,
+    which re-parses the whole PDF every time)
+    returns {page_number: image_path}
+    """
+    rendered = {}
+    for first, last in page_runs(page_numbers):
+        paths = convert_from_path(
+            pdf_path,
+            dpi=OCR_DPI,
+            first_page=first,
+            last_page=last,
+            poppler_path=POPPLER_PATH,
+            output_folder=out_dir,
+            fmt="png",
+            paths_only=True,
+            thread_count=OCR_WORKERS,
+        )
+        for offset, path in enumerate(sorted(paths)):
+            rendered[first + offset] = path
+    return rendered
+
+
+def extract_from_pdf(pdf_path, filename, pool):
     """Extract text from PDF (both text-based and scanned)"""
-    extracted_data = []
+    pages = {}
+    needs_ocr = []
     reader = PdfReader(pdf_path)
     num_pages = len(reader.pages)
 
@@ -30,31 +116,31 @@ def extract_from_pdf(pdf_path, filename):
         text = page.extract_text()
 
         if text and text.strip():  # if text layer exists
-            extracted_data.append({
-                "doc_id": filename,
-                "page_number": page_num + 1,
-                "content": text.strip()
-            })
+            pages[page_num + 1] = text.strip()
         else:
-            # OCR fallback
-            print(f"⚡ OCR needed for {filename} (Page {page_num+1})")
-            images = convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1,poppler_path=POPPLER_PATH)
-            for img in images:
-                ocr_text = pytesseract.image_to_string(img)
+            needs_ocr.append(page_num + 1)
+
+    if needs_ocr:
+        # OCR fallback: rasterize all text-less pages up front, then OCR them across cores
+        print(f"⚡ OCR needed for {filename} ({len(needs_ocr)} pages)")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rendered = rasterize_pages(pdf_path, needs_ocr, tmp_dir)
+            page_numbers = sorted(rendered)
+            texts = pool.map(ocr_image_file, [rendered[p] for p in page_numbers])
+            for page_number, ocr_text in zip(page_numbers, texts):
                 if ocr_text.strip():
-                    extracted_data.append({
-                        "doc_id": filename,
-                        "page_number": page_num + 1,
-                        "content": ocr_text.strip()
-                    })
+                    pages[page_number] = ocr_text.strip()
+
+    return [
+        {"doc_id": filename, "page_number": page_number, "content": pages[page_number]}
+        for page_number in sorted(pages)
+    ]
 
-    return extracted_data
 
 def extract_from_image(image_path, filename):
     """Extract text from standalone images"""
     extracted_data = []
-    img = Image.open(image_path)
-    ocr_text = pytesseract.image_to_string(img)
+    ocr_text = ocr_image_file(image_path)
 
     if ocr_text.strip():
         extracted_data.append({
@@ -65,34 +151,53 @@ def extract_from_image(image_path, filename):
 
     return extracted_data
 
-# Process PDFs
-for filename in os.listdir(pdf_folder):
-    if filename.endswith(".pdf"):
-        pdf_path = os.path.join(pdf_folder, filename)
-        print(f"Processing PDF: {filename}")
-        extracted_data = extract_from_pdf(pdf_path, filename)
-
-        # Save per PDF
-        output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.json")
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(extracted_data, f, indent=4, ensure_ascii=False)
-
-        print(f"✅ Saved to {output_file}")
-
-
-    
-# Process Images
-if os.path.exists(image_folder):
-    for filename in os.listdir(image_folder):
-        if filename.lower().endswith((".png", ".jpg", ".jpeg")):
-            img_path = os.path.join(image_folder, filename)
-            print(f"Processing Image: {filename}")
-            extracted_data = extract_from_image(img_path, filename)
-
-            output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.json")
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(extracted_data, f, indent=4, ensure_ascii=False)
-
-            print(f"✅ Saved to {output_file}")
 
-print("\n🎉 All PDFs & Images processed with OCR where needed!")
+def main():
+    os.makedirs(output_folder, exist_ok=True)
+    skipped = 0
+    store = CorpusStore()
+
+    with ProcessPoolExecutor(max_workers=OCR_WORKERS) as pool:
+        # Process PDFs
+        for filename in sorted(os.listdir(pdf_folder)):
+            if filename.endswith(".pdf"):
+                pdf_path = os.path.join(pdf_folder, filename)
+                output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.json")
+                digest = file_sha256(pdf_path)
+                if is_up_to_date(output_file, digest):
+                    skipped += 1
+                    continue
+
+                print(f"Processing PDF: {filename}")
+                extracted_data = extract_from_pdf(pdf_path, filename, pool)
+
+                # Save per PDF
+                save_extracted(output_file, extracted_data, digest, store)
+                print(f"✅ Saved to {output_file}")
+
+        # Process Images (one OCR task each, all in parallel)
+        if os.path.exists(image_folder):
+            jobs = []
+            for filename in sorted(os.listdir(image_folder)):
+                if filename.lower().endswith((".png", ".jpg", ".jpeg")):
+                    img_path = os.path.join(image_folder, filename)
+                    output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.json")
+                    digest = file_sha256(img_path)
+                    if is_up_to_date(output_file, digest):
+                        skipped += 1
+                        continue
+                    print(f"Processing Image: {filename}")
+                    jobs.append((filename, output_file, digest,
+                                 pool.submit(extract_from_image, img_path, filename)))
+
+            for filename, output_file, digest, future in jobs:
+                save_extracted(output_file, future.result(), digest, store)
+                print(f"✅ Saved to {output_file}")
+
+    if skipped:
+        print(f"⏭️  Skipped {skipped} unchanged file(s)")
+    print("\n🎉 All PDFs & Images processed with OCR where needed!")
+
+
+if __name__ == "__main__":
+    main()